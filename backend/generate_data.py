@@ -0,0 +1,408 @@
+"""Deterministic synthetic dataset for performance work.
+
+    python generate_data.py --users 1000000 --transactions 100000000 --drop
+
+The same --seed and sizes always produce the same documents, whatever the
+number of workers: users are split into fixed-size shards and every shard
+draws from its own generator seeded with (seed, shard). Collections are
+bulk-loaded without secondary indexes; the server's indexes are built once
+loading has finished.
+
+Balances come from one opening ledger posting per account dated at account
+creation, so completed and rejected transactions are history only. Pending and
+approved wires also move their amount from available to transit, with the same
+legs the transfer endpoint posts, so they can be settled or rejected later.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+
+import server
+from server import (
+    ACCOUNT_NUMBER_BASE,
+    audit_partition_name,
+    customer_search_keys,
+    hash_otp,
+    ledger_entry,
+    luhn_check_digit,
+    opening_balance_entries,
+    pwd_context,
+)
+
+# Account numbers are ACCOUNT_NUMBER_BASE + user_index * MAX_ACCOUNTS_PER_USER + n,
+# so they are unique without coordination between shards
+MAX_ACCOUNTS_PER_USER = 8
+BUSINESS_SHARE = 0.1
+HEAVY_ACCOUNT_WEIGHT = 50
+MAX_ACCOUNT_WEIGHT = 10000
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Ahmed", "Fatima", "Wei", "Mei", "Carlos", "Sofia", "Hans", "Ingrid", "Pierre", "Amelie",
+    "Kenji", "Yuki", "Olga", "Ivan", "Raj", "Priya", "Kwame", "Amara", "Lucas", "Chloe"
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee",
+    "Khan", "Chen", "Wang", "Muller", "Schmidt", "Dubois", "Rossi", "Tanaka", "Sato", "Ivanova",
+    "Patel", "Sharma", "Mensah", "Okafor", "Silva", "Santos", "Novak", "Kowalski", "Nielsen", "Berg"
+]
+COUNTRIES = [
+    ("United States", 30), ("United Kingdom", 12), ("Germany", 10), ("France", 8), ("Switzerland", 6),
+    ("Canada", 6), ("United Arab Emirates", 5), ("Singapore", 5), ("Japan", 4), ("Australia", 4),
+    ("Nigeria", 3), ("Brazil", 3), ("India", 4)
+]
+CURRENCY_WEIGHTS = {"USD": 45, "EUR": 25, "GBP": 12, "CHF": 5}
+TRANSACTION_TYPES = [("transfer_out", 35), ("transfer_in", 35), ("deposit", 15), ("wire_out", 15)]
+WIRE_STATUSES = [("completed", 93), ("pending", 3), ("approved", 2), ("rejected", 2)]
+AUDIT_ACTIONS = [
+    ("login_successful", 55), ("login_otp_requested", 20), ("internal_transfer", 12),
+    ("external_transfer_initiated", 8), ("beneficiary_created", 5)
+]
+TICKET_CATEGORIES = ["general", "account", "transfer", "card", "technical"]
+TICKET_STATUSES = [("open", 20), ("in_progress", 15), ("resolved", 45), ("closed", 20)]
+OTP_PURPOSES = ["login", "transfer", "beneficiary"]
+
+
+def weighted(rng: random.Random, choices):
+    return rng.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+
+def rng_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def ledger_posting(rng: random.Random, entries: list, reference: str, description: str, created_at: str) -> list:
+    """Ledger documents laid out like server.build_ledger_posting, with ids drawn from rng"""
+    posting_id = rng_uuid(rng)
+    return [
+        {
+            "id": rng_uuid(rng),
+            "posting_id": posting_id,
+            "leg": leg,
+            "reference": reference,
+            "description": description,
+            "created_at": created_at,
+            **entry
+        }
+        for leg, entry in enumerate(entries)
+    ]
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def share(total: int, shard: int, shards: int) -> int:
+    """Split total across shards; the first total % shards shards take one extra"""
+    return total // shards + (1 if shard < total % shards else 0)
+
+
+class BatchWriter:
+    """Buffers documents per collection and writes them with unordered insert_many"""
+
+    def __init__(self, db, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, collection: str, document: dict):
+        buffer = self.buffers.setdefault(collection, [])
+        buffer.append(document)
+        if len(buffer) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection: str = None):
+        for name in [collection] if collection else list(self.buffers):
+            buffer = self.buffers.get(name)
+            if not buffer:
+                continue
+            try:
+                self.db[name].insert_many(buffer, ordered=False)
+                inserted = len(buffer)
+            except BulkWriteError as e:
+                # Rerunning without --drop: documents from the earlier run are kept
+                inserted = e.details["nInserted"]
+            self.counts[name] = self.counts.get(name, 0) + inserted
+            self.buffers[name] = []
+
+
+def generate_users(rng, writer, opts, first_user, last_user, password_hash):
+    users, accounts = [], []
+    for index in range(first_user, last_user):
+        business = rng.random() < BUSINESS_SHARE
+        created_ts = rng.uniform(opts["start_ts"], opts["end_ts"] - 86400)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        user = {
+            "id": rng_uuid(rng),
+            "email": f"user{index:08d}@example.com",
+            "first_name": first_name,
+            "last_name": last_name,
+            "phone": f"+1{rng.randrange(2000000000, 9999999999)}",
+            "address": f"{rng.randrange(1, 9999)} Main Street",
+            "country": weighted(rng, COUNTRIES),
+            "user_type": "business" if business else "personal",
+            "password_hash": password_hash,
+            "role": "client",
+            "status": "active" if rng.random() < 0.97 else "suspended",
+            "kyc_status": "verified" if rng.random() < 0.85 else weighted(rng, [("pending", 3), ("rejected", 1)]),
+            "created_at": iso(created_ts),
+            "updated_at": iso(created_ts)
+        }
+        user.update(customer_search_keys(user))
+        writer.add("users", user)
+        users.append((user, created_ts))
+
+        account_count = rng.randint(2, 6) if business else weighted(rng, [(1, 50), (2, 35), (3, 15)])
+        for n in range(account_count):
+            account_ts = rng.uniform(created_ts, opts["end_ts"] - 3600)
+            currency = "USD" if n == 0 else rng.choices(list(CURRENCY_WEIGHTS), weights=list(CURRENCY_WEIGHTS.values()))[0]
+            number = str(ACCOUNT_NUMBER_BASE + index * MAX_ACCOUNTS_PER_USER + n)
+            # A few business main accounts carry most of the volume
+            heavy = business and n == 0
+            balance = round(rng.lognormvariate(13 if heavy else 8, 1.5), 2)
+            account = {
+                "id": rng_uuid(rng),
+                "user_id": user["id"],
+                "account_number": number + luhn_check_digit(number),
+                "account_type": "checking" if n == 0 else weighted(rng, [("savings", 6), ("checking", 3), ("ktt", 1)]),
+                "currency": currency,
+                "available_balance": balance,
+                "transit_balance": 0.0,
+                "held_balance": 0.0,
+                "blocked_balance": 0.0,
+                "status": "active",
+                "ledger_bootstrapped": True,
+                "created_at": iso(account_ts)
+            }
+            opening = opening_balance_entries(account["id"], currency, {"available_balance": balance})
+            for document in ledger_posting(rng, opening, f"OPEN{account['account_number']}", "Opening balance", account["created_at"]):
+                writer.add("ledger", document)
+            weight = min(rng.paretovariate(1.2), MAX_ACCOUNT_WEIGHT) * (HEAVY_ACCOUNT_WEIGHT if heavy else 1)
+            accounts.append((account, account_ts, weight))
+
+        for _ in range(weighted(rng, [(0, 40), (1, 30), (2, 20), (5, 10)])):
+            writer.add("beneficiaries", {
+                "id": rng_uuid(rng),
+                "user_id": user["id"],
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "bank_name": f"{rng.choice(LAST_NAMES)} Bank",
+                "account_number": str(rng.randrange(10 ** 9, 10 ** 12)),
+                "swift_code": "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ", k=6)) + "2L",
+                "beneficiary_type": "external",
+                "status": "active",
+                "created_at": iso(rng.uniform(created_ts, opts["end_ts"]))
+            })
+    return users, accounts
+
+
+def generate_transactions(rng, writer, opts, shard, accounts, budget):
+    total_weight = sum(w for _, _, w in accounts)
+    counts = [int(budget * w / total_weight) for _, _, w in accounts]
+    for _ in range(budget - sum(counts)):
+        counts[rng.randrange(len(accounts))] += 1
+
+    sequence = 0
+    for (account, account_ts, _), count in zip(accounts, counts):
+        for _ in range(count):
+            sequence += 1
+            tx_type = weighted(rng, TRANSACTION_TYPES)
+            amount = round(rng.lognormvariate(4.5, 1.6), 2)
+            status = weighted(rng, WIRE_STATUSES) if tx_type == "wire_out" else "completed"
+            tx = {
+                "id": rng_uuid(rng),
+                "account_id": account["id"],
+                "transaction_type": tx_type,
+                "amount": -amount if tx_type in ("transfer_out", "wire_out") else amount,
+                "currency": account["currency"],
+                "description": tx_type.replace("_", " ").capitalize(),
+                "status": status,
+                "reference": f"SYN{shard:05d}{sequence:010d}",
+                "counterparty": str(rng.randrange(10 ** 9, 10 ** 12)),
+                "created_at": iso(rng.uniform(account_ts, opts["end_ts"])),
+                "is_redacted": False
+            }
+            if status in ("pending", "approved"):
+                if account["available_balance"] < amount:
+                    # The endpoint refuses wires the account cannot cover
+                    tx["status"] = "rejected"
+                else:
+                    transit = [
+                        ledger_entry(account["id"], "available_balance", -amount, account["currency"]),
+                        ledger_entry(account["id"], "transit_balance", amount, account["currency"])
+                    ]
+                    for document in ledger_posting(rng, transit, tx["reference"], "Wire initiated", tx["created_at"]):
+                        writer.add("ledger", document)
+                    account["available_balance"] = round(account["available_balance"] - amount, 2)
+                    account["transit_balance"] = round(account["transit_balance"] + amount, 2)
+            writer.add("transactions", tx)
+
+
+def generate_activity(rng, writer, opts, shard, shards, users):
+    for _ in range(share(opts["audit_logs"], shard, shards)):
+        user, created_ts = rng.choice(users)
+        timestamp = iso(rng.uniform(created_ts, opts["end_ts"]))
+        writer.add(audit_partition_name(timestamp), {
+            "id": rng_uuid(rng),
+            "user_id": user["id"],
+            "action": weighted(rng, AUDIT_ACTIONS),
+            "details": {"email": user["email"]},
+            "ip_address": None,
+            "timestamp": timestamp
+        })
+
+    for _ in range(share(opts["otps"], shard, shards)):
+        user, created_ts = rng.choice(users)
+        created = rng.uniform(created_ts, opts["end_ts"])
+        writer.add("otps", {
+            "id": rng_uuid(rng),
+            "user_id": user["id"],
+            "email": user["email"],
+            "otp_hash": hash_otp(f"{rng.randrange(10 ** 6):06d}"),
+            "purpose": rng.choice(OTP_PURPOSES),
+            "attempts": 0,
+            "used": rng.random() < 0.9,
+            "created_at": iso(created),
+            "expires_at": iso(created + 300)
+        })
+
+    for _ in range(share(opts["tickets"], shard, shards)):
+        user, created_ts = rng.choice(users)
+        created = rng.uniform(created_ts, opts["end_ts"])
+        ticket_id = rng_uuid(rng)
+        message_count = min(int(rng.expovariate(1 / 4)), 200)
+        last_message = created
+        for n in range(message_count):
+            last_message = rng.uniform(last_message, min(last_message + 3 * 86400, opts["end_ts"]))
+            writer.add("ticket_messages", {
+                "id": rng_uuid(rng),
+                "ticket_id": ticket_id,
+                "sender": "admin" if n % 2 == 0 else "client",
+                "author_id": user["id"],
+                "message": "Synthetic support message " * rng.randint(1, 8),
+                "created_at": iso(last_message)
+            })
+        writer.add("tickets", {
+            "id": ticket_id,
+            "user_id": user["id"],
+            "subject": f"{rng.choice(TICKET_CATEGORIES).capitalize()} question",
+            "message": "Synthetic support request " * rng.randint(2, 20),
+            "category": rng.choice(TICKET_CATEGORIES),
+            "status": weighted(rng, TICKET_STATUSES),
+            "created_at": iso(created),
+            "last_message_at": iso(last_message),
+            "message_count": message_count,
+            "unread_for_user": 0,
+            "unread_for_admin": 0
+        })
+
+
+def generate_shard(task: tuple) -> dict:
+    """Process pool entry point: generate and load one shard of users and everything they own"""
+    opts, shard, password_hash = task
+    rng = random.Random(f"{opts['seed']}:{shard}")
+    shards = math.ceil(opts["users"] / opts["shard_size"])
+    first_user = shard * opts["shard_size"]
+    last_user = min(first_user + opts["shard_size"], opts["users"])
+
+    mongo = MongoClient(server.mongo_url)
+    writer = BatchWriter(mongo[os.environ["DB_NAME"]], opts["batch_size"])
+    try:
+        users, accounts = generate_users(rng, writer, opts, first_user, last_user, password_hash)
+        generate_transactions(rng, writer, opts, shard, accounts, share(opts["transactions"], shard, shards))
+        # Written after the transactions so the denormalized balances include wires in transit
+        for account, _, _ in accounts:
+            writer.add("accounts", account)
+        generate_activity(rng, writer, opts, shard, shards, users)
+        writer.flush()
+    finally:
+        mongo.close()
+    return writer.counts
+
+
+async def build_indexes(partitions: set, users: int):
+    await server.create_indexes()
+    for name in sorted(partitions):
+        await server.get_audit_partition(name)
+    # Hand out live account numbers after the generated range
+    await server.db.counters.update_one(
+        {"_id": "account_number"}, {"$max": {"value": users * MAX_ACCOUNTS_PER_USER}}, upsert=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a deterministic synthetic dataset into DB_NAME")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--transactions", type=int, default=300000)
+    parser.add_argument("--audit-logs", type=int, default=100000)
+    parser.add_argument("--otps", type=int, default=20000)
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--years", type=int, default=5, help="length of the generated history")
+    parser.add_argument("--end-date", default="2026-01-01", help="history ends here (UTC); fixed so reruns match")
+    parser.add_argument("--shard-size", type=int, default=10000, help="users per shard; changes the generated data")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--drop", action="store_true", help="drop the generated collections first")
+    args = parser.parse_args()
+
+    end = datetime.fromisoformat(args.end_date).replace(tzinfo=timezone.utc)
+    opts = {
+        "seed": args.seed,
+        "users": args.users,
+        "transactions": args.transactions,
+        "audit_logs": args.audit_logs,
+        "otps": args.otps,
+        "tickets": args.tickets,
+        "shard_size": args.shard_size,
+        "batch_size": args.batch_size,
+        "start_ts": (end - timedelta(days=365 * args.years)).timestamp(),
+        "end_ts": end.timestamp()
+    }
+
+    mongo = MongoClient(server.mongo_url)
+    db = mongo[os.environ["DB_NAME"]]
+    if args.drop:
+        for name in db.list_collection_names():
+            if name in ("users", "accounts", "ledger", "beneficiaries", "transactions", "otps", "tickets",
+                        "ticket_messages", "balance_snapshots", "transaction_rollups", "counters") or name.startswith("audit_logs"):
+                db.drop_collection(name)
+
+    # Every generated client signs in with "password123"; a fixed salt keeps the hash reproducible
+    password_hash = pwd_context.handler("bcrypt").using(salt="SyntheticDatasetSalt..", rounds=12).hash("password123")
+    shards = math.ceil(args.users / args.shard_size)
+    totals = {}
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        tasks = [(opts, shard, password_hash) for shard in range(shards)]
+        for done, counts in enumerate(pool.map(generate_shard, tasks), 1):
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+            elapsed = time.monotonic() - started
+            documents = sum(totals.values())
+            print(f"shard {done}/{shards}: {documents:,} documents, {documents / elapsed:,.0f} docs/s", flush=True)
+    load_seconds = time.monotonic() - started
+
+    index_started = time.monotonic()
+    asyncio.run(build_indexes({name for name in totals if name.startswith("audit_logs_")}, args.users))
+    index_seconds = time.monotonic() - index_started
+
+    for name in sorted(totals):
+        print(f"{name:<24}{totals[name]:>16,}")
+    print(f"loaded in {load_seconds:.1f}s, indexes built in {index_seconds:.1f}s")
+    print("Transaction rollups are rebuilt when the server next starts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,926 @@
+"""In-memory storage engine with the Motor interface the server uses.
+
+Selected with STORAGE_ENGINE=memory. Each collection keeps its documents in a
+dict keyed by _id, plus one dict-based secondary index per create_index call
+(value of the index's first field -> ids) that turns equality and $in filters
+into lookups instead of scans. Unique and TTL indexes are enforced, change
+streams are served from an in-process feed, and the aggregation stages the
+server relies on are evaluated in Python.
+
+It exists for profiling and fast test runs: nothing is persisted, and every
+operation runs in the calling event loop without yielding.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+MISSING = object()
+
+
+def clone(value):
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    return value
+
+
+def hashable(value):
+    if isinstance(value, dict):
+        return tuple((k, hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(hashable(v) for v in value)
+    return value
+
+
+# ==================== PATHS AND COMPARISON ====================
+
+def resolve(value, parts: List[str]) -> list:
+    """All values at a dotted path; arrays along the way fan out like Mongo's"""
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        return resolve(value[parts[0]], parts[1:]) if parts[0] in value else [MISSING]
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return resolve(value[index], parts[1:]) if index < len(value) else [MISSING]
+        found = [v for item in value for v in resolve(item, parts)]
+        return found or [MISSING]
+    return [MISSING]
+
+
+def get_path(doc: dict, path: str, default=None):
+    value = resolve(doc, path.split("."))[0]
+    return default if value is MISSING else value
+
+
+def set_path(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def unset_path(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def bracket(value) -> int:
+    """BSON comparison order; range operators only match within one bracket"""
+    if value is None or value is MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def sort_key(value):
+    group = bracket(value)
+    if group in (1,):
+        return (group, 0)
+    if group in (4, 5):
+        return (group, json.dumps(value, sort_keys=True, default=str))
+    return (group, value)
+
+
+def equals(value, expected) -> bool:
+    if expected is None:
+        return value is None or value is MISSING
+    if value is MISSING or bracket(value) != bracket(expected):
+        return False
+    return value == expected
+
+
+def candidates(doc, path: str) -> list:
+    """Values an operator is tested against: the field itself and, for arrays, each element"""
+    values = []
+    for value in resolve(doc, path.split(".")):
+        values.append(value)
+        if isinstance(value, list):
+            values.extend(value)
+    return values
+
+
+RANGE_OPERATORS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b
+}
+
+
+def is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and value and all(k.startswith("$") for k in value)
+
+
+def match_condition(values: list, condition) -> bool:
+    if not is_operator_dict(condition):
+        return any(equals(v, condition) for v in values)
+    for op, arg in condition.items():
+        if op == "$eq":
+            ok = any(equals(v, arg) for v in values)
+        elif op == "$ne":
+            ok = not any(equals(v, arg) for v in values)
+        elif op in RANGE_OPERATORS:
+            ok = any(
+                v is not MISSING and bracket(v) == bracket(arg) and RANGE_OPERATORS[op](v, arg)
+                for v in values
+            )
+        elif op == "$in":
+            ok = any(equals(v, a) for v in values for a in arg)
+        elif op == "$nin":
+            ok = not any(equals(v, a) for v in values for a in arg)
+        elif op == "$exists":
+            ok = any(v is not MISSING for v in values) == bool(arg)
+        elif op == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            pattern = arg if isinstance(arg, re.Pattern) else re.compile(arg, flags)
+            ok = any(isinstance(v, str) and pattern.search(v) for v in values)
+        elif op == "$options":
+            ok = True
+        elif op == "$not":
+            ok = not match_condition(values, arg)
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported by the memory engine")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: dict, query: Optional[dict], text_fields: tuple = ()) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, q, text_fields) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q, text_fields) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, q, text_fields) for q in condition):
+                return False
+        elif key == "$text":
+            words = {w.lower() for w in condition["$search"].split() if not w.startswith("-")}
+            text = " ".join(str(get_path(doc, f, "")) for f in text_fields).lower()
+            if not words & set(re.findall(r"\w+", text)):
+                return False
+        elif not match_condition(candidates(doc, key), condition):
+            return False
+    return True
+
+
+# ==================== EXPRESSIONS, PROJECTION, UPDATES ====================
+
+def evaluate(expr, doc: dict):
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = resolve(doc, expr[1:].split("."))
+        value = value[0] if len(value) == 1 else [v for v in value if v is not MISSING]
+        return None if value is MISSING else value
+    if isinstance(expr, list):
+        return [evaluate(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if not is_operator_dict(expr):
+        return {k: evaluate(v, doc) for k, v in expr.items()}
+    op, arg = next(iter(expr.items()))
+    if op == "$literal":
+        return arg
+    args = evaluate(arg, doc) if isinstance(arg, list) else [evaluate(arg, doc)]
+    if op == "$substrCP":
+        text, start, length = args
+        return (text or "")[start:start + length] if isinstance(text, str) else ""
+    if op == "$concat":
+        return None if any(a is None for a in args) else "".join(args)
+    if op == "$arrayToObject":
+        return {
+            (item["k"] if isinstance(item, dict) else item[0]): (item["v"] if isinstance(item, dict) else item[1])
+            for item in args[0] or []
+        }
+    if op in ("$max", "$min"):
+        values = [v for v in (args[0] if len(args) == 1 and isinstance(args[0], list) else args) if v is not None]
+        return (max if op == "$max" else min)(values, key=sort_key) if values else None
+    if op == "$sum":
+        values = args[0] if len(args) == 1 and isinstance(args[0], list) else args
+        return sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+    if op == "$add":
+        return sum(args)
+    if op == "$subtract":
+        return args[0] - args[1]
+    if op == "$multiply":
+        result = 1
+        for a in args:
+            result *= a
+        return result
+    if op == "$abs":
+        return None if args[0] is None else abs(args[0])
+    if op == "$ifNull":
+        return next((a for a in args if a is not None), None)
+    if op == "$cond":
+        condition = arg if isinstance(arg, list) else [arg["if"], arg["then"], arg["else"]]
+        return evaluate(condition[1], doc) if evaluate(condition[0], doc) else evaluate(condition[2], doc)
+    raise NotImplementedError(f"Expression {op} is not supported by the memory engine")
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return clone(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    id_is_flag = isinstance(include_id, (bool, int)) and include_id in (0, 1)
+    spec = {k: v for k, v in projection.items() if k != "_id"}
+    computed = {k: v for k, v in spec.items() if not (isinstance(v, (bool, int)) and v in (0, 1))}
+    if not id_is_flag or computed or any(v in (1, True) for v in spec.values() if isinstance(v, (bool, int))):
+        result = {}
+        if not id_is_flag:
+            # {"_id": "$_id.month"} and the like replace the id, as in $project
+            result["_id"] = evaluate(include_id, doc)
+        elif include_id and "_id" in doc:
+            result["_id"] = clone(doc["_id"])
+        for key, value in spec.items():
+            if key in computed:
+                set_path(result, key, evaluate(value, doc))
+            elif value:
+                found = resolve(doc, key.split("."))[0]
+                if found is not MISSING:
+                    set_path(result, key, clone(found))
+        return result
+    result = clone(doc)
+    for key in spec:
+        unset_path(result, key)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def apply_update(doc: dict, update, inserting: bool = False):
+    if not is_operator_dict(update):
+        # Replacement document
+        _id = doc.get("_id")
+        doc.clear()
+        doc.update(clone(update))
+        if _id is not None:
+            doc["_id"] = _id
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set":
+                set_path(doc, path, clone(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    set_path(doc, path, clone(value))
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                set_path(doc, path, get_path(doc, path, 0) + value)
+            elif op in ("$max", "$min"):
+                current = get_path(doc, path, MISSING)
+                if current is MISSING or (sort_key(value) > sort_key(current)) == (op == "$max") and value != current:
+                    set_path(doc, path, clone(value))
+            elif op == "$push":
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                current = (get_path(doc, path, None) or []) + clone(items)
+                if isinstance(value, dict) and "$slice" in value:
+                    limit = value["$slice"]
+                    current = current[limit:] if limit < 0 else current[:limit]
+                set_path(doc, path, current)
+            elif op == "$addToSet":
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                current = list(get_path(doc, path, None) or [])
+                current.extend(clone(i) for i in items if i not in current)
+                set_path(doc, path, current)
+            elif op == "$pull":
+                current = get_path(doc, path, None) or []
+                set_path(doc, path, [i for i in current if not match_condition([i], value)])
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported by the memory engine")
+
+
+def upsert_seed(query: dict) -> dict:
+    """Equality fields of an upsert filter become fields of the inserted document"""
+    doc = {}
+    for key, value in (query or {}).items():
+        if key == "$and":
+            for part in value:
+                doc.update(upsert_seed(part))
+        elif not key.startswith("$") and not is_operator_dict(value):
+            set_path(doc, key, clone(value))
+        elif is_operator_dict(value) and "$eq" in value:
+            set_path(doc, key, clone(value["$eq"]))
+    return doc
+
+
+def sort_documents(docs: list, spec) -> list:
+    if isinstance(spec, str):
+        spec = [(spec, 1)]
+    elif isinstance(spec, dict):
+        spec = list(spec.items())
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda d: sort_key(get_path(d, field, None)), reverse=direction == -1)
+    return docs
+
+
+# ==================== INDEXES ====================
+
+class MemoryIndex:
+    """Secondary index on the first key field (multikey for arrays); compound keys only for uniqueness"""
+
+    def __init__(self, name: str, keys: list, unique: bool, sparse: bool, ttl: Optional[int], partial: Optional[dict]):
+        self.name = name
+        self.keys = keys
+        self.fields = [field for field, _ in keys]
+        self.unique = unique
+        self.sparse = sparse
+        self.ttl = ttl
+        self.partial = partial
+        self.entries: Dict[Any, set] = {}
+        self.unique_entries: Dict[Any, Any] = {}
+        # TTL indexes: heap of (expires_at, seq, id); entries go stale on update and are rechecked when popped
+        self.expiries: list = []
+        self.sequence = itertools.count()
+
+    def covers(self, doc: dict) -> bool:
+        if self.partial and not matches(doc, self.partial):
+            return False
+        return not (self.sparse and all(get_path(doc, f, MISSING) is MISSING for f in self.fields))
+
+    def first_values(self, doc: dict) -> set:
+        value = get_path(doc, self.fields[0], None)
+        values = value if isinstance(value, list) and value else [value]
+        return {hashable(v) for v in values}
+
+    def unique_key(self, doc: dict):
+        return tuple(hashable(get_path(doc, f, None)) for f in self.fields)
+
+    def expires_at(self, doc: dict) -> Optional[datetime]:
+        value = get_path(doc, self.fields[0], None)
+        if not isinstance(value, datetime):
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value + timedelta(seconds=self.ttl)
+
+    def add(self, key, doc: dict):
+        if not self.covers(doc):
+            return
+        for value in self.first_values(doc):
+            self.entries.setdefault(value, set()).add(key)
+        if self.unique:
+            self.unique_entries[self.unique_key(doc)] = key
+        if self.ttl is not None:
+            expires_at = self.expires_at(doc)
+            if expires_at:
+                heapq.heappush(self.expiries, (expires_at, next(self.sequence), key))
+
+    def remove(self, key, doc: dict):
+        if not self.covers(doc):
+            return
+        for value in self.first_values(doc):
+            ids = self.entries.get(value)
+            if ids:
+                ids.discard(key)
+                if not ids:
+                    del self.entries[value]
+        if self.unique and self.unique_entries.get(self.unique_key(doc)) == key:
+            del self.unique_entries[self.unique_key(doc)]
+
+    def conflict(self, key, doc: dict) -> bool:
+        if not self.unique or not self.covers(doc):
+            return False
+        owner = self.unique_entries.get(self.unique_key(doc), key)
+        return owner != key
+
+    def lookup(self, condition) -> Optional[set]:
+        """Ids that can match an equality/$in condition on the first field, or None if unusable"""
+        if self.partial:
+            return None
+        if is_operator_dict(condition):
+            if set(condition) - {"$in", "$eq"}:
+                return None
+            values = condition.get("$in", []) + ([condition["$eq"]] if "$eq" in condition else [])
+        elif isinstance(condition, dict):
+            return None
+        else:
+            values = [condition]
+        if any(v is None or isinstance(v, (list, re.Pattern)) for v in values):
+            return None
+        ids = set()
+        for value in values:
+            ids |= self.entries.get(hashable(value), set())
+        return ids
+
+
+# ==================== CURSORS ====================
+
+class MemoryCursor:
+    """Lazy cursor: filtering, sorting and paging run when the results are first read"""
+
+    def __init__(self, run):
+        self._run = run
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else key_or_list
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _materialize(self) -> list:
+        if self._results is None:
+            self._results = self._run(self._sort, self._skip, self._limit)
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        results = self._materialize()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._materialize())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryChangeStream:
+    def __init__(self, database: "MemoryDatabase", pipeline: Optional[list]):
+        self._database = database
+        self._match = {}
+        for stage in pipeline or []:
+            self._match.update(stage.get("$match", {}))
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        self._database._streams.add(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._database._streams.discard(self)
+
+    def publish(self, change: dict):
+        if matches(change, self._match):
+            self._queue.put_nowait(change)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+
+# ==================== COLLECTIONS ====================
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._docs: Dict[Any, dict] = {}
+        self._indexes: Dict[str, MemoryIndex] = {}
+        self._order: Dict[Any, int] = {}
+        self._text_fields: tuple = ()
+
+    # Internal helpers
+
+    def _purge_expired(self):
+        now = datetime.now(timezone.utc)
+        for index in self._indexes.values():
+            expiries = index.expiries
+            while expiries and expiries[0][0] < now:
+                _, _, key = heapq.heappop(expiries)
+                doc = self._docs.get(key)
+                # The document may have been deleted or given a later expiry since it was pushed
+                expires_at = doc is not None and index.covers(doc) and index.expires_at(doc)
+                if expires_at and expires_at < now:
+                    self._delete_key(key)
+
+    def _candidates(self, query: Optional[dict]) -> list:
+        self._purge_expired()
+        query = query or {}
+        if "_id" in query and not isinstance(query["_id"], dict):
+            key = hashable(query["_id"])
+            return [self._docs[key]] if key in self._docs else []
+        best = None
+        for index in self._indexes.values():
+            if index.fields[0] in query:
+                ids = index.lookup(query[index.fields[0]])
+                if ids is not None and (best is None or len(ids) < len(best)):
+                    best = ids
+        if best is None:
+            return list(self._docs.values())
+        # Keep natural (insertion) order, as a collection scan would
+        return [self._docs[key] for key in sorted(best, key=self._order.__getitem__) if key in self._docs]
+
+    def _select(self, query: Optional[dict], sort=None, skip: int = 0, limit: int = 0) -> list:
+        docs = [d for d in self._candidates(query) if matches(d, query, self._text_fields)]
+        if sort:
+            docs = sort_documents(docs, sort)
+        docs = docs[skip:]
+        return docs[:limit] if limit else docs
+
+    def _check_unique(self, key, doc: dict):
+        for index in self._indexes.values():
+            if index.conflict(key, doc):
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {index.name}",
+                    11000, {"keyValue": {f: get_path(doc, f) for f in index.fields}}
+                )
+
+    def _store(self, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        key = hashable(doc["_id"])
+        if key in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        self._check_unique(key, doc)
+        stored = clone(doc)
+        self.database._sequence += 1
+        self._order[key] = self.database._sequence
+        self._docs[key] = stored
+        for index in self._indexes.values():
+            index.add(key, stored)
+        self.database._emit("insert", self.name, stored)
+
+    def _replace_stored(self, key, updated: dict, operation: str = "update"):
+        self._check_unique(key, updated)
+        current = self._docs[key]
+        for index in self._indexes.values():
+            index.remove(key, current)
+        self._docs[key] = updated
+        for index in self._indexes.values():
+            index.add(key, updated)
+        self.database._emit(operation, self.name, updated)
+
+    def _delete_key(self, key):
+        doc = self._docs.pop(key)
+        self._order.pop(key, None)
+        for index in self._indexes.values():
+            index.remove(key, doc)
+        self.database._emit("delete", self.name, None, doc["_id"])
+
+    def _update(self, query: dict, update, upsert: bool, many: bool, sort=None) -> tuple:
+        """Returns (matched, modified, upserted_id, documents before, documents after)"""
+        targets = self._select(query, sort=sort, limit=0 if many else 1)
+        if not targets:
+            if not upsert:
+                return 0, 0, None, [], []
+            doc = upsert_seed(query)
+            apply_update(doc, update, inserting=True)
+            self._store(doc)
+            return 0, 0, doc["_id"], [None], [self._docs[hashable(doc["_id"])]]
+        modified, befores, afters = 0, [], []
+        for current in targets:
+            key = hashable(current["_id"])
+            updated = clone(current)
+            apply_update(updated, update)
+            befores.append(current)
+            if updated != current:
+                self._replace_stored(key, updated, "update" if is_operator_dict(update) else "replace")
+                modified += 1
+            afters.append(self._docs[key])
+        return len(targets), modified, None, befores, afters
+
+    # Motor-compatible API
+
+    def find(self, filter: Optional[dict] = None, projection=None, sort=None, skip: int = 0, limit: int = 0, **kwargs):
+        cursor = MemoryCursor(lambda s, sk, lim: [
+            project(d, projection) for d in self._select(filter, s, sk, lim)
+        ])
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs) -> Optional[dict]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        docs = self._select(filter, sort=sort, limit=1)
+        return project(docs[0], projection) if docs else None
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        self._store(document)
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents: list, ordered: bool = True, **kwargs) -> InsertManyResult:
+        errors, inserted = [], []
+        for i, document in enumerate(documents):
+            try:
+                self._store(document)
+                inserted.append(document["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": i, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted),
+                "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []
+            })
+        return InsertManyResult(inserted, True)
+
+    async def update_one(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert, many=False)
+        raw = {"n": matched or (1 if upserted_id is not None else 0), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def update_many(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert, many=True)
+        raw = {"n": matched or (1 if upserted_id is not None else 0), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self.update_one(filter, replacement, upsert=upsert)
+
+    async def find_one_and_update(self, filter: dict, update, projection=None, sort=None, upsert: bool = False,
+                                  return_document: bool = False, **kwargs) -> Optional[dict]:
+        _, _, upserted_id, befores, afters = self._update(filter, update, upsert, many=False, sort=sort)
+        if not afters:
+            return None
+        doc = afters[0] if return_document else befores[0]
+        return None if doc is None else project(doc, projection)
+
+    async def find_one_and_delete(self, filter: dict, projection=None, sort=None, **kwargs) -> Optional[dict]:
+        docs = self._select(filter, sort=sort, limit=1)
+        if not docs:
+            return None
+        self._delete_key(hashable(docs[0]["_id"]))
+        return project(docs[0], projection)
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        docs = self._select(filter, limit=1)
+        for doc in docs:
+            self._delete_key(hashable(doc["_id"]))
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        docs = self._select(filter)
+        for doc in docs:
+            self._delete_key(hashable(doc["_id"]))
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def count_documents(self, filter: dict, limit: int = 0, skip: int = 0, **kwargs) -> int:
+        return len(self._select(filter, skip=skip, limit=limit))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, **kwargs) -> list:
+        values = []
+        for doc in self._select(filter):
+            for value in candidates(doc, key):
+                if value is not MISSING and not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        for i, request in enumerate(requests):
+            kind = type(request).__name__
+            try:
+                if kind == "InsertOne":
+                    self._store(request._doc)
+                    result["nInserted"] += 1
+                elif kind in ("UpdateOne", "UpdateMany", "ReplaceOne"):
+                    matched, modified, upserted_id, _, _ = self._update(
+                        request._filter, request._doc, request._upsert, many=kind == "UpdateMany"
+                    )
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": i, "_id": upserted_id})
+                elif kind in ("DeleteOne", "DeleteMany"):
+                    docs = self._select(request._filter, limit=0 if kind == "DeleteMany" else 1)
+                    for doc in docs:
+                        self._delete_key(hashable(doc["_id"]))
+                    result["nRemoved"] += len(docs)
+                else:
+                    raise NotImplementedError(f"Bulk operation {kind} is not supported by the memory engine")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": i, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_index(self, keys, unique: bool = False, sparse: bool = False, expireAfterSeconds: Optional[int] = None,
+                           partialFilterExpression: Optional[dict] = None, name: Optional[str] = None, **kwargs) -> str:
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if any(direction == "text" for _, direction in keys):
+            self._text_fields = tuple(field for field, direction in keys if direction == "text")
+            return name
+        if name in self._indexes:
+            return name
+        index = MemoryIndex(name, keys, unique, sparse, expireAfterSeconds, partialFilterExpression)
+        for key, doc in self._docs.items():
+            if index.conflict(key, doc):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+            index.add(key, doc)
+        self._indexes[name] = index
+        return name
+
+    async def drop(self):
+        self.database._collections.pop(self.name, None)
+
+    def aggregate(self, pipeline: list, **kwargs) -> MemoryCursor:
+        return MemoryCursor(lambda *_: run_pipeline(self, pipeline))
+
+    def watch(self, pipeline: Optional[list] = None, **kwargs) -> MemoryChangeStream:
+        return MemoryChangeStream(self.database, [{"$match": {"ns.coll": self.name}}] + (pipeline or []))
+
+
+# ==================== AGGREGATION ====================
+
+ACCUMULATORS = {"$sum", "$max", "$min", "$push", "$first", "$last", "$avg", "$addToSet", "$count"}
+
+
+def run_group(docs: list, spec: dict) -> list:
+    groups: Dict[Any, dict] = {}
+    for doc in docs:
+        group_id = evaluate(spec["_id"], doc)
+        key = hashable(group_id)
+        state = groups.setdefault(key, {"_id": group_id, "_values": {}})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            op, expr = next(iter(accumulator.items()))
+            if op not in ACCUMULATORS:
+                raise NotImplementedError(f"Accumulator {op} is not supported by the memory engine")
+            value = 1 if op == "$count" else evaluate(expr, doc)
+            state["_values"].setdefault(field, []).append(value)
+
+    results = []
+    for state in groups.values():
+        row = {"_id": state["_id"]}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            op = next(iter(accumulator))
+            values = state["_values"].get(field, [])
+            numbers = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+            present = [v for v in values if v is not None]
+            if op in ("$sum", "$count"):
+                row[field] = sum(numbers)
+            elif op == "$avg":
+                row[field] = sum(numbers) / len(numbers) if numbers else None
+            elif op in ("$max", "$min"):
+                row[field] = (max if op == "$max" else min)(present, key=sort_key) if present else None
+            elif op == "$push":
+                row[field] = values
+            elif op == "$addToSet":
+                row[field] = [v for i, v in enumerate(values) if v not in values[:i]]
+            elif op == "$first":
+                row[field] = values[0] if values else None
+            elif op == "$last":
+                row[field] = values[-1] if values else None
+        results.append(row)
+    return results
+
+
+def run_pipeline(collection: MemoryCollection, pipeline: list) -> list:
+    docs = None
+    for stage in pipeline:
+        op, spec = next(iter(stage.items()))
+        if op == "$match":
+            if docs is None:
+                docs = [clone(d) for d in collection._select(spec)]
+            else:
+                docs = [d for d in docs if matches(d, spec)]
+            continue
+        if docs is None:
+            docs = [clone(d) for d in collection._select({})]
+        if op == "$group":
+            docs = run_group(docs, spec)
+        elif op == "$project":
+            docs = [project(d, spec) for d in docs]
+        elif op == "$addFields" or op == "$set":
+            for d in docs:
+                for field, expr in spec.items():
+                    set_path(d, field, evaluate(expr, d))
+        elif op == "$sort":
+            docs = sort_documents(docs, spec)
+        elif op == "$skip":
+            docs = docs[spec:]
+        elif op == "$limit":
+            docs = docs[:spec]
+        elif op == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif op == "$unwind":
+            path = (spec if isinstance(spec, str) else spec["path"])[1:]
+            docs = [{**d, path: item} for d in docs for item in (d.get(path) or [])]
+        elif op == "$merge":
+            target = collection.database[spec["into"] if isinstance(spec["into"], str) else spec["into"]["coll"]]
+            on = spec.get("on", "_id")
+            for d in docs:
+                query = {on: d[on]} if isinstance(on, str) else {f: d[f] for f in on}
+                existing = target._select(query, limit=1)
+                if existing:
+                    if spec.get("whenMatched", "merge") == "replace":
+                        target._update(query, {k: v for k, v in d.items() if k != "_id"}, False, many=False)
+                    elif spec.get("whenMatched", "merge") == "merge":
+                        target._update(query, {"$set": {k: v for k, v in d.items() if k != "_id"}}, False, many=False)
+                elif spec.get("whenNotMatched", "insert") == "insert":
+                    target._store(clone(d))
+            docs = []
+        else:
+            raise NotImplementedError(f"Aggregation stage {op} is not supported by the memory engine")
+    return docs if docs is not None else [clone(d) for d in collection._select({})]
+
+
+# ==================== DATABASE AND CLIENT ====================
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._streams: set = set()
+        self._sequence = 0
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def _emit(self, operation: str, collection: str, doc: Optional[dict], _id=None):
+        if not self._streams:
+            return
+        change = {
+            "operationType": operation,
+            "ns": {"db": self.name, "coll": collection},
+            "documentKey": {"_id": doc["_id"] if doc else _id}
+        }
+        if doc is not None:
+            change["fullDocument"] = clone(doc)
+        for stream in list(self._streams):
+            stream.publish(change)
+
+    async def list_collection_names(self, filter: Optional[dict] = None, **kwargs) -> List[str]:
+        return [name for name in self._collections if matches({"name": name}, filter)]
+
+    async def drop_collection(self, name: str):
+        self._collections.pop(name, None)
+
+    def watch(self, pipeline: Optional[list] = None, **kwargs) -> MemoryChangeStream:
+        return MemoryChangeStream(self, pipeline)
+
+
+class MemoryClient:
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    def close(self):
+        pass
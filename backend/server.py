@@ -1,12 +1,30 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks, Request, Response, Header
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse, PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from concurrent.futures import ProcessPoolExecutor
 import os
+import asyncio
+import time
+from collections import OrderedDict, deque
+import codecs
+import csv
+import io
+import json
+import base64
+import zipfile
+import copy
+import gzip
+import shutil
+from xml.sax.saxutils import escape as xml_escape
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError, TypeAdapter, create_model
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
@@ -17,23 +35,174 @@ from passlib.context import CryptContext
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import format_datetime, parsedate_to_datetime
 import random
+import re
 import string
+import unicodedata
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# MongoDB connection; STORAGE_ENGINE=memory swaps in the in-process engine for profiling and tests
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'mongo')
+mongo_url = os.environ.get('MONGO_URL', '')
+if STORAGE_ENGINE == 'memory':
+    from memory_store import MemoryClient
+    client = MemoryClient()
+else:
+    client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 JWT_SECRET = os.environ.get('JWT_SECRET', 'prominence-bank-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+# Verified token payloads are cached until exp; revocations are mirrored in memory
+TOKEN_CACHE_SIZE = 10000
+TOKEN_REVOCATION_SYNC_SECONDS = int(os.environ.get('TOKEN_REVOCATION_SYNC_SECONDS', 10))
+
+# Account numbers: 11-digit sequence value + Luhn check digit
+ACCOUNT_NUMBER_BASE = 20000000000
+ACCOUNT_NUMBER_BLOCK_SIZE = 100
+
+# CPU-bound work (bcrypt, rendering) is offloaded to a shared process pool
+PROCESS_POOL_WORKERS = int(os.environ.get('PROCESS_POOL_WORKERS', os.cpu_count() or 2))
+IMPORT_BATCH_SIZE = 1000
+
+# Ledger snapshots: entries newer than the settle window are left in the tail
+BALANCE_FIELDS = ["available_balance", "transit_balance", "held_balance", "blocked_balance"]
+LEDGER_SNAPSHOT_INTERVAL_SECONDS = int(os.environ.get('LEDGER_SNAPSHOT_INTERVAL_SECONDS', 300))
+LEDGER_SNAPSHOT_SETTLE_SECONDS = 30
+LEDGER_SNAPSHOT_BATCH_SIZE = 500
+# Debits take a short per-account lease around the balance check and the posting
+DEBIT_LOCK_SECONDS = 30
+DEBIT_LOCK_WAIT_SECONDS = 5
+
+# Server-sent events
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_QUEUE_SIZE = 100
+# Ledger legs arriving within this window share one balance event per account
+STREAM_BALANCE_DEBOUNCE_SECONDS = 0.05
+ACCOUNT_OWNER_CACHE_SIZE = 100000
+
+# Idempotency keys for transfer endpoints
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+IDEMPOTENCY_CACHE_SIZE = 10000
+IDEMPOTENCY_WAIT_SECONDS = 10
+# An in-progress key whose worker died can be taken over once its lease lapses
+IDEMPOTENCY_LEASE_SECONDS = 60
+
+# Transfer velocity limits; amounts are in the source account's currency
+VELOCITY_MAX_EVENTS = 1000
+VELOCITY_PERSIST_SECONDS = int(os.environ.get('VELOCITY_PERSIST_SECONDS', 30))
+VELOCITY_NEW_BENEFICIARY_SECONDS = 24 * 3600
+DEFAULT_VELOCITY_RULES = [
+    {"name": "account_daily_amount", "scope": "account", "metric": "amount", "window_seconds": 86400,
+     "review_at": 10000, "deny_at": 50000, "transfer_types": ["internal", "external"]},
+    {"name": "user_hourly_transfers", "scope": "user", "metric": "count", "window_seconds": 3600,
+     "review_at": 10, "deny_at": 30, "transfer_types": ["internal", "external"]},
+    {"name": "new_beneficiary_burst", "scope": "user", "metric": "new_beneficiary_count", "window_seconds": 3600,
+     "review_at": 2, "deny_at": 5, "transfer_types": ["external"]}
+]
+
+# Scheduled transfer worker
+WORKER_ID = str(uuid.uuid4())
+SCHEDULER_INTERVAL_SECONDS = int(os.environ.get('SCHEDULER_INTERVAL_SECONDS', 30))
+SCHEDULER_BATCH_SIZE = 200
+SCHEDULER_LEASE_SECONDS = 300
+SCHEDULER_CONCURRENCY = 10
+SCHEDULE_FREQUENCIES = ["once", "daily", "weekly", "monthly"]
+
+# Outbound wire settlement files
+BANK_NAME = "Prominence Bank"
+BANK_BIC = "PROMGB2L"
+SETTLEMENT_DIR = Path(os.environ.get('SETTLEMENT_DIR', ROOT_DIR / 'settlements'))
+SETTLEMENT_CHUNK_SIZE = 1000
+# Admin status changes; completed, rejected and cancelled are final
+TRANSFER_TRANSITIONS = {
+    "pending": {"processing", "approved", "completed", "rejected", "cancelled"},
+    "processing": {"pending", "approved", "completed", "rejected", "cancelled"},
+    "approved": {"completed", "rejected", "cancelled"}
+}
+# Held by the worker writing a batch file; a batch whose lease lapsed can be regenerated
+SETTLEMENT_LEASE_SECONDS = 300
+
+# Holds and blocks
+HOLD_DEFAULT_TTL_HOURS = 7 * 24
+HOLD_SWEEP_INTERVAL_SECONDS = int(os.environ.get('HOLD_SWEEP_INTERVAL_SECONDS', 60))
+HOLD_SWEEP_BATCH_SIZE = 500
+HOLD_REPAIR_AFTER_SECONDS = 300
+HOLD_BALANCE_FIELDS = {"hold": "held_balance", "block": "blocked_balance"}
+
+# Month-end statements
+STATEMENT_DIR = Path(os.environ.get('STATEMENT_DIR', ROOT_DIR / 'statements'))
+STATEMENT_CHUNK_SIZE = 50
+STATEMENT_LEASE_SECONDS = 600
+
+# Audit logs are written to monthly partitions; old months are archived to disk
+AUDIT_LEGACY_COLLECTION = "audit_logs"
+AUDIT_PARTITION_PATTERN = r"^audit_logs_\d{4}_\d{2}$"
+AUDIT_HOT_MONTHS = int(os.environ.get('AUDIT_HOT_MONTHS', 3))
+AUDIT_ARCHIVE_DIR = Path(os.environ.get('AUDIT_ARCHIVE_DIR', ROOT_DIR / 'audit_archive'))
+AUDIT_ARCHIVE_INTERVAL_SECONDS = 24 * 3600
+AUDIT_BATCH_SIZE = 1000
+# Workers cache the partition list; it is reloaded at month rollover and on this interval
+AUDIT_PARTITION_REFRESH_SECONDS = 300
+
+# Instrument listing and content cache
+INSTRUMENT_PAGE_SIZE = 50
+INSTRUMENT_MAX_PAGE_SIZE = 100
+INSTRUMENT_PREVIEW_CHARS = 160
+INSTRUMENT_CACHE_SIZE = 256
+INSTRUMENT_CACHE_CONTROL = "private, no-cache"
+
+# Conditional GET: how long a worker trusts its in-memory resource versions
+RESOURCE_VERSION_TTL_SECONDS = 10
+
+# Instrument rendering
+INSTRUMENT_PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}|\[([A-Za-z][A-Za-z ]*)\]")
+INSTRUMENT_ISSUE_CHUNK_SIZE = 200
+PDF_LINES_PER_PAGE = 60
+PDF_LINE_WIDTH = 90
+
+# Ticket threads
+TICKET_PAGE_SIZE = 50
+TICKET_MAX_PAGE_SIZE = 100
+TICKET_MESSAGE_PAGE_SIZE = 50
+TICKET_MESSAGE_MAX_PAGE_SIZE = 200
+TICKET_STATUSES = ["open", "in_progress", "resolved", "closed"]
+
+# Customer search
+CUSTOMER_SEARCH_PAGE_SIZE = 25
+CUSTOMER_SEARCH_MAX_PAGE_SIZE = 100
+CUSTOMER_COUNT_LIMIT = 10000
+CUSTOMER_COUNT_CACHE_SECONDS = 60
+CUSTOMER_COUNT_CACHE_SIZE = 1000
+CUSTOMER_OVERVIEW_ITEMS = 10
+
+# Transaction rollups; rejected, cancelled and redacted transactions are not counted
+ROLLUP_EXCLUDED_STATUSES = ["rejected", "cancelled", "failed"]
+ROLLUP_REBUILD_LEASE_SECONDS = 3600
+
+# Request tracing: spans are exported as OTLP/JSON lines, one trace per line
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+TRACE_EXPORT_PATH = Path(os.environ.get('TRACE_EXPORT_PATH', ROOT_DIR / 'traces' / 'traces.jsonl'))
+TRACE_EXPORT_MAX_BYTES = 50 * 1024 * 1024
+TRACE_EXPORT_BACKUPS = 3
+TRACE_SERVICE_NAME = "prominence-bank-api"
+# Long jobs (statement runs, rollup rebuilds) open a span per query; keep the first N
+TRACE_MAX_SPANS = 1000
 
 # Create the main app
 app = FastAPI(title="Prominence Bank API", version="1.0.0")
@@ -41,10 +210,296 @@ app = FastAPI(title="Prominence Bank API", version="1.0.0")
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# ==================== LOGGING AND TRACING ====================
+
+# Request-scoped state; tasks started while handling a request inherit a copy
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+current_span_var: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request and span ids; runs in the emitting task, before the queue"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = current_span_var.get()
+        record.request_id = request_id_var.get()
+        record.trace_id = span.trace.trace_id if span else None
+        record.span_id = span.span_id if span else None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for field in ("request_id", "trace_id", "span_id"):
+            if getattr(record, field, None):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def start_queue_listener(logger_name: Optional[str], *handlers: logging.Handler) -> QueueListener:
+    """Route a logger through a QueueHandler so the event loop never waits on stream or file I/O"""
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    target = logging.getLogger(logger_name)
+    target.handlers = [queue_handler]
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(JsonFormatter())
+logging.getLogger().setLevel(logging.INFO)
+log_listener = start_queue_listener(None, log_stream_handler)
 logger = logging.getLogger(__name__)
 
+# Finished traces are written by their own listener thread as OTLP/JSON
+trace_logger = logging.getLogger("server.traces")
+trace_logger.propagate = False
+trace_logger.setLevel(logging.INFO)
+if TRACING_ENABLED:
+    TRACE_EXPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    trace_file_handler = RotatingFileHandler(
+        TRACE_EXPORT_PATH, maxBytes=TRACE_EXPORT_MAX_BYTES, backupCount=TRACE_EXPORT_BACKUPS
+    )
+    trace_file_handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_listener = start_queue_listener("server.traces", trace_file_handler)
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_attributes(attributes: dict) -> List[dict]:
+    return [{"key": k, "value": otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+class Trace:
+    """Spans of one request (or background job run), exported together when the root ends"""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans: List["Span"] = []
+        self.dropped_spans = 0
+
+    def add(self, span: "Span"):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def export(self):
+        if self.dropped_spans:
+            self.spans[0].attributes["trace.dropped_spans"] = self.dropped_spans
+        trace_logger.info(json.dumps({"resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": TRACE_SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [span.to_otlp() for span in self.spans]
+            }]
+        }]}, default=str))
+
+class Span:
+    # OTLP SpanKind values
+    KIND_INTERNAL = 1
+    KIND_SERVER = 2
+    KIND_CLIENT = 3
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], kind: int, attributes: dict, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.error = None
+        trace.add(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": otlp_attributes(self.attributes),
+            # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+@contextlib.contextmanager
+def span(name: str, kind: int = Span.KIND_INTERNAL, start_ns: Optional[int] = None, **attributes):
+    """Time a stage of the current trace; a no-op outside a traced request or job"""
+    parent = current_span_var.get()
+    if parent is None:
+        yield None
+        return
+    current = Span(parent.trace, name, parent, kind, attributes, start_ns)
+    token = current_span_var.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        current_span_var.reset(token)
+
+@contextlib.contextmanager
+def root_span(name: str, kind: int = Span.KIND_INTERNAL, trace_id: Optional[str] = None, **attributes):
+    """Start a new trace; it is exported when the root span ends"""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    current = Span(Trace(trace_id), name, None, kind, attributes)
+    token = current_span_var.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        # The request middleware ends its root when the response is sent
+        current.end_ns = current.end_ns or time.time_ns()
+        current_span_var.reset(token)
+        current.trace.export()
+
+async def traced_await(awaitable, name: str, start_ns: int, attributes: dict):
+    with span(name, Span.KIND_CLIENT, start_ns, **attributes):
+        return await awaitable
+
+class TracedCursor:
+    """Cursor wrapper: chaining returns the wrapper, awaited calls (to_list) get a span"""
+
+    def __init__(self, cursor, name: str, attributes: dict):
+        self._cursor = cursor
+        self._name = name
+        self._attributes = attributes
+
+    def __getattr__(self, attr: str):
+        method = getattr(self._cursor, attr)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            start_ns = time.time_ns()
+            result = method(*args, **kwargs)
+            if result is self._cursor:
+                return self
+            if inspect.isawaitable(result):
+                return traced_await(result, self._name, start_ns, self._attributes)
+            return result
+        return call
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+class TracedCollection:
+    """Collection wrapper adding a client span per database call while a trace is active"""
+
+    def __init__(self, collection, name: str):
+        self._collection = collection
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        method = getattr(self._collection, attr)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            if current_span_var.get() is None:
+                return method(*args, **kwargs)
+            start_ns = time.time_ns()
+            result = method(*args, **kwargs)
+            name = f"mongodb.{self._name}.{attr}"
+            attributes = {"db.system": "mongodb", "db.mongodb.collection": self._name, "db.operation": attr}
+            if inspect.isawaitable(result):
+                return traced_await(result, name, start_ns, attributes)
+            if hasattr(result, "to_list"):
+                return TracedCursor(result, name, attributes)
+            return result
+        return call
+
+class TracedDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name: str) -> TracedCollection:
+        return TracedCollection(self._database[name], name)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._database, name)
+        return TracedCollection(attr, name) if hasattr(attr, "insert_one") else attr
+
+if TRACING_ENABLED:
+    db = TracedDatabase(db)
+
+class RequestTracingMiddleware:
+    """Assign a request id (or honour X-Request-ID), open the root span and log one access line"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        request_token = request_id_var.set(request_id)
+        status_code = 500
+        started = time.perf_counter()
+        finished = None
+        root = None
+
+        async def send_with_request_id(message):
+            nonlocal status_code, finished
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and finished is None:
+                # BackgroundTasks run after this inside self.app; they are not part of the request
+                finished = time.perf_counter()
+                if root is not None:
+                    root.end_ns = time.time_ns()
+
+        try:
+            with root_span(
+                f"{scope['method']} {scope['path']}", Span.KIND_SERVER,
+                **{"http.method": scope["method"], "http.target": scope["path"], "http.request_id": request_id}
+            ) as root:
+                try:
+                    await self.app(scope, receive, send_with_request_id)
+                finally:
+                    if root is not None:
+                        route = scope.get("route")
+                        if route is not None:
+                            root.name = f"{scope['method']} {route.path}"
+                            root.attributes["http.route"] = route.path
+                        root.attributes["http.status_code"] = status_code
+                    logger.info(
+                        "%s %s %s %.1fms", scope["method"], scope["path"], status_code,
+                        ((finished or time.perf_counter()) - started) * 1000
+                    )
+        finally:
+            request_id_var.reset(request_token)
+
 # ==================== MODELS ====================
 
 # Currency list
@@ -144,6 +599,66 @@ class TransactionResponse(BaseModel):
     created_at: str
     is_redacted: bool = False
 
+class AdminTransactionResponse(TransactionResponse):
+    beneficiary_id: Optional[str] = None
+    scheduled_transfer_id: Optional[str] = None
+    risk_review: Optional[list] = None
+    notes: Optional[str] = None
+    settlement_batch_id: Optional[str] = None
+    settled_at: Optional[str] = None
+    redacted_by: Optional[str] = None
+    redacted_at: Optional[str] = None
+
+class AuditLogResponse(BaseModel):
+    id: str
+    user_id: Optional[str] = None
+    action: str
+    details: dict = {}
+    ip_address: Optional[str] = None
+    timestamp: str
+    changes: Optional[List[dict]] = None
+    entity: Optional[dict] = None
+    entity_key: Optional[str] = None
+    # Entries written before field-level patches carry full documents
+    before: Optional[dict] = None
+    after: Optional[dict] = None
+
+class VelocityRule(BaseModel):
+    name: str
+    scope: str  # account, user
+    metric: str  # amount, count, new_beneficiary_count
+    window_seconds: int
+    review_at: Optional[float] = None
+    deny_at: Optional[float] = None
+    transfer_types: List[str] = ["internal", "external"]
+
+class VelocityRules(BaseModel):
+    rules: List[VelocityRule]
+
+class ScheduledTransferCreate(TransactionBase):
+    from_account_id: str
+    to_account_id: str
+    frequency: str = "once"  # once, daily, weekly, monthly
+    start_at: str
+    end_at: Optional[str] = None
+
+class ScheduledTransferResponse(BaseModel):
+    id: str
+    user_id: str
+    from_account_id: str
+    to_account_id: str
+    amount: float
+    currency: str
+    description: Optional[str] = None
+    frequency: str
+    next_run_at: Optional[str] = None
+    end_at: Optional[str] = None
+    status: str
+    run_count: int = 0
+    last_run_at: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: str
+
 # Beneficiary Models
 class BeneficiaryBase(BaseModel):
     name: str
@@ -190,6 +705,22 @@ class InstrumentResponse(BaseModel):
     status: str
     created_by: str
     created_at: str
+    version: int = 1
+
+class InstrumentIssue(BaseModel):
+    recipient_ids: List[str] = []  # empty issues to every active client
+    format: str = "pdf"  # pdf, text
+
+class InstrumentSummary(BaseModel):
+    id: str
+    title: str
+    instrument_type: str
+    preview: str = ""
+    amount: Optional[float] = None
+    currency: Optional[str] = None
+    status: str
+    created_at: str
+    version: int = 1
 
 # Ticket Models
 class TicketBase(BaseModel):
@@ -208,14 +739,58 @@ class TicketResponse(BaseModel):
     category: str
     status: str
     created_at: str
-    responses: List[Dict] = []
+    last_message_at: Optional[str] = None
+    message_count: int = 0
+    unread_count: int = 0
+
+class TicketMessageCreate(BaseModel):
+    message: str
+
+class TicketMessageResponse(BaseModel):
+    id: str
+    ticket_id: str
+    sender: str  # client, admin
+    author_id: str
+    message: str
+    created_at: str
+
+class AdminTicketUpdate(BaseModel):
+    status: str
 
 # Admin Models
+class RollupPoint(BaseModel):
+    period: str
+    count: int = 0
+    inflow: float = 0.0
+    outflow: float = 0.0
+    by_type: Dict[str, Dict[str, float]] = {}
+
+class RollupChart(BaseModel):
+    scope: str  # account, currency
+    key: str
+    granularity: str  # day, month
+    points: List[RollupPoint]
+
+class CustomerOverview(BaseModel):
+    profile: UserResponse
+    accounts: List[AccountResponse]
+    recent_transactions: List[TransactionResponse]
+    pending_wires: List[TransactionResponse]
+    beneficiaries: List[BeneficiaryResponse]
+    open_tickets: List[TicketResponse]
+    recent_audit_events: List[Dict]
+
 class AdminCustomerUpdate(BaseModel):
     status: Optional[str] = None
     kyc_status: Optional[str] = None
     notes: Optional[str] = None
 
+class ImportAccount(AccountBase):
+    initial_balance: float = 0.0
+
+class ImportRecord(UserCreate):
+    accounts: List[ImportAccount] = []
+
 class AdminTransferUpdate(BaseModel):
     status: str
     notes: Optional[str] = None
@@ -229,6 +804,37 @@ class AdminSettings(BaseModel):
     otp_expiry_minutes: Optional[int] = 5
     max_otp_attempts: Optional[int] = 3
 
+class SettlementBatchCreate(BaseModel):
+    currency: str
+    cutoff: Optional[str] = None
+    file_format: str = "xml"  # xml (pain.001), csv
+
+class HoldCreate(BaseModel):
+    amount: float
+    kind: str = "hold"  # hold, block
+    reason: str
+    expires_at: Optional[str] = None  # holds default to HOLD_DEFAULT_TTL_HOURS; blocks never expire unless set
+
+class HoldCapture(BaseModel):
+    amount: Optional[float] = None  # defaults to the full hold; any remainder is released
+
+class HoldResponse(BaseModel):
+    id: str
+    account_id: str
+    kind: str
+    amount: float
+    currency: str
+    reason: str
+    reference: str
+    status: str  # active, released, captured, expired
+    expires_at: Optional[str] = None
+    captured_amount: Optional[float] = None
+    created_at: str
+    closed_at: Optional[str] = None
+
+class StatementRunCreate(BaseModel):
+    period: str  # YYYY-MM
+
 class FundingInstructions(BaseModel):
     content: str
     version: Optional[int] = None
@@ -254,8 +860,82 @@ class CryptoWalletSettings(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 
-def generate_account_number():
-    return ''.join(random.choices(string.digits, k=12))
+def luhn_check_digit(digits: str) -> str:
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        n = int(d)
+        if i % 2 == 0:
+            n *= 2
+            if n > 9:
+                n -= 9
+        total += n
+    return str((10 - total % 10) % 10)
+
+class AccountNumberAllocator:
+    """Hands out account numbers from blocks reserved on a Mongo sequence (hi/lo)"""
+
+    def __init__(self, sequence: str, block_size: int):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._next = 0
+        self._limit = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve_block(self):
+        counter = await db.counters.find_one_and_update(
+            {"_id": self.sequence},
+            {"$inc": {"value": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._limit = ACCOUNT_NUMBER_BASE + counter["value"]
+        self._next = self._limit - self.block_size
+
+    async def next_value(self) -> int:
+        async with self._lock:
+            if self._next >= self._limit:
+                await self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+account_number_allocator = AccountNumberAllocator("account_number", ACCOUNT_NUMBER_BLOCK_SIZE)
+
+async def generate_account_number() -> str:
+    base = str(await account_number_allocator.next_value())
+    return base + luhn_check_digit(base)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS)
+    return _process_pool
+
+def hash_password(password: str) -> str:
+    with span("password.hash"):
+        return pwd_context.hash(password)
+
+def verify_password(password: str, password_hash: str) -> bool:
+    with span("password.verify"):
+        return pwd_context.verify(password, password_hash)
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    return [pwd_context.hash(p) for p in passwords]
+
+async def hash_passwords_parallel(passwords: List[str]) -> List[str]:
+    """Hash passwords across the process pool, preserving order"""
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    chunk_size = max(1, -(-len(passwords) // PROCESS_POOL_WORKERS))
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    with span("password.hash_batch", count=len(passwords)):
+        results = await asyncio.gather(*[
+            loop.run_in_executor(get_process_pool(), hash_passwords, chunk) for chunk in chunks
+        ])
+    return [h for chunk in results for h in chunk]
 
 def generate_reference():
     return f"PB{datetime.now(timezone.utc).strftime('%Y%m%d')}{uuid.uuid4().hex[:8].upper()}"
@@ -266,22 +946,120 @@ def generate_otp():
 def hash_otp(otp: str) -> str:
     return hashlib.sha256(otp.encode()).hexdigest()
 
-def create_token(user_id: str, role: str) -> str:
+def create_token(user_id: str, role: str, token_version: int = 0) -> str:
+    now = datetime.now(timezone.utc)
     payload = {
         "user_id": user_id,
         "role": role,
-        "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+        "jti": uuid.uuid4().hex,
+        # Bumping users.token_version invalidates every token issued before it
+        "ver": token_version,
+        "iat": now,
+        "exp": now + timedelta(hours=JWT_EXPIRATION_HOURS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+class TokenRevocations:
+    """In-memory mirror of db.token_revocations, so checking a token needs no round trip.
+
+    Single tokens are keyed by jti; "revoke all" raises a per-user minimum token
+    version. Entries are dropped once every token they could match has expired.
+    """
+
+    def __init__(self):
+        self.jtis: Dict[str, float] = {}
+        self.user_versions: Dict[str, tuple] = {}
+        self.synced_at: Optional[str] = None
+
+    def apply(self, doc: dict):
+        if doc["type"] == "token":
+            self.jtis[doc["jti"]] = doc["exp"]
+        else:
+            version, _ = self.user_versions.get(doc["user_id"], (0, 0))
+            if doc["token_version"] >= version:
+                self.user_versions[doc["user_id"]] = (doc["token_version"], doc["exp"])
+        if self.synced_at is None or doc["revoked_at"] > self.synced_at:
+            self.synced_at = doc["revoked_at"]
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload["jti"] in self.jtis:
+            return True
+        version = self.user_versions.get(payload["user_id"])
+        return version is not None and payload.get("ver", 0) < version[0]
+
+    def prune(self):
+        now = time.time()
+        self.jtis = {jti: exp for jti, exp in self.jtis.items() if exp > now}
+        self.user_versions = {u: v for u, v in self.user_versions.items() if v[1] > now}
+
+token_revocations = TokenRevocations()
+token_cache: "OrderedDict[str, dict]" = OrderedDict()
+
 def verify_token(token: str) -> dict:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(key)
+    if payload is not None and payload["exp"] > time.time():
+        token_cache.move_to_end(key)
+    else:
+        token_cache.pop(key, None)
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        # Tokens issued before jti existed are revoked by their hash
+        payload.setdefault("jti", key)
+        token_cache[key] = payload
+        if len(token_cache) > TOKEN_CACHE_SIZE:
+            token_cache.popitem(last=False)
+    if token_revocations.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return payload
+
+async def store_revocation(doc: dict):
+    doc["revoked_at"] = datetime.now(timezone.utc).isoformat()
+    # TTL index removes the record once no token it covers can still be valid
+    doc["expires_at"] = datetime.fromtimestamp(doc["exp"], timezone.utc)
+    await db.token_revocations.update_one({"_id": doc["_id"]}, {"$set": doc}, upsert=True)
+    token_revocations.apply(doc)
+
+async def revoke_token(payload: dict):
+    await store_revocation({
+        "_id": f"token:{payload['jti']}",
+        "type": "token",
+        "jti": payload["jti"],
+        "user_id": payload["user_id"],
+        "exp": payload["exp"]
+    })
+
+async def revoke_user_tokens(user_id: str) -> tuple:
+    """Invalidate every token issued to the user so far; new logins get the next version.
+
+    Returns the (before, after) token_version fields for the caller's audit entry.
+    """
+    before = await db.users.find_one_and_update(
+        {"id": user_id}, {"$inc": {"token_version": 1}},
+        projection={"_id": 0, "token_version": 1}, return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    after = {"token_version": before.get("token_version", 0) + 1}
+    await store_revocation({
+        "_id": f"user:{user_id}",
+        "type": "user",
+        "user_id": user_id,
+        "token_version": after["token_version"],
+        "exp": time.time() + JWT_EXPIRATION_HOURS * 3600
+    })
+    return before, after
+
+async def sync_token_revocations():
+    """Pick up revocations made by other workers; the change stream does this sooner when available"""
+    query = {"revoked_at": {"$gte": token_revocations.synced_at}} if token_revocations.synced_at else {}
+    async for doc in db.token_revocations.find(query):
+        token_revocations.apply(doc)
+    token_revocations.prune()
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     payload = verify_token(credentials.credentials)
@@ -290,24 +1068,149 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+async def get_stream_user(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """EventSource cannot send headers, so the token may also come as a query parameter"""
+    raw_token = credentials.credentials if credentials else token
+    if not raw_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=raw_token))
+
 async def get_admin_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     user = await get_current_user(credentials)
     if user["role"] not in ["admin", "super_admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     return user
 
-async def log_audit(user_id: str, action: str, details: dict, before: dict = None, after: dict = None):
+def audit_partition_name(timestamp: str) -> str:
+    return f"audit_logs_{timestamp[:4]}_{timestamp[5:7]}"
+
+def audit_partition_month(name: str) -> str:
+    return name[-7:].replace("_", "-")
+
+indexed_audit_partitions: set = set()
+
+async def get_audit_partition(name: str):
+    collection = db[name]
+    if name not in indexed_audit_partitions:
+        await collection.create_index([("timestamp", -1)])
+        await collection.create_index([("user_id", 1), ("timestamp", -1)])
+        await collection.create_index([("action", 1), ("timestamp", -1)])
+        await collection.create_index([("entity_key", 1), ("timestamp", -1)], sparse=True)
+        indexed_audit_partitions.add(name)
+        audit_partition_cache["names"].add(name)
+    return collection
+
+def escape_pointer(key) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+def unescape_pointer(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+def diff_documents(before: dict, after: dict, path: str = "") -> List[dict]:
+    """JSON Patch from before to after; replace/remove ops also keep the old value so they can be reverted"""
+    ops = []
+    for key in sorted(before.keys() - after.keys()):
+        ops.append({"op": "remove", "path": f"{path}/{escape_pointer(key)}", "old": before[key]})
+    for key in sorted(after.keys()):
+        pointer = f"{path}/{escape_pointer(key)}"
+        if key not in before:
+            ops.append({"op": "add", "path": pointer, "value": after[key]})
+        elif isinstance(before[key], dict) and isinstance(after[key], dict):
+            ops.extend(diff_documents(before[key], after[key], pointer))
+        elif before[key] != after[key]:
+            ops.append({"op": "replace", "path": pointer, "value": after[key], "old": before[key]})
+    return ops
+
+def revert_patch(document: dict, patch: List[dict]) -> dict:
+    """Undo a patch produced by diff_documents, returning the earlier document"""
+    doc = copy.deepcopy(document)
+    for op in reversed(patch):
+        keys = [unescape_pointer(k) for k in op["path"].split("/")[1:]]
+        target = doc
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        if op["op"] == "add":
+            target.pop(keys[-1], None)
+        else:
+            target[keys[-1]] = copy.deepcopy(op["old"])
+    return doc
+
+def audit_entity_key(entity: dict) -> str:
+    return f"{entity['collection']}:{json.dumps(entity['filter'], sort_keys=True)}"
+
+async def log_audit(
+    user_id: str,
+    action: str,
+    details: dict,
+    before: dict = None,
+    after: dict = None,
+    entity: dict = None
+):
+    """Record an audit entry; state changes are stored as a field-level patch, not full documents.
+
+    `entity` ({"collection": ..., "filter": ...}) identifies the changed document so
+    reconstruct_audit_states can rebuild full before/after states on demand. Every
+    write to an entity's audited fields must go through here, or the rebuilt states drift.
+    """
+    with span("audit.write", **{"audit.action": action}):
+        await write_audit_entries([audit_entry(user_id, action, details, before, after, entity)])
+
+def audit_entry(user_id: str, action: str, details: dict, before: dict = None, after: dict = None, entity: dict = None) -> dict:
     audit = {
         "id": str(uuid.uuid4()),
         "user_id": user_id,
         "action": action,
         "details": details,
-        "before": before,
-        "after": after,
         "ip_address": None,
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
-    await db.audit_logs.insert_one(audit)
+    if before is not None or after is not None:
+        audit["changes"] = diff_documents(strip_audit_excluded(before), strip_audit_excluded(after))
+    if entity:
+        audit["entity"] = entity
+        audit["entity_key"] = audit_entity_key(entity)
+    return audit
+
+async def write_audit_entries(audits: List[dict]):
+    by_partition: Dict[str, List[dict]] = {}
+    for audit in audits:
+        by_partition.setdefault(audit_partition_name(audit["timestamp"]), []).append(audit)
+    for name, docs in by_partition.items():
+        partition = await get_audit_partition(name)
+        await partition.insert_many(docs)
+
+def normalize_search_text(value: Optional[str]) -> str:
+    """Lowercase, strip accents and collapse whitespace so prefix queries can use an index"""
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return " ".join(value.lower().split())
+
+def normalize_phone(value: Optional[str]) -> str:
+    return re.sub(r"\D", "", value or "")
+
+def customer_search_keys(user: dict) -> dict:
+    first_name = normalize_search_text(user.get("first_name"))
+    last_name = normalize_search_text(user.get("last_name"))
+    return {
+        "search_email": normalize_search_text(user.get("email")),
+        # Both name orders so "doe" and "john d" are prefix matches
+        "search_names": list(dict.fromkeys([f"{first_name} {last_name}".strip(), f"{last_name} {first_name}".strip()])),
+        "search_phone": normalize_phone(user.get("phone"))
+    }
+
+async def backfill_customer_search_keys():
+    """Add normalized search keys to users created before customer search existed"""
+    updates = []
+    async for user in db.users.find({"search_email": {"$exists": False}}, {"_id": 0, "id": 1, "email": 1, "first_name": 1, "last_name": 1, "phone": 1}):
+        updates.append(UpdateOne({"id": user["id"]}, {"$set": customer_search_keys(user)}))
+        if len(updates) >= IMPORT_BATCH_SIZE:
+            await db.users.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db.users.bulk_write(updates, ordered=False)
 
 async def send_otp_email(email: str, otp: str, purpose: str):
     """Send OTP via configured SMTP"""
@@ -315,7 +1218,7 @@ async def send_otp_email(email: str, otp: str, purpose: str):
     
     if not settings or not settings.get("smtp_host"):
         # For development/testing: Use demo OTP
-        logger.info(f"[DEMO MODE] Using demo OTP 123456 for {email} ({purpose})")
+        logger.info("[DEMO MODE] Using demo OTP 123456 for %s (%s)", email, purpose)
         return True  # For development, allow without SMTP
     
     try:
@@ -338,17 +1241,844 @@ async def send_otp_email(email: str, otp: str, purpose: str):
         """
         msg.attach(MIMEText(body, 'plain'))
         
-        server = smtplib.SMTP(settings['smtp_host'], settings.get('smtp_port', 587))
-        server.starttls()
-        if settings.get('smtp_user') and settings.get('smtp_password'):
-            server.login(settings['smtp_user'], settings['smtp_password'])
-        server.send_message(msg)
-        server.quit()
+        with span("smtp.send", Span.KIND_CLIENT, **{"smtp.host": settings['smtp_host'], "otp.purpose": purpose}):
+            server = smtplib.SMTP(settings['smtp_host'], settings.get('smtp_port', 587))
+            server.starttls()
+            if settings.get('smtp_user') and settings.get('smtp_password'):
+                server.login(settings['smtp_user'], settings['smtp_password'])
+            server.send_message(msg)
+            server.quit()
         return True
     except Exception as e:
-        logger.error(f"Failed to send OTP email: {e}")
+        logger.error("Failed to send OTP email: %s", e)
+        return False
+
+# ==================== SPARSE FIELDSETS ====================
+
+# `fields=a,b,c` on list endpoints: validated against the resource's response
+# model, pushed into the Mongo projection, and serialized through a partial
+# copy of the model so only those fields are fetched, validated and sent.
+
+SPARSE_MODEL_CACHE_SIZE = 256
+sparse_adapters: "OrderedDict[tuple, TypeAdapter]" = OrderedDict()
+
+def parse_fields(fields: Optional[str], model: type) -> Optional[List[str]]:
+    """Requested field names, or None for the full document; id is always included"""
+    if not fields:
+        return None
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in model.model_fields]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(model.model_fields)}"
+        )
+    return ["id"] + [f for f in requested if f != "id"]
+
+def fields_projection(fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return {"_id": 0}
+    return {"_id": 0, **{f: 1 for f in fields}}
+
+def sparse_response(items: List[dict], model: type, fields: List[str]) -> Response:
+    key = (model, tuple(fields))
+    adapter = sparse_adapters.get(key)
+    if adapter is None:
+        partial = create_model(
+            f"{model.__name__}Fields",
+            **{f: (Optional[model.model_fields[f].annotation], None) for f in fields}
+        )
+        adapter = sparse_adapters[key] = TypeAdapter(List[partial])
+        if len(sparse_adapters) > SPARSE_MODEL_CACHE_SIZE:
+            sparse_adapters.popitem(last=False)
+    else:
+        sparse_adapters.move_to_end(key)
+    return Response(adapter.dump_json(adapter.validate_python(items)), media_type="application/json")
+
+# ==================== LEDGER ====================
+
+def system_account(name: str, currency: str) -> str:
+    return f"system:{name}:{currency}"
+
+def ledger_entry(account_id: str, balance: str, amount: float, currency: str) -> dict:
+    return {"account_id": account_id, "balance": balance, "amount": amount, "currency": currency}
+
+def build_ledger_posting(entries: List[dict], reference: str, description: str, posting_id: Optional[str] = None) -> List[dict]:
+    """Turn balanced entries into ledger documents sharing one posting id.
+
+    Pass a posting_id derived from the business event to make the posting
+    idempotent: (posting_id, leg) is unique, so a retry inserts nothing twice.
+    """
+    totals = {}
+    for entry in entries:
+        totals[entry["currency"]] = totals.get(entry["currency"], 0.0) + entry["amount"]
+    if any(abs(total) > 1e-9 for total in totals.values()):
+        raise ValueError(f"Unbalanced ledger posting {reference}: {totals}")
+    
+    posting_id = posting_id or str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "posting_id": posting_id,
+            "leg": leg,
+            "reference": reference,
+            "description": description,
+            "created_at": now,
+            **entry
+        }
+        for leg, entry in enumerate(entries)
+    ]
+
+async def insert_ledger_documents(documents: List[dict]) -> bool:
+    """Insert ledger documents; False when every rejected leg was already posted"""
+    try:
+        await db.ledger.insert_many(documents, ordered=False)
+        return True
+    except BulkWriteError as e:
+        if any(err["code"] != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        return False
+
+async def post_ledger(entries: List[dict], reference: str, description: str, posting_id: Optional[str] = None) -> bool:
+    return await insert_ledger_documents(build_ledger_posting(entries, reference, description, posting_id))
+
+def opening_balance_entries(account_id: str, currency: str, balances: dict) -> List[dict]:
+    entries = []
+    for field, amount in balances.items():
+        if amount:
+            entries.append(ledger_entry(account_id, field, amount, currency))
+            entries.append(ledger_entry(system_account("opening_balance", currency), "available_balance", -amount, currency))
+    return entries
+
+async def get_account_balances(account_id: str, as_of: Optional[str] = None) -> dict:
+    """Balances as of a point in time: latest snapshot plus the ledger tail after it"""
+    snapshot_query = {"account_id": account_id}
+    if as_of:
+        snapshot_query["as_of"] = {"$lte": as_of}
+    snapshot = await db.balance_snapshots.find_one(snapshot_query, {"_id": 0}, sort=[("as_of", -1)])
+    
+    balances = dict.fromkeys(BALANCE_FIELDS, 0.0)
+    tail_query = {"account_id": account_id}
+    if snapshot:
+        balances.update(snapshot["balances"])
+        tail_query["created_at"] = {"$gt": snapshot["as_of"]}
+    if as_of:
+        tail_query["created_at"] = {**tail_query.get("created_at", {}), "$lte": as_of}
+    
+    tail = await db.ledger.aggregate([
+        {"$match": tail_query},
+        {"$group": {"_id": "$balance", "total": {"$sum": "$amount"}}}
+    ]).to_list(None)
+    for row in tail:
+        balances[row["_id"]] = round(balances.get(row["_id"], 0.0) + row["total"], 2)
+    return balances
+
+@contextlib.asynccontextmanager
+async def account_debit_lock(account_id: str):
+    """Serialize debits per account so a balance check and its posting cannot interleave"""
+    name = f"debit:{account_id}"
+    deadline = time.monotonic() + DEBIT_LOCK_WAIT_SECONDS
+    while not await acquire_job_lease(name, DEBIT_LOCK_SECONDS):
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=409, detail="Another payment from this account is in progress")
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        await release_job_lease(name)
+
+async def with_live_balances(accounts: List[dict]) -> List[dict]:
+    """get_account_balances for a page of accounts in one snapshot query and one ledger aggregation"""
+    if not accounts:
+        return []
+    account_ids = [acc["id"] for acc in accounts]
+    snapshots = await db.balance_snapshots.aggregate([
+        {"$match": {"account_id": {"$in": account_ids}}},
+        {"$sort": {"as_of": -1}},
+        {"$group": {"_id": "$account_id", "as_of": {"$first": "$as_of"}, "balances": {"$first": "$balances"}}}
+    ]).to_list(None)
+    balances = {aid: dict.fromkeys(BALANCE_FIELDS, 0.0) for aid in account_ids}
+    tail_filters = []
+    snapshot_as_of = {}
+    for snapshot in snapshots:
+        balances[snapshot["_id"]].update(snapshot["balances"])
+        snapshot_as_of[snapshot["_id"]] = snapshot["as_of"]
+        tail_filters.append({"account_id": snapshot["_id"], "created_at": {"$gt": snapshot["as_of"]}})
+    unsnapshotted = [aid for aid in account_ids if aid not in snapshot_as_of]
+    if unsnapshotted:
+        tail_filters.append({"account_id": {"$in": unsnapshotted}})
+    
+    tail = await db.ledger.aggregate([
+        {"$match": {"account_id": {"$in": account_ids}, "$or": tail_filters}},
+        {"$group": {"_id": {"account_id": "$account_id", "balance": "$balance"}, "total": {"$sum": "$amount"}}}
+    ]).to_list(None)
+    for row in tail:
+        account_balances = balances[row["_id"]["account_id"]]
+        field = row["_id"]["balance"]
+        account_balances[field] = round(account_balances.get(field, 0.0) + row["total"], 2)
+    return [{**acc, **balances[acc["id"]]} for acc in accounts]
+
+async def bootstrap_ledger_snapshots():
+    """Seed an opening snapshot from the stored balances of accounts that predate the ledger"""
+    async for account in db.accounts.find({"ledger_bootstrapped": {"$ne": True}}, {"_id": 0}):
+        await db.balance_snapshots.update_one(
+            {"account_id": account["id"], "as_of": ""},
+            {"$setOnInsert": {
+                "balances": {f: account.get(f, 0.0) for f in BALANCE_FIELDS},
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True
+        )
+        await db.accounts.update_one({"id": account["id"]}, {"$set": {"ledger_bootstrapped": True}})
+
+async def write_balance_snapshots():
+    """Snapshot every account with ledger activity since the previous run"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=LEDGER_SNAPSHOT_SETTLE_SECONDS)).isoformat()
+    state = await db.counters.find_one({"_id": "ledger_snapshot"})
+    since = state["as_of"] if state else ""
+    
+    cursor = db.ledger.aggregate([
+        {"$match": {"created_at": {"$gt": since, "$lte": cutoff}}},
+        {"$group": {"_id": "$account_id"}}
+    ], allowDiskUse=True)
+    account_ids = []
+    async for row in cursor:
+        account_ids.append(row["_id"])
+        if len(account_ids) >= LEDGER_SNAPSHOT_BATCH_SIZE:
+            await snapshot_accounts(account_ids, cutoff)
+            account_ids = []
+    if account_ids:
+        await snapshot_accounts(account_ids, cutoff)
+    
+    await db.counters.update_one({"_id": "ledger_snapshot"}, {"$set": {"as_of": cutoff}}, upsert=True)
+
+async def snapshot_accounts(account_ids: List[str], as_of: str):
+    balances = await asyncio.gather(*[get_account_balances(aid, as_of) for aid in account_ids])
+    now = datetime.now(timezone.utc).isoformat()
+    await db.balance_snapshots.bulk_write([
+        UpdateOne(
+            {"account_id": aid, "as_of": as_of},
+            {"$set": {"balances": b, "created_at": now}},
+            upsert=True
+        )
+        for aid, b in zip(account_ids, balances)
+    ], ordered=False)
+    # Refresh the denormalized balances used by aggregate reports
+    account_updates = [
+        UpdateOne({"id": aid}, {"$set": b})
+        for aid, b in zip(account_ids, balances)
+        if not aid.startswith("system:")
+    ]
+    if account_updates:
+        await db.accounts.bulk_write(account_updates, ordered=False)
+
+def wire_settlement_entries(tx: dict) -> List[dict]:
+    amount = abs(tx["amount"])
+    return [
+        ledger_entry(tx["account_id"], "transit_balance", -amount, tx["currency"]),
+        ledger_entry(system_account("external_clearing", tx["currency"]), "available_balance", amount, tx["currency"])
+    ]
+
+async def acquire_job_lease(name: str, seconds: int) -> bool:
+    """Cluster-wide mutex for background jobs that must not run on two workers at once"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.job_leases.update_one(
+            {"_id": name, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now.isoformat()}}]},
+            {"$set": {"lease_owner": WORKER_ID, "lease_until": (now + timedelta(seconds=seconds)).isoformat()}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
         return False
 
+async def renew_job_lease(name: str, seconds: int) -> bool:
+    """Extend a lease this worker still holds; False means it expired and may have been taken over"""
+    until = (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+    result = await db.job_leases.update_one(
+        {"_id": name, "lease_owner": WORKER_ID, "lease_until": {"$ne": None}}, {"$set": {"lease_until": until}}
+    )
+    return result.matched_count == 1
+
+async def job_lease_active(name: str) -> bool:
+    lease = await db.job_leases.find_one({"_id": name})
+    return bool(lease and lease.get("lease_until") and lease["lease_until"] > datetime.now(timezone.utc).isoformat())
+
+class JobLeaseLost(Exception):
+    pass
+
+async def release_job_lease(name: str):
+    await db.job_leases.update_one({"_id": name, "lease_owner": WORKER_ID}, {"$set": {"lease_until": None}})
+
+def traced_job(job):
+    """Wrap a BackgroundTasks job so it reports as its own trace, not the request's"""
+    @functools.wraps(job)
+    async def run(*args, **kwargs):
+        with root_span(f"job {job.__name__}"):
+            return await job(*args, **kwargs)
+    return run
+
+async def run_periodically(job, interval_seconds: int):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            with root_span(f"job {job.__name__}"):
+                await job()
+        except Exception as e:
+            logger.error("Background job %s failed: %s", job.__name__, e)
+
+# ==================== TRANSACTION ROLLUPS ====================
+
+# One document per (scope, key, period) with _id "scope:key:period"; days are
+# "YYYY-MM-DD" and months "YYYY-MM", so a month chart reads at most 31 documents
+# and a year chart 12, however long the history is.
+
+def rollup_counted(tx: dict) -> bool:
+    return tx["status"] not in ROLLUP_EXCLUDED_STATUSES and not tx.get("is_redacted")
+
+def rollup_updates(tx: dict, sign: int) -> List[UpdateOne]:
+    amount = tx["amount"]
+    inc = {
+        "count": sign,
+        "inflow": sign * max(amount, 0),
+        "outflow": sign * max(-amount, 0),
+        f"by_type.{tx['transaction_type']}.count": sign,
+        f"by_type.{tx['transaction_type']}.amount": sign * amount
+    }
+    updates = []
+    for scope, key in (("account", tx["account_id"]), ("currency", tx["currency"])):
+        for granularity, period in (("day", tx["created_at"][:10]), ("month", tx["created_at"][:7])):
+            updates.append(UpdateOne({"_id": f"{scope}:{key}:{period}"}, {
+                "$inc": inc,
+                "$setOnInsert": {"scope": scope, "key": key, "currency": tx["currency"], "granularity": granularity, "period": period}
+            }, upsert=True))
+    return updates
+
+async def update_rollups(transactions: List[dict], sign: int = 1):
+    updates = [u for tx in transactions if rollup_counted(tx) for u in rollup_updates(tx, sign)]
+    if updates:
+        await db.transaction_rollups.bulk_write(updates, ordered=False)
+
+async def adjust_rollups(before: dict, after: dict):
+    """Apply a status or redaction change to the rollups"""
+    if rollup_counted(before) and not rollup_counted(after):
+        await update_rollups([before], -1)
+    elif rollup_counted(after) and not rollup_counted(before):
+        await update_rollups([after])
+
+def rollup_pipeline(scope: str, granularity: str, match: dict) -> List[dict]:
+    key_field = "$account_id" if scope == "account" else "$currency"
+    period = {"$substrCP": ["$created_at", 0, 10 if granularity == "day" else 7]}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"key": key_field, "currency": "$currency", "period": period, "type": "$transaction_type"},
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"},
+            "inflow": {"$sum": {"$max": ["$amount", 0]}},
+            "outflow": {"$sum": {"$max": [{"$multiply": ["$amount", -1]}, 0]}}
+        }},
+        {"$group": {
+            "_id": {"key": "$_id.key", "currency": "$_id.currency", "period": "$_id.period"},
+            "count": {"$sum": "$count"},
+            "inflow": {"$sum": "$inflow"},
+            "outflow": {"$sum": "$outflow"},
+            "by_type": {"$push": {"k": "$_id.type", "v": {"count": "$count", "amount": "$amount"}}}
+        }},
+        {"$project": {
+            "_id": {"$concat": [scope, ":", "$_id.key", ":", "$_id.period"]},
+            "scope": scope,
+            "key": "$_id.key",
+            "currency": "$_id.currency",
+            "granularity": granularity,
+            "period": "$_id.period",
+            "count": 1,
+            "inflow": 1,
+            "outflow": 1,
+            "by_type": {"$arrayToObject": "$by_type"}
+        }},
+        {"$merge": {"into": "transaction_rollups", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+async def rebuild_rollups(from_date: Optional[str] = None):
+    """Recompute rollups from transactions, for every month from from_date's month onwards.
+
+    Writes that land on the affected periods while the rebuild runs can be
+    overwritten, so run it when transfer traffic is low.
+    """
+    if not await acquire_job_lease("transaction_rollups", ROLLUP_REBUILD_LEASE_SECONDS):
+        return
+    try:
+        month = from_date[:7] if from_date else ""
+        await db.transaction_rollups.delete_many({"period": {"$gte": month}})
+        match = {
+            "created_at": {"$gte": month},
+            "status": {"$nin": ROLLUP_EXCLUDED_STATUSES},
+            "is_redacted": {"$ne": True}
+        }
+        for scope in ("account", "currency"):
+            for granularity in ("day", "month"):
+                await db.transactions.aggregate(rollup_pipeline(scope, granularity, match), allowDiskUse=True).to_list(None)
+        await db.counters.update_one(
+            {"_id": "transaction_rollups"},
+            {"$set": {"built_at": datetime.now(timezone.utc).isoformat(), "from": month}},
+            upsert=True
+        )
+        logger.info("Transaction rollups rebuilt from %s", month or "the beginning")
+    finally:
+        await release_job_lease("transaction_rollups")
+
+async def bootstrap_rollups():
+    if not await db.counters.find_one({"_id": "transaction_rollups"}):
+        await rebuild_rollups()
+
+async def get_rollup_chart(scope: str, key: str, period: str) -> RollupChart:
+    """Daily points for a "YYYY-MM" period or monthly points for a "YYYY" period, zero-filled"""
+    if re.fullmatch(r"\d{4}-\d{2}", period):
+        granularity = "day"
+        year, month = int(period[:4]), int(period[5:])
+        next_month = datetime(year + month // 12, month % 12 + 1, 1)
+        periods = [f"{period}-{d:02d}" for d in range(1, (next_month - timedelta(days=1)).day + 1)]
+    elif re.fullmatch(r"\d{4}", period):
+        granularity = "month"
+        periods = [f"{period}-{m:02d}" for m in range(1, 13)]
+    else:
+        raise HTTPException(status_code=400, detail="Period must be YYYY-MM or YYYY")
+    
+    rollups = await db.transaction_rollups.find(
+        {"_id": {"$in": [f"{scope}:{key}:{p}" for p in periods]}}, {"_id": 0}
+    ).to_list(len(periods))
+    by_period = {r["period"]: r for r in rollups}
+    return RollupChart(scope=scope, key=key, granularity=granularity, points=[
+        RollupPoint(**{k: v for k, v in by_period.get(p, {"period": p}).items() if k in RollupPoint.model_fields})
+        for p in periods
+    ])
+
+# ==================== EVENT STREAM ====================
+
+class EventBroker:
+    """Fans out change events to in-process subscribers keyed by user id"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, set] = {}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def has_subscribers(self, user_id: Optional[str] = None) -> bool:
+        if user_id is None:
+            return bool(self._subscribers)
+        return user_id in self._subscribers
+
+    def publish(self, user_id: str, event: dict):
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping %s event for slow subscriber %s", event["event"], user_id)
+
+event_broker = EventBroker()
+account_owners: Dict[str, str] = {}
+# account_id -> owner, waiting for publish_balance_updates
+pending_balance_accounts: Dict[str, str] = {}
+balance_updates_pending = asyncio.Event()
+
+async def get_account_owner(account_id: str) -> Optional[str]:
+    if account_id not in account_owners:
+        account = await db.accounts.find_one({"id": account_id}, {"_id": 0, "user_id": 1})
+        if not account:
+            return None
+        if len(account_owners) >= ACCOUNT_OWNER_CACHE_SIZE:
+            account_owners.clear()
+        account_owners[account_id] = account["user_id"]
+    return account_owners[account_id]
+
+async def dispatch_change(change: dict):
+    doc = change.get("fullDocument")
+    # Idle streams cost nothing: skip lookups unless someone is listening
+    if not doc or not event_broker.has_subscribers():
+        return
+    account_id = doc.get("account_id", "")
+    if account_id.startswith("system:"):
+        return
+    user_id = await get_account_owner(account_id)
+    if not user_id or not event_broker.has_subscribers(user_id):
+        return
+    
+    if change["ns"]["coll"] == "transactions":
+        if doc.get("is_redacted"):
+            return
+        event_broker.publish(user_id, {"event": "transaction", "data": TransactionResponse(**doc).model_dump()})
+    else:
+        # The legs of a posting arrive one by one; balances are read once per account by publish_balance_updates
+        pending_balance_accounts[account_id] = user_id
+        balance_updates_pending.set()
+
+async def publish_balance_updates():
+    """Send one balance event per changed account, batching the balance reads off the change stream loop"""
+    while True:
+        await balance_updates_pending.wait()
+        await asyncio.sleep(STREAM_BALANCE_DEBOUNCE_SECONDS)
+        balance_updates_pending.clear()
+        pending = dict(pending_balance_accounts)
+        pending_balance_accounts.clear()
+        try:
+            for account in await with_live_balances([{"id": account_id} for account_id in pending]):
+                balances = {field: account[field] for field in BALANCE_FIELDS}
+                event_broker.publish(pending[account["id"]], {"event": "balance", "data": {"account_id": account["id"], **balances}})
+        except Exception as e:
+            logger.error("Failed to publish balance updates: %s", e)
+
+async def watch_account_changes():
+    """Tail the transactions and ledger change stream (requires a replica set)"""
+    pipeline = [{"$match": {
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        "ns.coll": {"$in": ["transactions", "ledger", "content", "settings", "token_revocations"]}
+    }}]
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    try:
+                        if change["ns"]["coll"] in ("content", "settings"):
+                            # Another worker changed versioned content
+                            resource_versions.clear()
+                            continue
+                        if change["ns"]["coll"] == "token_revocations":
+                            if change.get("fullDocument"):
+                                token_revocations.apply(change["fullDocument"])
+                            continue
+                        await dispatch_change(change)
+                    except Exception as e:
+                        logger.error("Failed to dispatch change event: %s", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Change stream unavailable, retrying in 30s: %s", e)
+            await asyncio.sleep(30)
+
+# ==================== IDEMPOTENCY ====================
+
+idempotency_cache: "OrderedDict[str, tuple]" = OrderedDict()
+idempotency_inflight: Dict[str, tuple] = {}
+
+def cache_idempotent_response(key: str, request_hash: str, body: dict):
+    idempotency_cache[key] = (request_hash, body, time.monotonic() + IDEMPOTENCY_TTL_SECONDS)
+    idempotency_cache.move_to_end(key)
+    while len(idempotency_cache) > IDEMPOTENCY_CACHE_SIZE:
+        idempotency_cache.popitem(last=False)
+
+def replay_idempotent_response(request_hash: str, stored_hash: str, body: dict, response: Response) -> dict:
+    if request_hash != stored_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    response.headers["Idempotent-Replayed"] = "true"
+    return body
+
+async def claim_idempotency_key(key: str, request_hash: str, owner: str) -> bool:
+    """Insert the in-progress record, or take over one whose lease has lapsed"""
+    now = datetime.now(timezone.utc)
+    lease_until = (now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)).isoformat()
+    try:
+        # Mongo TTL indexes need a BSON date, so created_at is stored as a datetime here
+        await db.idempotency_keys.insert_one({
+            "_id": key,
+            "request_hash": request_hash,
+            "status": "in_progress",
+            "lease_owner": owner,
+            "lease_until": lease_until,
+            "created_at": now
+        })
+        return True
+    except DuplicateKeyError:
+        pass
+    result = await db.idempotency_keys.update_one(
+        {"_id": key, "status": "in_progress", "request_hash": request_hash, "lease_until": {"$lt": now.isoformat()}},
+        {"$set": {"lease_owner": owner, "lease_until": lease_until}}
+    )
+    return result.modified_count == 1
+
+async def wait_for_idempotent_response(key: str, request_hash: str, response: Response, deadline: float) -> Optional[dict]:
+    """Another worker holds the key: poll until it stores the response.
+
+    Returns None when the key is released or its lease lapses, so the caller can claim it.
+    """
+    while time.monotonic() < deadline:
+        record = await db.idempotency_keys.find_one({"_id": key})
+        if not record:
+            return None
+        if record["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if record["status"] == "completed":
+            cache_idempotent_response(key, record["request_hash"], record["response"])
+            return replay_idempotent_response(request_hash, record["request_hash"], record["response"], response)
+        if (record.get("lease_until") or "") < datetime.now(timezone.utc).isoformat():
+            return None
+        await asyncio.sleep(0.2)
+    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+
+async def heartbeat_idempotency_key(key: str, owner: str):
+    """Keep extending the lease while the handler runs so no other worker takes the key over"""
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+        lease_until = (datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)).isoformat()
+        result = await db.idempotency_keys.update_one(
+            {"_id": key, "lease_owner": owner, "status": "in_progress"},
+            {"$set": {"lease_until": lease_until}}
+        )
+        if result.matched_count == 0:
+            logger.warning("Lost lease on idempotency key %s", key)
+            return
+
+def idempotency_posting_id(key: str) -> str:
+    """Ledger posting id for the request, so a rerun of the same key cannot post twice"""
+    return f"idempotency:{hashlib.sha256(key.encode()).hexdigest()}"
+
+async def execute_idempotent(key: str, request_hash: str, handler, response: Response) -> dict:
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while not await claim_idempotency_key(key, request_hash, owner):
+        body = await wait_for_idempotent_response(key, request_hash, response, deadline)
+        if body is not None:
+            return body
+    
+    heartbeat = asyncio.create_task(heartbeat_idempotency_key(key, owner))
+    try:
+        result = await handler(idempotency_posting_id(key))
+    except Exception:
+        # Failed requests release the key so the client can retry
+        await db.idempotency_keys.delete_one({"_id": key, "lease_owner": owner})
+        raise
+    finally:
+        heartbeat.cancel()
+    
+    body = jsonable_encoder(result)
+    stored = await db.idempotency_keys.update_one(
+        {"_id": key, "lease_owner": owner},
+        {"$set": {"status": "completed", "response": body}}
+    )
+    if stored.matched_count == 0:
+        # The ledger posting id keeps a second run from moving funds, but its response may differ
+        logger.error("Idempotency key %s was taken over before its response was stored", key)
+    cache_idempotent_response(key, request_hash, body)
+    return body
+
+async def run_idempotent(idempotency_key: Optional[str], user_id: str, endpoint: str, payload: BaseModel, handler, response: Response):
+    """Run handler once per Idempotency-Key, replaying the stored response on retries"""
+    if not idempotency_key:
+        return await handler(None)
+    
+    key = f"{user_id}:{endpoint}:{idempotency_key}"
+    request_hash = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+    
+    cached = idempotency_cache.get(key)
+    if cached and cached[2] > time.monotonic():
+        return replay_idempotent_response(request_hash, cached[0], cached[1], response)
+    
+    # Coalesce concurrent duplicates within this worker onto one execution
+    inflight = idempotency_inflight.get(key)
+    if inflight:
+        inflight_hash, inflight_future = inflight
+        body = await asyncio.shield(inflight_future)
+        return replay_idempotent_response(request_hash, inflight_hash, body, response)
+    
+    future = asyncio.get_running_loop().create_future()
+    idempotency_inflight[key] = (request_hash, future)
+    try:
+        body = await execute_idempotent(key, request_hash, handler, response)
+        future.set_result(body)
+        return body
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when no duplicate is waiting
+        raise
+    finally:
+        del idempotency_inflight[key]
+
+# ==================== VELOCITY LIMITS ====================
+
+class VelocityEngine:
+    """Sliding-window transfer counters per account and per user.
+
+    Each key holds a bounded ring buffer of (timestamp, amount, new_beneficiary)
+    events, so a check walks only the events inside the rule's window without
+    touching the database. Every worker keeps its own view: windows are
+    persisted periodically and rebuilt at startup, so traffic handled by other
+    workers since their last persist is not visible.
+    """
+
+    def __init__(self, rules: List[dict]):
+        self.windows: Dict[str, deque] = {}
+        # Events to $push / $pull on the next persist; other workers write the same keys
+        self.pending: Dict[str, list] = {}
+        self.removed: Dict[str, list] = {}
+        self.set_rules(rules)
+
+    def set_rules(self, rules: List[dict]):
+        self.rules = rules
+        self.retention = max([r["window_seconds"] for r in rules] + [VELOCITY_NEW_BENEFICIARY_SECONDS])
+
+    def measure(self, key: str, rule: dict, now: float) -> float:
+        total = 0.0
+        start = now - rule["window_seconds"]
+        for ts, amount, new_beneficiary in reversed(self.windows.get(key, ())):
+            if ts < start:
+                break
+            if rule["metric"] == "amount":
+                total += amount
+            elif rule["metric"] == "count" or new_beneficiary:
+                total += 1
+        return total
+
+    def check(self, account_id: str, user_id: str, amount: float, new_beneficiary: bool, transfer_type: str) -> tuple:
+        """Returns ("allow" | "review" | "deny", names of the rules that fired)"""
+        now = time.time()
+        decision, reasons = "allow", []
+        for rule in self.rules:
+            if transfer_type not in rule["transfer_types"]:
+                continue
+            if rule["metric"] == "new_beneficiary_count" and not new_beneficiary:
+                continue
+            key = f"{rule['scope']}:{account_id if rule['scope'] == 'account' else user_id}"
+            value = self.measure(key, rule, now) + (amount if rule["metric"] == "amount" else 1)
+            if rule.get("deny_at") is not None and value > rule["deny_at"]:
+                decision = "deny"
+                reasons.append(rule["name"])
+            elif rule.get("review_at") is not None and value > rule["review_at"]:
+                decision = "review" if decision == "allow" else decision
+                reasons.append(rule["name"])
+        return decision, reasons
+
+    def record(self, account_id: str, user_id: str, amount: float, new_beneficiary: bool,
+               ts: Optional[float] = None, persist: bool = True) -> tuple:
+        event = (ts or time.time(), amount, new_beneficiary)
+        for key in (f"account:{account_id}", f"user:{user_id}"):
+            if key not in self.windows:
+                self.windows[key] = deque(maxlen=VELOCITY_MAX_EVENTS)
+            self.windows[key].append(event)
+            if persist:
+                self.pending.setdefault(key, []).append(event)
+        return event
+
+    def forget(self, account_id: str, user_id: str, event: tuple):
+        """Take back an event whose transfer failed or was rejected"""
+        for key in (f"account:{account_id}", f"user:{user_id}"):
+            try:
+                self.windows.get(key, deque()).remove(event)
+            except ValueError:
+                pass
+            if event in self.pending.get(key, ()):
+                self.pending[key].remove(event)
+            else:
+                self.removed.setdefault(key, []).append(event)
+
+    def expire(self, now: float):
+        """Drop events older than the longest window and forget idle keys"""
+        cutoff = now - self.retention
+        for key in list(self.windows):
+            window = self.windows[key]
+            while window and window[0][0] < cutoff:
+                window.popleft()
+            if not window:
+                del self.windows[key]
+
+velocity_engine = VelocityEngine(DEFAULT_VELOCITY_RULES)
+
+@contextlib.asynccontextmanager
+async def transfer_velocity(account_id: str, user: dict, amount: float, transfer_type: str, new_beneficiary: bool = False):
+    """Record the transfer against the windows; raises on deny, yields (review reasons, event) otherwise.
+
+    Check and record run without an await in between, so concurrent requests cannot
+    both slip under a limit. The event is taken back if the transfer's writes fail.
+    """
+    decision, reasons = velocity_engine.check(account_id, user["id"], amount, new_beneficiary, transfer_type)
+    if decision == "deny":
+        await log_audit(user["id"], "transfer_velocity_denied", {
+            "account": account_id, "amount": amount, "type": transfer_type, "rules": reasons
+        })
+        raise HTTPException(status_code=403, detail="Transfer exceeds account limits")
+    event = velocity_engine.record(account_id, user["id"], amount, new_beneficiary)
+    try:
+        yield (reasons if decision == "review" else []), event
+    except BaseException:
+        velocity_engine.forget(account_id, user["id"], event)
+        raise
+
+async def forget_transfer_velocity(tx: dict):
+    """A rejected or cancelled transfer no longer counts towards the limits"""
+    if not tx.get("velocity_event"):
+        return
+    account = await db.accounts.find_one({"id": tx["account_id"]}, {"_id": 0, "user_id": 1})
+    velocity_engine.forget(tx["account_id"], account["user_id"] if account else "", tuple(tx["velocity_event"]))
+
+async def load_velocity_rules():
+    settings = await db.settings.find_one({"type": "velocity_rules"}, {"_id": 0})
+    velocity_engine.set_rules(settings["rules"] if settings else DEFAULT_VELOCITY_RULES)
+
+async def persist_velocity_windows():
+    await load_velocity_rules()
+    now = time.time()
+    velocity_engine.expire(now)
+    pending, velocity_engine.pending = velocity_engine.pending, {}
+    removed, velocity_engine.removed = velocity_engine.removed, {}
+    # Each worker appends only its own events; expired ones are skipped on load
+    updates = [
+        UpdateOne({"_id": key}, {
+            "$push": {"events": {"$each": [list(e) for e in events], "$slice": -VELOCITY_MAX_EVENTS}},
+            "$set": {"updated_at": now}
+        }, upsert=True)
+        for key, events in pending.items() if events
+    ]
+    updates.extend(
+        UpdateOne({"_id": key}, {"$pull": {"events": {"$in": [list(e) for e in events]}}})
+        for key, events in removed.items()
+    )
+    if updates:
+        await db.velocity_windows.bulk_write(updates, ordered=False)
+    await db.counters.update_one({"_id": "velocity_windows"}, {"$max": {"persisted_at": now}}, upsert=True)
+
+async def rebuild_velocity_windows():
+    """Load persisted windows, then replay transfers made after the last persist"""
+    await load_velocity_rules()
+    now = time.time()
+    cutoff = now - velocity_engine.retention
+    async for doc in db.velocity_windows.find({"updated_at": {"$gte": cutoff}}):
+        events = sorted(tuple(e) for e in doc["events"] if e[0] >= cutoff)
+        if events:
+            velocity_engine.windows[doc["_id"]] = deque(events, maxlen=VELOCITY_MAX_EVENTS)
+    
+    state = await db.counters.find_one({"_id": "velocity_windows"})
+    since = max(state["persisted_at"] if state else 0.0, now - velocity_engine.retention)
+    owners: Dict[str, str] = {}
+    beneficiaries: Dict[str, Optional[str]] = {}
+    async for tx in db.transactions.find({
+        "transaction_type": {"$in": ["transfer_out", "wire_out"]},
+        "status": {"$nin": ["rejected", "cancelled"]},
+        "created_at": {"$gt": datetime.fromtimestamp(since, timezone.utc).isoformat()}
+    }, {"_id": 0, "account_id": 1, "amount": 1, "beneficiary_id": 1, "created_at": 1}).sort("created_at", 1):
+        if tx["account_id"] not in owners:
+            account = await db.accounts.find_one({"id": tx["account_id"]}, {"_id": 0, "user_id": 1})
+            owners[tx["account_id"]] = account["user_id"] if account else ""
+        ts = parse_utc(tx["created_at"]).timestamp()
+        new_beneficiary = False
+        if tx.get("beneficiary_id"):
+            if tx["beneficiary_id"] not in beneficiaries:
+                beneficiary = await db.beneficiaries.find_one({"id": tx["beneficiary_id"]}, {"_id": 0, "created_at": 1})
+                beneficiaries[tx["beneficiary_id"]] = beneficiary["created_at"] if beneficiary else None
+            created_at = beneficiaries[tx["beneficiary_id"]]
+            new_beneficiary = bool(created_at) and ts - parse_utc(created_at).timestamp() < VELOCITY_NEW_BENEFICIARY_SECONDS
+        # Replayed events are persisted by the worker that recorded them
+        velocity_engine.record(tx["account_id"], owners[tx["account_id"]], abs(tx["amount"]), new_beneficiary, ts, persist=False)
+
 # ==================== AUTH ENDPOINTS ====================
 
 @api_router.post("/auth/register", response_model=dict)
@@ -359,12 +2089,13 @@ async def register_user(user: UserCreate):
     
     user_dict = user.model_dump()
     user_dict["id"] = str(uuid.uuid4())
-    user_dict["password_hash"] = pwd_context.hash(user_dict.pop("password"))
+    user_dict["password_hash"] = hash_password(user_dict.pop("password"))
     user_dict["role"] = "client"
     user_dict["status"] = "active"
     user_dict["kyc_status"] = "pending"
     user_dict["created_at"] = datetime.now(timezone.utc).isoformat()
     user_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+    user_dict.update(customer_search_keys(user_dict))
     
     await db.users.insert_one(user_dict)
     await log_audit(user_dict["id"], "user_registered", {"email": user.email})
@@ -377,7 +2108,7 @@ async def login(credentials: UserLogin):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not pwd_context.verify(credentials.password, user["password_hash"]):
+    if not verify_password(credentials.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if user["status"] != "active":
@@ -446,7 +2177,7 @@ async def verify_otp(data: OTPVerify):
     await db.otps.update_one({"id": otp_record["id"]}, {"$set": {"used": True}})
     
     # Generate token
-    token = create_token(user["id"], user["role"])
+    token = create_token(user["id"], user["role"], user.get("token_version", 0))
     
     await log_audit(user["id"], "login_successful", {"email": data.email})
     
@@ -461,6 +2192,20 @@ async def verify_otp(data: OTPVerify):
         }
     }
 
+@api_router.post("/auth/logout", response_model=dict)
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = verify_token(credentials.credentials)
+    await revoke_token(payload)
+    await log_audit(payload["user_id"], "logout", {})
+    return {"message": "Logged out"}
+
+@api_router.post("/auth/logout-all", response_model=dict)
+async def logout_all(user: dict = Depends(get_current_user)):
+    before, after = await revoke_user_tokens(user["id"])
+    await log_audit(user["id"], "sessions_revoked", {"by": "user"}, before, after,
+                    entity={"collection": "users", "filter": {"id": user["id"]}})
+    return {"message": "All sessions signed out"}
+
 @api_router.post("/auth/request-otp", response_model=dict)
 async def request_otp(data: OTPRequest, user: dict = Depends(get_current_user)):
     otp = generate_otp()
@@ -489,7 +2234,7 @@ async def get_me(user: dict = Depends(get_current_user)):
 @api_router.get("/accounts", response_model=List[AccountResponse])
 async def get_accounts(user: dict = Depends(get_current_user)):
     accounts = await db.accounts.find({"user_id": user["id"]}, {"_id": 0}).to_list(100)
-    return [AccountResponse(**acc) for acc in accounts]
+    return [AccountResponse(**acc) for acc in await with_live_balances(accounts)]
 
 @api_router.get("/accounts/{account_id}", response_model=AccountResponse)
 async def get_account(account_id: str, user: dict = Depends(get_current_user)):
@@ -499,7 +2244,28 @@ async def get_account(account_id: str, user: dict = Depends(get_current_user)):
     )
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
-    return AccountResponse(**account)
+    return AccountResponse(**{**account, **await get_account_balances(account_id)})
+
+@api_router.get("/accounts/{account_id}/balance")
+async def get_account_balance(
+    account_id: str,
+    as_of: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Balances now or at a past point in time, computed from the ledger"""
+    account = await db.accounts.find_one({"id": account_id, "user_id": user["id"]})
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    balances = await get_account_balances(account_id, as_of)
+    return {"account_id": account_id, "currency": account["currency"], "as_of": as_of, **balances}
+
+@api_router.get("/accounts/{account_id}/analytics", response_model=RollupChart)
+async def get_account_analytics(account_id: str, period: str, user: dict = Depends(get_current_user)):
+    """Inflow/outflow chart for a month (YYYY-MM, daily points) or a year (YYYY, monthly points)"""
+    account = await db.accounts.find_one({"id": account_id, "user_id": user["id"]})
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return await get_rollup_chart("account", account_id, period)
 
 @api_router.get("/accounts/{account_id}/transactions", response_model=List[TransactionResponse])
 async def get_transactions(
@@ -509,8 +2275,10 @@ async def get_transactions(
     status: Optional[str] = None,
     from_date: Optional[str] = None,
     to_date: Optional[str] = None,
+    fields: Optional[str] = None,
     user: dict = Depends(get_current_user)
 ):
+    selected = parse_fields(fields, TransactionResponse)
     # Verify account ownership
     account = await db.accounts.find_one({"id": account_id, "user_id": user["id"]})
     if not account:
@@ -525,15 +2293,28 @@ async def get_transactions(
         query["created_at"] = {**query.get("created_at", {}), "$lte": to_date}
     
     transactions = await db.transactions.find(
-        query, {"_id": 0}
+        query, fields_projection(selected)
     ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     
+    if selected:
+        return sparse_response(transactions, TransactionResponse, selected)
     return [TransactionResponse(**tx) for tx in transactions]
 
 # ==================== TRANSFER ENDPOINTS ====================
 
 @api_router.post("/transfers/internal", response_model=TransactionResponse)
-async def internal_transfer(transfer: InternalTransfer, user: dict = Depends(get_current_user)):
+async def internal_transfer(
+    transfer: InternalTransfer,
+    response: Response,
+    user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        idempotency_key, user["id"], "transfers/internal", transfer,
+        lambda posting_id: execute_internal_transfer(transfer, user, posting_id), response
+    )
+
+async def execute_internal_transfer(transfer: InternalTransfer, user: dict, posting_id: Optional[str] = None) -> TransactionResponse:
     # Verify from account ownership
     from_account = await db.accounts.find_one(
         {"id": transfer.from_account_id, "user_id": user["id"]},
@@ -547,56 +2328,62 @@ async def internal_transfer(transfer: InternalTransfer, user: dict = Depends(get
     if not to_account:
         raise HTTPException(status_code=404, detail="Destination account not found")
     
-    # Check balance
-    if from_account["available_balance"] < transfer.amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
+    async with account_debit_lock(transfer.from_account_id):
+        # Check balance
+        balances = await get_account_balances(transfer.from_account_id)
+        if balances["available_balance"] < transfer.amount:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    # Create transaction
-    tx_id = str(uuid.uuid4())
-    reference = generate_reference()
-    now = datetime.now(timezone.utc).isoformat()
+        async with transfer_velocity(transfer.from_account_id, user, transfer.amount, "internal") as (review_reasons, velocity_event):
+            # Create transaction
+            tx_id = str(uuid.uuid4())
+            reference = generate_reference()
+            now = datetime.now(timezone.utc).isoformat()
     
-    # Debit transaction
-    debit_tx = {
-        "id": tx_id,
-        "account_id": transfer.from_account_id,
-        "transaction_type": "transfer_out",
-        "amount": -transfer.amount,
-        "currency": transfer.currency,
-        "description": transfer.description or "Internal transfer",
-        "status": "completed",
-        "reference": reference,
-        "counterparty": to_account.get("account_number"),
-        "created_at": now,
-        "is_redacted": False
-    }
+            # Debit transaction
+            debit_tx = {
+                "id": tx_id,
+                "account_id": transfer.from_account_id,
+                "transaction_type": "transfer_out",
+                "amount": -transfer.amount,
+                "currency": transfer.currency,
+                "description": transfer.description or "Internal transfer",
+                "status": "completed",
+                "reference": reference,
+                "counterparty": to_account.get("account_number"),
+                "created_at": now,
+                "is_redacted": False,
+                "velocity_event": list(velocity_event)
+            }
+            if review_reasons:
+                # Internal transfers settle immediately; flag them for after-the-fact review
+                debit_tx["risk_review"] = review_reasons
     
-    # Credit transaction
-    credit_tx = {
-        "id": str(uuid.uuid4()),
-        "account_id": transfer.to_account_id,
-        "transaction_type": "transfer_in",
-        "amount": transfer.amount,
-        "currency": transfer.currency,
-        "description": transfer.description or "Internal transfer received",
-        "status": "completed",
-        "reference": reference,
-        "counterparty": from_account.get("account_number"),
-        "created_at": now,
-        "is_redacted": False
-    }
+            # Credit transaction
+            credit_tx = {
+                "id": str(uuid.uuid4()),
+                "account_id": transfer.to_account_id,
+                "transaction_type": "transfer_in",
+                "amount": transfer.amount,
+                "currency": transfer.currency,
+                "description": transfer.description or "Internal transfer received",
+                "status": "completed",
+                "reference": reference,
+                "counterparty": from_account.get("account_number"),
+                "created_at": now,
+                "is_redacted": False
+            }
     
-    # Update balances
-    await db.accounts.update_one(
-        {"id": transfer.from_account_id},
-        {"$inc": {"available_balance": -transfer.amount}}
-    )
-    await db.accounts.update_one(
-        {"id": transfer.to_account_id},
-        {"$inc": {"available_balance": transfer.amount}}
-    )
+            # Update balances
+            if not await post_ledger([
+                ledger_entry(transfer.from_account_id, "available_balance", -transfer.amount, transfer.currency),
+                ledger_entry(transfer.to_account_id, "available_balance", transfer.amount, transfer.currency)
+            ], reference, "Internal transfer", posting_id):
+                raise HTTPException(status_code=409, detail="A transfer with this Idempotency-Key was already posted")
+    
+            await db.transactions.insert_many([debit_tx, credit_tx])
     
-    await db.transactions.insert_many([debit_tx, credit_tx])
+    await update_rollups([debit_tx, credit_tx])
     await log_audit(user["id"], "internal_transfer", {
         "from_account": transfer.from_account_id,
         "to_account": transfer.to_account_id,
@@ -607,7 +2394,18 @@ async def internal_transfer(transfer: InternalTransfer, user: dict = Depends(get
     return TransactionResponse(**debit_tx)
 
 @api_router.post("/transfers/external", response_model=TransactionResponse)
-async def external_transfer(transfer: ExternalTransfer, user: dict = Depends(get_current_user)):
+async def external_transfer(
+    transfer: ExternalTransfer,
+    response: Response,
+    user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        idempotency_key, user["id"], "transfers/external", transfer,
+        lambda posting_id: execute_external_transfer(transfer, user, posting_id), response
+    )
+
+async def execute_external_transfer(transfer: ExternalTransfer, user: dict, posting_id: Optional[str] = None) -> TransactionResponse:
     # Verify OTP
     otp_record = await db.otps.find_one({
         "email": user["email"],
@@ -640,42 +2438,48 @@ async def external_transfer(transfer: ExternalTransfer, user: dict = Depends(get
     if not beneficiary:
         raise HTTPException(status_code=404, detail="Beneficiary not found")
     
-    # Check balance
-    if from_account["available_balance"] < transfer.amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-    
-    # Create pending transaction
-    tx_id = str(uuid.uuid4())
-    reference = generate_reference()
-    now = datetime.now(timezone.utc).isoformat()
+    async with account_debit_lock(transfer.from_account_id):
+        # Check balance
+        balances = await get_account_balances(transfer.from_account_id)
+        if balances["available_balance"] < transfer.amount:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    tx = {
-        "id": tx_id,
-        "account_id": transfer.from_account_id,
-        "transaction_type": "wire_out",
-        "amount": -transfer.amount,
-        "currency": transfer.currency,
-        "description": transfer.description or f"Wire to {beneficiary['name']}",
-        "status": "pending",
-        "reference": reference,
-        "counterparty": beneficiary["name"],
-        "beneficiary_id": transfer.beneficiary_id,
-        "created_at": now,
-        "is_redacted": False
-    }
+        new_beneficiary = parse_utc(beneficiary["created_at"]) > datetime.now(timezone.utc) - timedelta(seconds=VELOCITY_NEW_BENEFICIARY_SECONDS)
+        async with transfer_velocity(transfer.from_account_id, user, transfer.amount, "external", new_beneficiary) as (review_reasons, velocity_event):
+            # Create pending transaction
+            tx_id = str(uuid.uuid4())
+            reference = generate_reference()
+            now = datetime.now(timezone.utc).isoformat()
     
-    # Move to transit balance
-    await db.accounts.update_one(
-        {"id": transfer.from_account_id},
-        {
-            "$inc": {
-                "available_balance": -transfer.amount,
-                "transit_balance": transfer.amount
+            tx = {
+                "id": tx_id,
+                "account_id": transfer.from_account_id,
+                "transaction_type": "wire_out",
+                "amount": -transfer.amount,
+                "currency": transfer.currency,
+                "description": transfer.description or f"Wire to {beneficiary['name']}",
+                "status": "pending",
+                "reference": reference,
+                "counterparty": beneficiary["name"],
+                "beneficiary_id": transfer.beneficiary_id,
+                "created_at": now,
+                "is_redacted": False,
+                "velocity_event": list(velocity_event)
             }
-        }
-    )
+            if review_reasons:
+                # Stays pending like every wire, but marked so approvers look at it first
+                tx["risk_review"] = review_reasons
     
-    await db.transactions.insert_one(tx)
+            # Move to transit balance
+            if not await post_ledger([
+                ledger_entry(transfer.from_account_id, "available_balance", -transfer.amount, transfer.currency),
+                ledger_entry(transfer.from_account_id, "transit_balance", transfer.amount, transfer.currency)
+            ], reference, "Wire initiated", posting_id):
+                raise HTTPException(status_code=409, detail="A transfer with this Idempotency-Key was already posted")
+    
+            await db.transactions.insert_one(tx)
+    
+    await update_rollups([tx])
     await log_audit(user["id"], "external_transfer_initiated", {
         "account": transfer.from_account_id,
         "beneficiary": transfer.beneficiary_id,
@@ -685,6 +2489,289 @@ async def external_transfer(transfer: ExternalTransfer, user: dict = Depends(get
     
     return TransactionResponse(**tx)
 
+# ==================== SCHEDULED TRANSFERS ====================
+
+def parse_utc(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def add_months(value: datetime, months: int, anchor_day: int) -> datetime:
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    next_month = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    last_day = (next_month - timedelta(days=1)).day
+    return value.replace(year=year, month=month, day=min(anchor_day, last_day))
+
+def next_occurrence(order: dict, after: datetime) -> Optional[str]:
+    """Next run strictly after `after`; missed occurrences are skipped, not replayed"""
+    if order["frequency"] == "once":
+        return None
+    run_at = parse_utc(order["next_run_at"])
+    while run_at <= after:
+        if order["frequency"] == "daily":
+            run_at += timedelta(days=1)
+        elif order["frequency"] == "weekly":
+            run_at += timedelta(weeks=1)
+        else:
+            run_at = add_months(run_at, 1, order["anchor_day"])
+    if order.get("end_at") and run_at > parse_utc(order["end_at"]):
+        return None
+    return run_at.isoformat()
+
+@api_router.post("/transfers/scheduled", response_model=ScheduledTransferResponse)
+async def create_scheduled_transfer(order: ScheduledTransferCreate, user: dict = Depends(get_current_user)):
+    if order.frequency not in SCHEDULE_FREQUENCIES:
+        raise HTTPException(status_code=400, detail=f"Frequency must be one of {', '.join(SCHEDULE_FREQUENCIES)}")
+    if order.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    try:
+        start_at = parse_utc(order.start_at)
+        end_at = parse_utc(order.end_at).isoformat() if order.end_at else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if end_at and start_at.isoformat() > end_at:
+        raise HTTPException(status_code=400, detail="start_at must not be after end_at")
+    
+    from_account = await db.accounts.find_one({"id": order.from_account_id, "user_id": user["id"]})
+    if not from_account:
+        raise HTTPException(status_code=404, detail="Source account not found")
+    to_account = await db.accounts.find_one({"id": order.to_account_id})
+    if not to_account:
+        raise HTTPException(status_code=404, detail="Destination account not found")
+    
+    order_dict = order.model_dump()
+    order_dict["id"] = str(uuid.uuid4())
+    order_dict["user_id"] = user["id"]
+    order_dict["next_run_at"] = start_at.isoformat()
+    order_dict["end_at"] = end_at
+    order_dict["anchor_day"] = start_at.day
+    order_dict["status"] = "active"
+    order_dict["run_count"] = 0
+    order_dict["lease_owner"] = None
+    order_dict["lease_until"] = None
+    order_dict["created_at"] = datetime.now(timezone.utc).isoformat()
+    del order_dict["start_at"]
+    
+    await db.scheduled_transfers.insert_one(order_dict)
+    await log_audit(user["id"], "scheduled_transfer_created", {
+        "scheduled_transfer_id": order_dict["id"],
+        "frequency": order.frequency,
+        "amount": order.amount
+    })
+    return ScheduledTransferResponse(**order_dict)
+
+@api_router.get("/transfers/scheduled", response_model=List[ScheduledTransferResponse])
+async def get_scheduled_transfers(user: dict = Depends(get_current_user)):
+    orders = await db.scheduled_transfers.find(
+        {"user_id": user["id"]}, {"_id": 0}
+    ).sort("created_at", -1).to_list(100)
+    return [ScheduledTransferResponse(**o) for o in orders]
+
+@api_router.get("/transfers/scheduled/{order_id}/runs")
+async def get_scheduled_transfer_runs(
+    order_id: str,
+    skip: int = 0,
+    limit: int = 50,
+    user: dict = Depends(get_current_user)
+):
+    runs = await db.scheduled_transfer_runs.find(
+        {"scheduled_transfer_id": order_id, "user_id": user["id"]}, {"_id": 0}
+    ).sort("executed_at", -1).skip(skip).limit(limit).to_list(limit)
+    return runs
+
+@api_router.delete("/transfers/scheduled/{order_id}")
+async def cancel_scheduled_transfer(order_id: str, user: dict = Depends(get_current_user)):
+    # A leased order may be paying right now; cancelling it then would not stop the payment
+    now = datetime.now(timezone.utc).isoformat()
+    result = await db.scheduled_transfers.update_one(
+        {
+            "id": order_id, "user_id": user["id"], "status": "active",
+            "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]
+        },
+        {"$set": {"status": "cancelled", "next_run_at": None}}
+    )
+    if result.modified_count == 0:
+        if await db.scheduled_transfers.find_one({"id": order_id, "user_id": user["id"], "status": "active"}):
+            raise HTTPException(status_code=409, detail="Scheduled transfer is running, try again shortly")
+        raise HTTPException(status_code=404, detail="Scheduled transfer not found")
+    
+    await log_audit(user["id"], "scheduled_transfer_cancelled", {"scheduled_transfer_id": order_id})
+    return {"message": "Scheduled transfer cancelled"}
+
+async def claim_due_transfers(now: datetime) -> List[dict]:
+    """Lease a batch of due orders so concurrent workers never run the same one"""
+    now_iso = now.isoformat()
+    lease_until = (now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)).isoformat()
+    claimed = []
+    while len(claimed) < SCHEDULER_BATCH_SIZE:
+        order = await db.scheduled_transfers.find_one_and_update(
+            {
+                "status": "active",
+                "next_run_at": {"$lte": now_iso},
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now_iso}}]
+            },
+            {"$set": {"lease_owner": WORKER_ID, "lease_until": lease_until}},
+            sort=[("next_run_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if not order:
+            break
+        claimed.append(order)
+    return claimed
+
+async def execute_scheduled_transfer(order: dict, users: dict) -> dict:
+    """Run one occurrence; the run record is written first so a re-claimed order never pays twice"""
+    run = {
+        "id": str(uuid.uuid4()),
+        "scheduled_transfer_id": order["id"],
+        "user_id": order["user_id"],
+        "amount": order["amount"],
+        "currency": order["currency"],
+        "scheduled_for": order["next_run_at"],
+        "status": "running",
+        "transaction_id": None,
+        "reference": None,
+        "error": None,
+        "started_at": datetime.now(timezone.utc).isoformat()
+    }
+    try:
+        await db.scheduled_transfer_runs.insert_one(run)
+        run.pop("_id", None)
+    except DuplicateKeyError:
+        # A worker that lost its lease already started this occurrence
+        existing = await db.scheduled_transfer_runs.find_one(
+            {"scheduled_transfer_id": order["id"], "scheduled_for": order["next_run_at"]}, {"_id": 0}
+        )
+        if existing["status"] == "running":
+            # It may or may not have moved money; flag it for reconciliation instead of retrying
+            existing.update(status="interrupted", error="Worker stopped during execution",
+                            executed_at=datetime.now(timezone.utc).isoformat())
+            await db.scheduled_transfer_runs.update_one({"id": existing["id"]}, {"$set": {
+                "status": existing["status"], "error": existing["error"], "executed_at": existing["executed_at"]
+            }})
+        return existing
+    user = users.get(order["user_id"])
+    try:
+        # Renew the lease right before paying: cancel is refused while it is live
+        lease_until = (datetime.now(timezone.utc) + timedelta(seconds=SCHEDULER_LEASE_SECONDS)).isoformat()
+        result = await db.scheduled_transfers.update_one(
+            {"id": order["id"], "status": "active", "lease_owner": WORKER_ID},
+            {"$set": {"lease_until": lease_until}}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=409, detail="Scheduled transfer is no longer active")
+        if not user or user["status"] != "active":
+            raise HTTPException(status_code=403, detail="Account is not active")
+        transfer = InternalTransfer(
+            from_account_id=order["from_account_id"],
+            to_account_id=order["to_account_id"],
+            amount=order["amount"],
+            currency=order["currency"],
+            description=order.get("description") or "Scheduled transfer"
+        )
+        tx = await execute_internal_transfer(transfer, user)
+        run["status"] = "completed"
+        run["transaction_id"] = tx.id
+        run["reference"] = tx.reference
+    except HTTPException as e:
+        run["status"] = "failed"
+        run["error"] = e.detail
+    except Exception as e:
+        logger.error("Scheduled transfer %s failed: %s", order["id"], e)
+        run["status"] = "failed"
+        run["error"] = "Internal error"
+    run["executed_at"] = datetime.now(timezone.utc).isoformat()
+    await db.scheduled_transfer_runs.update_one({"id": run["id"]}, {"$set": {
+        "status": run["status"],
+        "transaction_id": run["transaction_id"],
+        "reference": run["reference"],
+        "error": run["error"],
+        "executed_at": run["executed_at"]
+    }})
+    return run
+
+async def run_scheduled_transfers():
+    """Drain all due scheduled transfers in leased batches"""
+    semaphore = asyncio.Semaphore(SCHEDULER_CONCURRENCY)
+    
+    async def run_account_queue(orders: List[dict], users: dict) -> List[dict]:
+        # Orders debiting the same account run sequentially so balance checks see prior debits
+        async with semaphore:
+            return [await execute_scheduled_transfer(order, users) for order in orders]
+    
+    while True:
+        now = datetime.now(timezone.utc)
+        orders = await claim_due_transfers(now)
+        if not orders:
+            return
+        
+        user_ids = list({o["user_id"] for o in orders})
+        users = {u["id"]: u for u in await db.users.find(
+            {"id": {"$in": user_ids}}, {"_id": 0, "password_hash": 0}
+        ).to_list(len(user_ids))}
+        
+        by_account: Dict[str, List[dict]] = {}
+        for order in orders:
+            by_account.setdefault(order["from_account_id"], []).append(order)
+        results = await asyncio.gather(*[run_account_queue(q, users) for q in by_account.values()])
+        runs = [run for queue in results for run in queue]
+        
+        updates = []
+        for order, run in zip([o for q in by_account.values() for o in q], runs):
+            next_run_at = next_occurrence(order, now)
+            if next_run_at:
+                status_value = "active"
+            else:
+                status_value = "failed" if run["status"] != "completed" and order["frequency"] == "once" else "completed"
+            updates.append(UpdateOne(
+                # A cancelled order stays cancelled
+                {"id": order["id"], "status": "active", "lease_owner": WORKER_ID},
+                {
+                    "$set": {
+                        "next_run_at": next_run_at,
+                        "status": status_value,
+                        "last_run_at": run["executed_at"],
+                        "last_error": run["error"],
+                        "lease_owner": None,
+                        "lease_until": None
+                    },
+                    "$inc": {"run_count": 1}
+                }
+            ))
+        await db.scheduled_transfers.bulk_write(updates, ordered=False)
+        logger.info("Executed %d scheduled transfers", len(runs))
+        await asyncio.sleep(0)
+
+# ==================== STREAM ENDPOINTS ====================
+
+@api_router.get("/stream")
+async def stream_events(request: Request, user: dict = Depends(get_stream_user)):
+    """Server-sent events for balance and transaction changes on the user's accounts"""
+    queue = event_broker.subscribe(user["id"])
+    
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                    yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+        finally:
+            event_broker.unsubscribe(user["id"], queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ==================== BENEFICIARY ENDPOINTS ====================
 
 @api_router.get("/beneficiaries", response_model=List[BeneficiaryResponse])
@@ -738,34 +2825,442 @@ async def delete_beneficiary(beneficiary_id: str, user: dict = Depends(get_curre
 
 # ==================== INSTRUMENT ENDPOINTS ====================
 
-@api_router.get("/instruments", response_model=List[InstrumentResponse])
-async def get_instruments(user: dict = Depends(get_current_user)):
-    query = {
+instrument_content_cache: "OrderedDict[tuple, str]" = OrderedDict()
+compiled_instrument_templates: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+def encode_cursor(*values: str) -> str:
+    return base64.urlsafe_b64encode("|".join(values).encode()).decode()
+
+def decode_cursor(cursor: str, parts: int = 2) -> List[str]:
+    try:
+        values = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(values) != parts:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def visible_instruments_query(user: dict) -> dict:
+    return {
         "$or": [
             {"visibility": "all"},
             {"recipient_id": user["id"]}
         ],
         "status": "active"
     }
-    instruments = await db.instruments.find(query, {"_id": 0}).to_list(100)
-    return [InstrumentResponse(**i) for i in instruments]
+
+async def get_instrument_content(instrument_id: str, version: int) -> Optional[str]:
+    key = (instrument_id, version)
+    if key in instrument_content_cache:
+        instrument_content_cache.move_to_end(key)
+        return instrument_content_cache[key]
+    instrument = await db.instruments.find_one({"id": instrument_id, "version": {"$in": [version, None]}}, {"_id": 0, "content": 1})
+    if not instrument:
+        return None
+    instrument_content_cache[key] = instrument["content"]
+    while len(instrument_content_cache) > INSTRUMENT_CACHE_SIZE:
+        instrument_content_cache.popitem(last=False)
+    return instrument["content"]
+
+def invalidate_instrument_content(instrument_id: str):
+    for cache in (instrument_content_cache, compiled_instrument_templates):
+        for key in [k for k in cache if k[0] == instrument_id]:
+            del cache[key]
+
+@api_router.get("/instruments", response_model=List[InstrumentSummary])
+async def get_instruments(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = INSTRUMENT_PAGE_SIZE,
+    user: dict = Depends(get_current_user)
+):
+    """Instrument summaries with a short preview; the next page cursor is in X-Next-Cursor"""
+    limit = max(1, min(limit, INSTRUMENT_MAX_PAGE_SIZE))
+    query = visible_instruments_query(user)
+    if cursor:
+        created_at, instrument_id = decode_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": instrument_id}}
+        ]}]}
+    
+    projection = {field: 1 for field in InstrumentSummary.model_fields if field != "preview"}
+    projection.update({"_id": 0, "preview": {"$substrCP": ["$content", 0, INSTRUMENT_PREVIEW_CHARS]}})
+    instruments = await db.instruments.find(query, projection).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+    
+    if len(instruments) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(instruments[-1]["created_at"], instruments[-1]["id"])
+    return [InstrumentSummary(**i) for i in instruments]
 
 @api_router.get("/instruments/{instrument_id}", response_model=InstrumentResponse)
-async def get_instrument(instrument_id: str, user: dict = Depends(get_current_user)):
-    instrument = await db.instruments.find_one(
-        {"id": instrument_id},
-        {"_id": 0}
+async def get_instrument(
+    instrument_id: str,
+    request: Request,
+    response: Response,
+    user: dict = Depends(get_current_user)
+):
+    query = {"id": instrument_id}
+    if user["role"] not in ["admin", "super_admin"]:
+        query.update(visible_instruments_query(user))
+    instrument = await db.instruments.find_one(query, {"_id": 0, "content": 0})
+    if not instrument:
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    
+    version = instrument.get("version", 1)
+    tag = {
+        "etag": f'"{instrument_id}-v{version}"',
+        "last_modified": http_date(instrument.get("updated_at") or instrument.get("created_at"))
+    }
+    if is_not_modified(request, tag):
+        return Response(status_code=304, headers=conditional_headers(tag, INSTRUMENT_CACHE_CONTROL))
+    
+    content = await get_instrument_content(instrument_id, version)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    response.headers.update(conditional_headers(tag, INSTRUMENT_CACHE_CONTROL))
+    return InstrumentResponse(**instrument, content=content)
+
+# ==================== INSTRUMENT RENDERING ====================
+
+def placeholder_key(name: str) -> str:
+    return re.sub(r"\W+", "_", name.strip()).lower()
+
+def compile_template(content: str) -> tuple:
+    """Split a template into (literal, placeholder_key, placeholder_text) parts once"""
+    parts = []
+    position = 0
+    for match in INSTRUMENT_PLACEHOLDER_PATTERN.finditer(content):
+        name = match.group(1) or match.group(2)
+        parts.append((content[position:match.start()], placeholder_key(name), match.group(0)))
+        position = match.end()
+    parts.append((content[position:], None, ""))
+    return tuple(parts)
+
+def render_template(parts: tuple, context: dict) -> str:
+    # Unknown placeholders are left exactly as written
+    return "".join(
+        literal + (str(context[key]) if key in context else text)
+        for literal, key, text in parts
     )
+
+def pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def render_pdf(text: str) -> bytes:
+    """Minimal single-font (Courier) PDF writer, so rendering needs no external packages"""
+    lines = []
+    for raw in text.splitlines() or [""]:
+        while len(raw) > PDF_LINE_WIDTH:
+            lines.append(raw[:PDF_LINE_WIDTH])
+            raw = raw[PDF_LINE_WIDTH:]
+        lines.append(raw)
+    pages = [lines[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)]
+    
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>"
+    ]
+    page_refs = []
+    for page in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(f"({pdf_escape(line)}) '" for line in page) + " ET"
+        stream_bytes = stream.encode("cp1252", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream_bytes), stream_bytes))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(page_refs), len(page_refs))
+    
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def render_documents(parts: tuple, contexts: List[dict], fmt: str) -> List[tuple]:
+    """Process pool entry point: render one template for many recipients"""
+    documents = []
+    for context in contexts:
+        text = render_template(parts, context)
+        data = render_pdf(text) if fmt == "pdf" else text.encode("utf-8")
+        documents.append((context["filename"], data))
+    return documents
+
+async def get_compiled_instrument(instrument: dict) -> tuple:
+    key = (instrument["id"], instrument.get("version", 1))
+    if key not in compiled_instrument_templates:
+        content = await get_instrument_content(*key)
+        if content is None:
+            raise HTTPException(status_code=404, detail="Instrument not found")
+        compiled_instrument_templates[key] = compile_template(content)
+        while len(compiled_instrument_templates) > INSTRUMENT_CACHE_SIZE:
+            compiled_instrument_templates.popitem(last=False)
+    compiled_instrument_templates.move_to_end(key)
+    return compiled_instrument_templates[key]
+
+def instrument_context(instrument: dict, user: dict, account: Optional[dict], fmt: str) -> dict:
+    amount = instrument.get("amount")
+    client_name = f"{user['first_name']} {user['last_name']}"
+    return {
+        "client_name": client_name,
+        "first_name": user["first_name"],
+        "last_name": user["last_name"],
+        "email": user["email"],
+        "account_number": (account or {}).get("account_number", ""),
+        "account_type": (account or {}).get("account_type", ""),
+        "currency": instrument.get("currency") or (account or {}).get("currency", ""),
+        "amount": f"{amount:,.2f}" if amount is not None else "",
+        "current_date": datetime.now(timezone.utc).strftime("%d %B %Y"),
+        "filename": f"{instrument['instrument_type']}-{placeholder_key(client_name)}-{user['id'][:8]}.{'pdf' if fmt == 'pdf' else 'txt'}"
+    }
+
+@api_router.get("/instruments/{instrument_id}/render")
+async def render_instrument(
+    instrument_id: str,
+    format: str = "text",
+    account_id: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Render an instrument for the current client as text or PDF"""
+    if format not in ("text", "pdf"):
+        raise HTTPException(status_code=400, detail="Format must be text or pdf")
+    query = {"id": instrument_id, **visible_instruments_query(user)}
+    instrument = await db.instruments.find_one(query, {"_id": 0, "content": 0})
+    if not instrument:
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    
+    account_query = {"user_id": user["id"]}
+    if account_id:
+        account_query["id"] = account_id
+    account = await db.accounts.find_one(account_query, {"_id": 0}, sort=[("created_at", 1)])
+    if account_id and not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    parts = await get_compiled_instrument(instrument)
+    context = instrument_context(instrument, user, account, format)
+    text = render_template(parts, context)
+    if format == "text":
+        return PlainTextResponse(text)
+    pdf = await asyncio.get_running_loop().run_in_executor(get_process_pool(), render_pdf, text)
+    return Response(pdf, media_type="application/pdf", headers={
+        "Content-Disposition": f'attachment; filename="{context["filename"]}"'
+    })
+
+class ZipStreamBuffer:
+    """Write-only file object that lets zipfile output be drained as it is produced"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+async def iter_issue_recipients(recipient_ids: List[str]):
+    """Yield chunks of (user, primary account) pairs"""
+    query = {"id": {"$in": recipient_ids}} if recipient_ids else {"role": "client", "status": "active"}
+    chunk = []
+    async for user in db.users.find(query, {"_id": 0, "password_hash": 0}).batch_size(INSTRUMENT_ISSUE_CHUNK_SIZE):
+        chunk.append(user)
+        if len(chunk) >= INSTRUMENT_ISSUE_CHUNK_SIZE:
+            yield await attach_primary_accounts(chunk)
+            chunk = []
+    if chunk:
+        yield await attach_primary_accounts(chunk)
+
+async def attach_primary_accounts(users: List[dict]) -> List[tuple]:
+    accounts = {}
+    async for account in db.accounts.find(
+        {"user_id": {"$in": [u["id"] for u in users]}}, {"_id": 0}
+    ).sort("created_at", 1):
+        accounts.setdefault(account["user_id"], account)
+    return [(u, accounts.get(u["id"])) for u in users]
+
+@api_router.post("/admin/instruments/{instrument_id}/issue")
+async def admin_issue_instrument(
+    instrument_id: str,
+    issue: InstrumentIssue,
+    admin: dict = Depends(get_admin_user)
+):
+    """Render an instrument for many recipients and stream the documents as a zip"""
+    if issue.format not in ("text", "pdf"):
+        raise HTTPException(status_code=400, detail="Format must be text or pdf")
+    instrument = await db.instruments.find_one({"id": instrument_id}, {"_id": 0, "content": 0})
     if not instrument:
         raise HTTPException(status_code=404, detail="Instrument not found")
-    return InstrumentResponse(**instrument)
+    parts = await get_compiled_instrument(instrument)
+    await log_audit(admin["id"], "instrument_issued", {
+        "instrument_id": instrument_id,
+        "recipients": len(issue.recipient_ids) or "all_active_clients",
+        "format": issue.format
+    })
+    
+    async def stream_zip():
+        loop = asyncio.get_running_loop()
+        buffer = ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            async for chunk in iter_issue_recipients(issue.recipient_ids):
+                contexts = [instrument_context(instrument, u, a, issue.format) for u, a in chunk]
+                size = max(1, -(-len(contexts) // PROCESS_POOL_WORKERS))
+                rendered = await asyncio.gather(*[
+                    loop.run_in_executor(get_process_pool(), render_documents, parts, contexts[i:i + size], issue.format)
+                    for i in range(0, len(contexts), size)
+                ])
+                for documents in rendered:
+                    for filename, data in documents:
+                        archive.writestr(filename, data)
+                yield buffer.drain()
+        yield buffer.drain()
+    
+    filename = f"{instrument['instrument_type']}-{instrument_id[:8]}.zip"
+    return StreamingResponse(stream_zip(), media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    })
 
 # ==================== TICKET ENDPOINTS ====================
 
+# Each side has its own unread counter; a reply bumps the other side's counter
+# and reading a thread to its end resets the reader's
+TICKET_UNREAD_FIELDS = {"client": "unread_for_user", "admin": "unread_for_admin"}
+
+def ticket_summary(ticket: dict, reader: str) -> TicketResponse:
+    return TicketResponse(
+        **{k: v for k, v in ticket.items() if k in TicketResponse.model_fields},
+        unread_count=ticket.get(TICKET_UNREAD_FIELDS[reader], 0)
+    )
+
+async def list_tickets(query: dict, reader: str, cursor: Optional[str], limit: int, response: Response) -> List[TicketResponse]:
+    """Ticket summaries, most recently active first; the next page cursor is in X-Next-Cursor"""
+    limit = max(1, min(limit, TICKET_MAX_PAGE_SIZE))
+    if cursor:
+        last_message_at, ticket_id = decode_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"last_message_at": {"$lt": last_message_at}},
+            {"last_message_at": last_message_at, "id": {"$lt": ticket_id}}
+        ]}]}
+    tickets = await db.tickets.find(query, {"_id": 0, "responses": 0}).sort(
+        [("last_message_at", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+    
+    if len(tickets) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(tickets[-1]["last_message_at"], tickets[-1]["id"])
+    return [ticket_summary(t, reader) for t in tickets]
+
+async def get_ticket_messages_page(ticket: dict, reader: str, cursor: Optional[str], limit: int, response: Response) -> List[TicketMessageResponse]:
+    """Thread messages oldest first; reaching the end of the thread marks it read for the reader"""
+    limit = max(1, min(limit, TICKET_MESSAGE_MAX_PAGE_SIZE))
+    query = {"ticket_id": ticket["id"]}
+    if cursor:
+        created_at, message_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "id": {"$gt": message_id}}
+        ]
+    messages = await db.ticket_messages.find(query, {"_id": 0}).sort(
+        [("created_at", 1), ("id", 1)]
+    ).limit(limit).to_list(limit)
+    
+    if len(messages) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(messages[-1]["created_at"], messages[-1]["id"])
+    elif ticket.get(TICKET_UNREAD_FIELDS[reader]):
+        await db.tickets.update_one({"id": ticket["id"]}, {"$set": {TICKET_UNREAD_FIELDS[reader]: 0}})
+    return [TicketMessageResponse(**m) for m in messages]
+
+async def add_ticket_message(ticket: dict, sender: str, author_id: str, message: str, status: Optional[str] = None) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    message_doc = {
+        "id": str(uuid.uuid4()),
+        "ticket_id": ticket["id"],
+        "sender": sender,
+        "author_id": author_id,
+        "message": message,
+        "created_at": now
+    }
+    await db.ticket_messages.insert_one(message_doc)
+    
+    other = "admin" if sender == "client" else "client"
+    update = {
+        "$set": {"last_message_at": now},
+        "$inc": {"message_count": 1, TICKET_UNREAD_FIELDS[other]: 1}
+    }
+    if status:
+        update["$set"]["status"] = status
+    before = await db.tickets.find_one_and_update(
+        {"id": ticket["id"]}, update,
+        projection={"_id": 0, "last_message_at": 1, "message_count": 1, "status": 1}
+    )
+    after = {**before, "last_message_at": now, "message_count": before.get("message_count", 0) + 1}
+    if status:
+        after["status"] = status
+    message_doc.pop("_id", None)
+    await log_audit(author_id, "ticket_replied", {"ticket_id": ticket["id"], "message_id": message_doc["id"], "sender": sender},
+                    before, after, entity={"collection": "tickets", "filter": {"id": ticket["id"]}})
+    return message_doc
+
+async def migrate_ticket_responses():
+    """Move responses embedded in legacy ticket documents into ticket_messages"""
+    async for ticket in db.tickets.find(
+        {"$or": [{"responses": {"$exists": True}}, {"last_message_at": {"$exists": False}}]}, {"_id": 0}
+    ):
+        responses = ticket.get("responses") or []
+        if responses:
+            # Deterministic ids make the copy safe to repeat if a worker stops midway
+            await db.ticket_messages.bulk_write([
+                UpdateOne({"id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{ticket['id']}/{i}"))}, {"$setOnInsert": {
+                    "ticket_id": ticket["id"],
+                    "sender": r.get("from", "admin"),
+                    "author_id": r.get("author_id", ""),
+                    "message": r.get("message", ""),
+                    "created_at": r.get("created_at", ticket["created_at"])
+                }}, upsert=True)
+                for i, r in enumerate(responses)
+            ], ordered=False)
+        await db.tickets.update_one({"id": ticket["id"]}, {
+            "$set": {
+                "last_message_at": max([ticket["created_at"]] + [r.get("created_at", "") for r in responses]),
+                "message_count": len(responses),
+                "unread_for_user": ticket.get("unread_for_user", 0),
+                "unread_for_admin": ticket.get("unread_for_admin", 0)
+            },
+            "$unset": {"responses": ""}
+        })
+
+async def get_client_ticket(ticket_id: str, user: dict) -> dict:
+    ticket = await db.tickets.find_one({"id": ticket_id, "user_id": user["id"]}, {"_id": 0, "responses": 0})
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return ticket
+
 @api_router.get("/tickets", response_model=List[TicketResponse])
-async def get_tickets(user: dict = Depends(get_current_user)):
-    tickets = await db.tickets.find({"user_id": user["id"]}, {"_id": 0}).to_list(100)
-    return [TicketResponse(**t) for t in tickets]
+async def get_tickets(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = TICKET_PAGE_SIZE,
+    user: dict = Depends(get_current_user)
+):
+    return await list_tickets({"user_id": user["id"]}, "client", cursor, limit, response)
 
 @api_router.post("/tickets", response_model=TicketResponse)
 async def create_ticket(ticket: TicketCreate, user: dict = Depends(get_current_user)):
@@ -774,19 +3269,100 @@ async def create_ticket(ticket: TicketCreate, user: dict = Depends(get_current_u
     ticket_dict["user_id"] = user["id"]
     ticket_dict["status"] = "open"
     ticket_dict["created_at"] = datetime.now(timezone.utc).isoformat()
-    ticket_dict["responses"] = []
+    ticket_dict["last_message_at"] = ticket_dict["created_at"]
+    ticket_dict["message_count"] = 0
+    ticket_dict["unread_for_user"] = 0
+    ticket_dict["unread_for_admin"] = 1
     
     await db.tickets.insert_one(ticket_dict)
-    return TicketResponse(**ticket_dict)
+    return ticket_summary(ticket_dict, "client")
+
+@api_router.get("/tickets/{ticket_id}", response_model=TicketResponse)
+async def get_ticket(ticket_id: str, user: dict = Depends(get_current_user)):
+    return ticket_summary(await get_client_ticket(ticket_id, user), "client")
+
+@api_router.get("/tickets/{ticket_id}/messages", response_model=List[TicketMessageResponse])
+async def get_ticket_messages(
+    ticket_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = TICKET_MESSAGE_PAGE_SIZE,
+    user: dict = Depends(get_current_user)
+):
+    ticket = await get_client_ticket(ticket_id, user)
+    return await get_ticket_messages_page(ticket, "client", cursor, limit, response)
+
+@api_router.post("/tickets/{ticket_id}/messages", response_model=TicketMessageResponse)
+async def reply_ticket(ticket_id: str, data: TicketMessageCreate, user: dict = Depends(get_current_user)):
+    ticket = await get_client_ticket(ticket_id, user)
+    if ticket["status"] == "closed":
+        raise HTTPException(status_code=400, detail="Ticket is closed")
+    # A client reply on a resolved ticket reopens it
+    status = "open" if ticket["status"] == "resolved" else None
+    message = await add_ticket_message(ticket, "client", user["id"], data.message, status)
+    return TicketMessageResponse(**message)
+
+# ==================== CONDITIONAL GET ====================
+
+# name -> {"etag", "last_modified", "checked_at"}; cleared on local updates and by the change stream
+resource_versions: Dict[str, dict] = {}
+
+def http_date(timestamp: Optional[str]) -> Optional[str]:
+    return format_datetime(parse_utc(timestamp), usegmt=True) if timestamp else None
+
+def is_not_modified(request: Request, version: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # If-None-Match uses the weak comparison, so W/ prefixes are ignored on both sides
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or version["etag"].removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and version.get("last_modified"):
+        try:
+            return parsedate_to_datetime(version["last_modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def conditional_headers(version: dict, cache_control: str) -> dict:
+    headers = {"ETag": version["etag"], "Cache-Control": cache_control}
+    if version.get("last_modified"):
+        headers["Last-Modified"] = version["last_modified"]
+    return headers
+
+async def serve_conditional(request: Request, name: str, cache_control: str, loader):
+    """Answer 304 from the in-memory version map when possible, otherwise load and tag the body.
+
+    `loader` returns (body, etag, updated_at).
+    """
+    version = resource_versions.get(name)
+    if version and time.monotonic() - version["checked_at"] < RESOURCE_VERSION_TTL_SECONDS:
+        if is_not_modified(request, version):
+            return Response(status_code=304, headers=conditional_headers(version, cache_control))
+    
+    body, etag, updated_at = await loader()
+    version = {"etag": etag, "last_modified": http_date(updated_at), "checked_at": time.monotonic()}
+    resource_versions[name] = version
+    if is_not_modified(request, version):
+        return Response(status_code=304, headers=conditional_headers(version, cache_control))
+    return JSONResponse(body, headers=conditional_headers(version, cache_control))
+
+def invalidate_resource(name: str):
+    resource_versions.pop(name, None)
 
 # ==================== CONTENT ENDPOINTS ====================
 
-@api_router.get("/content/funding-instructions")
-async def get_funding_instructions():
+async def load_funding_instructions():
     content = await db.content.find_one({"type": "funding_instructions"}, {"_id": 0})
     if not content:
-        return {"content": "Please contact us for funding instructions.", "version": 1}
-    return content
+        content = {"content": "Please contact us for funding instructions.", "version": 1}
+    return content, f'W/"funding-instructions-v{content.get("version", 1)}"', content.get("updated_at")
+
+@api_router.get("/content/funding-instructions")
+async def get_funding_instructions(request: Request):
+    return await serve_conditional(
+        request, "funding_instructions", "public, max-age=60, must-revalidate", load_funding_instructions
+    )
 
 # ==================== ADMIN ENDPOINTS ====================
 
@@ -797,7 +3373,7 @@ async def admin_dashboard(admin: dict = Depends(get_admin_user)):
     pending_transfers = await db.transactions.count_documents({"status": "pending"})
     total_accounts = await db.accounts.count_documents({})
     
-    # Calculate total balances
+    # Total balances come from the denormalized fields, so they are only as fresh as the last ledger snapshot
     pipeline = [
         {"$group": {
             "_id": "$currency",
@@ -805,13 +3381,15 @@ async def admin_dashboard(admin: dict = Depends(get_admin_user)):
         }}
     ]
     balance_by_currency = await db.accounts.aggregate(pipeline).to_list(100)
+    snapshot = await db.counters.find_one({"_id": "ledger_snapshot"})
     
     return {
         "total_customers": total_customers,
         "active_customers": active_customers,
         "pending_transfers": pending_transfers,
         "total_accounts": total_accounts,
-        "balance_by_currency": balance_by_currency
+        "balance_by_currency": balance_by_currency,
+        "balances_as_of": snapshot["as_of"] if snapshot else None
     }
 
 @api_router.get("/admin/customers", response_model=List[UserResponse])
@@ -828,6 +3406,74 @@ async def admin_get_customers(
     customers = await db.users.find(query, {"_id": 0, "password_hash": 0}).skip(skip).limit(limit).to_list(limit)
     return [UserResponse(**c) for c in customers]
 
+# frozen query -> (expires_at, total, exact)
+customer_count_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+async def approximate_customer_count(query: dict) -> tuple:
+    """Cached count capped at CUSTOMER_COUNT_LIMIT; returns (total, exact)"""
+    if query == {"role": "client"}:
+        # Every user but a handful of staff is a client; the collection metadata count is close enough
+        return await db.users.estimated_document_count(), False
+    key = json.dumps(query, sort_keys=True)
+    cached = customer_count_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        customer_count_cache.move_to_end(key)
+        return cached[1], cached[2]
+    total = await db.users.count_documents(query, limit=CUSTOMER_COUNT_LIMIT)
+    exact = total < CUSTOMER_COUNT_LIMIT
+    customer_count_cache[key] = (time.monotonic() + CUSTOMER_COUNT_CACHE_SECONDS, total, exact)
+    while len(customer_count_cache) > CUSTOMER_COUNT_CACHE_SIZE:
+        customer_count_cache.popitem(last=False)
+    return total, exact
+
+@api_router.get("/admin/customers/search", response_model=List[UserResponse])
+async def admin_search_customers(
+    response: Response,
+    email: Optional[str] = None,
+    name: Optional[str] = None,
+    phone: Optional[str] = None,
+    kyc_status: Optional[str] = None,
+    country: Optional[str] = None,
+    user_type: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = CUSTOMER_SEARCH_PAGE_SIZE,
+    admin: dict = Depends(get_admin_user)
+):
+    """Prefix search on email and name, exact phone match; totals in X-Total-Count are approximate"""
+    limit = max(1, min(limit, CUSTOMER_SEARCH_MAX_PAGE_SIZE))
+    query = {"role": "client"}
+    if email and normalize_search_text(email):
+        query["search_email"] = {"$regex": "^" + re.escape(normalize_search_text(email))}
+    if name and normalize_search_text(name):
+        query["search_names"] = {"$regex": "^" + re.escape(normalize_search_text(name))}
+    if phone:
+        query["search_phone"] = normalize_phone(phone)
+    for field, value in (("kyc_status", kyc_status), ("country", country), ("user_type", user_type), ("status", status)):
+        if value:
+            query[field] = value
+    
+    total, exact = await approximate_customer_count(query)
+    if cursor:
+        created_at, customer_id = decode_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": customer_id}}
+        ]}]}
+    
+    projection = {field: 1 for field in UserResponse.model_fields}
+    projection["_id"] = 0
+    customers = await db.users.find(query, projection).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+    
+    response.headers["X-Total-Count"] = str(total)
+    if not exact:
+        response.headers["X-Total-Count-Approximate"] = "true"
+    if len(customers) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(customers[-1]["created_at"], customers[-1]["id"])
+    return [UserResponse(**c) for c in customers]
+
 @api_router.get("/admin/customers/{customer_id}", response_model=UserResponse)
 async def admin_get_customer(customer_id: str, admin: dict = Depends(get_admin_user)):
     customer = await db.users.find_one({"id": customer_id}, {"_id": 0, "password_hash": 0})
@@ -835,6 +3481,52 @@ async def admin_get_customer(customer_id: str, admin: dict = Depends(get_admin_u
         raise HTTPException(status_code=404, detail="Customer not found")
     return UserResponse(**customer)
 
+@api_router.get("/admin/customers/{customer_id}/overview", response_model=CustomerOverview)
+async def admin_get_customer_overview(customer_id: str, admin: dict = Depends(get_admin_user)):
+    """Everything the customer view needs, fetched with concurrent indexed queries"""
+    n = CUSTOMER_OVERVIEW_ITEMS
+    
+    async def account_activity():
+        accounts = await db.accounts.find({"user_id": customer_id}, {"_id": 0}).to_list(100)
+        account_ids = [a["id"] for a in accounts]
+        accounts, transactions, wires = await asyncio.gather(
+            with_live_balances(accounts),
+            db.transactions.find(
+                {"account_id": {"$in": account_ids}}, {"_id": 0}
+            ).sort("created_at", -1).limit(n).to_list(n),
+            db.transactions.find(
+                {"account_id": {"$in": account_ids}, "transaction_type": "wire_out", "status": {"$in": ["pending", "approved"]}},
+                {"_id": 0}
+            ).sort("created_at", -1).to_list(100)
+        )
+        return accounts, transactions, wires
+    
+    audit_query = {"$or": [
+        {"user_id": customer_id},
+        {"entity_key": audit_entity_key({"collection": "users", "filter": {"id": customer_id}})}
+    ]}
+    customer, (accounts, transactions, wires), beneficiaries, tickets, audit_events = await asyncio.gather(
+        db.users.find_one({"id": customer_id}, {"_id": 0, "password_hash": 0}),
+        account_activity(),
+        db.beneficiaries.find({"user_id": customer_id}, {"_id": 0}).sort("created_at", -1).to_list(100),
+        db.tickets.find(
+            {"user_id": customer_id, "status": {"$in": ["open", "in_progress"]}}, {"_id": 0, "responses": 0}
+        ).sort([("last_message_at", -1), ("id", -1)]).limit(n).to_list(n),
+        query_audit_logs(audit_query, limit=n)
+    )
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    return CustomerOverview(
+        profile=UserResponse(**customer),
+        accounts=[AccountResponse(**a) for a in accounts],
+        recent_transactions=[TransactionResponse(**t) for t in transactions],
+        pending_wires=[TransactionResponse(**t) for t in wires],
+        beneficiaries=[BeneficiaryResponse(**b) for b in beneficiaries],
+        open_tickets=[ticket_summary(t, "admin") for t in tickets],
+        recent_audit_events=audit_events
+    )
+
 @api_router.put("/admin/customers/{customer_id}")
 async def admin_update_customer(
     customer_id: str,
@@ -849,12 +3541,25 @@ async def admin_update_customer(
     update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.users.update_one({"id": customer_id}, {"$set": update_dict})
+    if update.status and update.status != "active" and before.get("status") == "active":
+        # Suspension must cut off tokens that are already out there
+        await revoke_user_tokens(customer_id)
     
     after = await db.users.find_one({"id": customer_id}, {"_id": 0, "password_hash": 0})
-    await log_audit(admin["id"], "customer_updated", {"customer_id": customer_id}, before, after)
+    await log_audit(
+        admin["id"], "customer_updated", {"customer_id": customer_id}, before, after,
+        entity={"collection": "users", "filter": {"id": customer_id}}
+    )
     
     return {"message": "Customer updated"}
 
+@api_router.post("/admin/customers/{customer_id}/revoke-sessions", response_model=dict)
+async def admin_revoke_customer_sessions(customer_id: str, admin: dict = Depends(get_admin_user)):
+    before, after = await revoke_user_tokens(customer_id)
+    await log_audit(admin["id"], "sessions_revoked", {"customer_id": customer_id, "by": "admin"}, before, after,
+                    entity={"collection": "users", "filter": {"id": customer_id}})
+    return {"message": "Customer sessions revoked"}
+
 @api_router.post("/admin/customers", response_model=dict)
 async def admin_create_customer(user: UserCreate, admin: dict = Depends(get_admin_user)):
     existing = await db.users.find_one({"email": user.email})
@@ -863,12 +3568,13 @@ async def admin_create_customer(user: UserCreate, admin: dict = Depends(get_admi
     
     user_dict = user.model_dump()
     user_dict["id"] = str(uuid.uuid4())
-    user_dict["password_hash"] = pwd_context.hash(user_dict.pop("password"))
+    user_dict["password_hash"] = hash_password(user_dict.pop("password"))
     user_dict["role"] = "client"
     user_dict["status"] = "active"
     user_dict["kyc_status"] = "pending"
     user_dict["created_at"] = datetime.now(timezone.utc).isoformat()
     user_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+    user_dict.update(customer_search_keys(user_dict))
     
     await db.users.insert_one(user_dict)
     await log_audit(admin["id"], "customer_created_by_admin", {"customer_id": user_dict["id"]})
@@ -879,10 +3585,19 @@ async def admin_create_customer(user: UserCreate, admin: dict = Depends(get_admi
 async def admin_get_accounts(
     skip: int = 0,
     limit: int = 50,
+    user_id: Optional[str] = None,
+    fields: Optional[str] = None,
     admin: dict = Depends(get_admin_user)
 ):
-    accounts = await db.accounts.find({}, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    return accounts
+    selected = parse_fields(fields, AccountResponse)
+    query = {"user_id": user_id} if user_id else {}
+    accounts = await db.accounts.find(query, fields_projection(selected)).skip(skip).limit(limit).to_list(limit)
+    if selected is None:
+        return await with_live_balances(accounts)
+    # Balances come from the ledger, so only pay for them when asked
+    if any(f in BALANCE_FIELDS for f in selected):
+        accounts = await with_live_balances(accounts)
+    return sparse_response(accounts, AccountResponse, selected)
 
 @api_router.post("/admin/accounts", response_model=AccountResponse)
 async def admin_create_account(account: AccountCreate, admin: dict = Depends(get_admin_user)):
@@ -891,38 +3606,345 @@ async def admin_create_account(account: AccountCreate, admin: dict = Depends(get
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    account_dict = account.model_dump()
-    account_dict["id"] = str(uuid.uuid4())
-    account_dict["account_number"] = generate_account_number()
-    account_dict["available_balance"] = account.initial_balance
-    account_dict["transit_balance"] = 0.0
-    account_dict["held_balance"] = 0.0
-    account_dict["blocked_balance"] = 0.0
-    account_dict["status"] = "active"
-    account_dict["created_at"] = datetime.now(timezone.utc).isoformat()
-    del account_dict["initial_balance"]
+    account_dict = account.model_dump()
+    account_dict["id"] = str(uuid.uuid4())
+    account_dict["available_balance"] = account.initial_balance
+    account_dict["transit_balance"] = 0.0
+    account_dict["held_balance"] = 0.0
+    account_dict["blocked_balance"] = 0.0
+    account_dict["status"] = "active"
+    account_dict["ledger_bootstrapped"] = True
+    account_dict["created_at"] = datetime.now(timezone.utc).isoformat()
+    del account_dict["initial_balance"]
+    
+    # The unique index rejects numbers that clash with legacy randomly generated ones
+    for _ in range(5):
+        account_dict["account_number"] = await generate_account_number()
+        try:
+            await db.accounts.insert_one(account_dict)
+            break
+        except DuplicateKeyError:
+            account_dict.pop("_id", None)
+    else:
+        raise HTTPException(status_code=500, detail="Could not allocate account number")
+    
+    opening = opening_balance_entries(account_dict["id"], account.currency, {"available_balance": account.initial_balance})
+    if opening:
+        await post_ledger(opening, account_dict["account_number"], "Opening balance")
+    await log_audit(admin["id"], "account_created", {"account_id": account_dict["id"], "user_id": account.user_id})
+    
+    return AccountResponse(**account_dict)
+
+async def iter_request_lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def iter_import_records(request: Request, fmt: str):
+    """Yield (row, record, error) tuples parsed incrementally from the request body"""
+    row = 0
+    if fmt == "ndjson":
+        async for line in iter_request_lines(request):
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                yield row, json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield row, None, f"Invalid JSON: {e}"
+        return
+    
+    header = None
+    pending = ""
+    async for line in iter_request_lines(request):
+        pending = f"{pending}\n{line}" if pending else line
+        # An odd quote count means a quoted field continues on the next line
+        if pending.count('"') % 2:
+            continue
+        text, pending = pending, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        row += 1
+        record = {k: v.strip() for k, v in zip(header, values) if v.strip()}
+        account = {k: record.pop(k) for k in ("account_type", "currency", "initial_balance") if k in record}
+        if account:
+            record["accounts"] = [account]
+        yield row, record, None
+    if pending:
+        yield row + 1, None, "Unterminated quoted field"
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+def import_accounts_error(accounts: List[ImportAccount]) -> Optional[str]:
+    for i, account in enumerate(accounts):
+        if account.currency not in SUPPORTED_CURRENCIES:
+            return f"accounts.{i}.currency: Unsupported currency {account.currency}"
+        if account.initial_balance < 0:
+            return f"accounts.{i}.initial_balance: Opening balance cannot be negative"
+    return None
+
+async def import_batch(batch: list, seen_emails: set, report: dict):
+    valid = []
+    for row, record, error in batch:
+        if error is None:
+            try:
+                parsed = ImportRecord(**record)
+                error = import_accounts_error(parsed.accounts)
+                if error is None and parsed.email in seen_emails:
+                    error = "Duplicate email in import"
+                elif error is None:
+                    seen_emails.add(parsed.email)
+                    valid.append((row, parsed))
+                    continue
+            except ValidationError as e:
+                error = format_validation_error(e)
+            except TypeError:
+                error = "Record must be an object"
+        email = record.get("email") if isinstance(record, dict) else None
+        report["errors"].append({"row": row, "email": email, "error": error})
+    
+    if not valid:
+        return
+    
+    existing = await db.users.find(
+        {"email": {"$in": [r.email for _, r in valid]}}, {"_id": 0, "email": 1}
+    ).to_list(len(valid))
+    existing_emails = {u["email"] for u in existing}
+    for row, record in [v for v in valid if v[1].email in existing_emails]:
+        report["errors"].append({"row": row, "email": record.email, "error": "Email already registered"})
+    valid = [v for v in valid if v[1].email not in existing_emails]
+    if not valid:
+        return
+    
+    password_hashes = await hash_passwords_parallel([r.password for _, r in valid])
+    now = datetime.now(timezone.utc).isoformat()
+    users = []
+    for (row, record), password_hash in zip(valid, password_hashes):
+        user_dict = record.model_dump(exclude={"password", "accounts"})
+        user_dict.update({
+            "id": str(uuid.uuid4()),
+            "password_hash": password_hash,
+            "role": "client",
+            "status": "active",
+            "kyc_status": "pending",
+            "created_at": now,
+            "updated_at": now
+        })
+        user_dict.update(customer_search_keys(user_dict))
+        users.append(user_dict)
+    
+    failed = set()
+    try:
+        await db.users.insert_many(users, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            failed.add(err["index"])
+            row, record = valid[err["index"]]
+            report["errors"].append({"row": row, "email": record.email, "error": err.get("errmsg", "Insert failed")})
+    
+    accounts = []
+    account_rows = []
+    for i, ((row, record), user_dict) in enumerate(zip(valid, users)):
+        if i in failed:
+            continue
+        report["imported"] += 1
+        for account in record.accounts:
+            accounts.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_dict["id"],
+                "account_number": await generate_account_number(),
+                "account_type": account.account_type,
+                "currency": account.currency,
+                "available_balance": account.initial_balance,
+                "transit_balance": 0.0,
+                "held_balance": 0.0,
+                "blocked_balance": 0.0,
+                "status": "active",
+                "ledger_bootstrapped": True,
+                "created_at": now
+            })
+            account_rows.append((row, record.email))
+    
+    if accounts:
+        failed = set()
+        try:
+            await db.accounts.insert_many(accounts, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                failed.add(err["index"])
+                row, email = account_rows[err["index"]]
+                report["errors"].append({"row": row, "email": email, "error": f"Account not created: {err.get('errmsg')}"})
+        
+        created = [acc for i, acc in enumerate(accounts) if i not in failed]
+        report["accounts_created"] += len(created)
+        postings = []
+        for acc in created:
+            opening = opening_balance_entries(acc["id"], acc["currency"], {"available_balance": acc["available_balance"]})
+            if opening:
+                postings.extend(build_ledger_posting(opening, acc["account_number"], "Opening balance"))
+        if postings:
+            await db.ledger.insert_many(postings)
+
+@api_router.post("/admin/import")
+async def admin_import_customers(
+    request: Request,
+    format: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    """Bulk import customers and their accounts from a streamed CSV or NDJSON body"""
+    fmt = format or ("ndjson" if "ndjson" in request.headers.get("content-type", "") else "csv")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+    
+    report = {"imported": 0, "accounts_created": 0, "errors": []}
+    seen_emails = set()
+    batch = []
+    rows = 0
+    async for item in iter_import_records(request, fmt):
+        rows += 1
+        batch.append(item)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await import_batch(batch, seen_emails, report)
+            batch = []
+    if batch:
+        await import_batch(batch, seen_emails, report)
     
-    await db.accounts.insert_one(account_dict)
-    await log_audit(admin["id"], "account_created", {"account_id": account_dict["id"], "user_id": account.user_id})
+    report["errors"].sort(key=lambda e: e["row"])
+    report["rows"] = rows
+    report["failed"] = rows - report["imported"]
+    await log_audit(admin["id"], "customers_imported", {
+        "format": fmt,
+        "rows": rows,
+        "imported": report["imported"],
+        "accounts_created": report["accounts_created"],
+        "failed": report["failed"]
+    })
+    return report
+
+@api_router.get("/admin/velocity-rules", response_model=VelocityRules)
+async def admin_get_velocity_rules(admin: dict = Depends(get_admin_user)):
+    return VelocityRules(rules=velocity_engine.rules)
+
+@api_router.put("/admin/velocity-rules", response_model=VelocityRules)
+async def admin_update_velocity_rules(update: VelocityRules, admin: dict = Depends(get_admin_user)):
+    if admin["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Super admin access required")
+    for rule in update.rules:
+        if rule.scope not in ("account", "user") or rule.metric not in ("amount", "count", "new_beneficiary_count"):
+            raise HTTPException(status_code=400, detail=f"Invalid velocity rule {rule.name}")
     
-    return AccountResponse(**account_dict)
+    before = await db.settings.find_one({"type": "velocity_rules"}, {"_id": 0})
+    rules = [r.model_dump() for r in update.rules]
+    await db.settings.update_one({"type": "velocity_rules"}, {"$set": {"rules": rules}}, upsert=True)
+    velocity_engine.set_rules(rules)
+    await log_audit(admin["id"], "velocity_rules_updated", {"rules": len(rules)},
+                    before, {"type": "velocity_rules", "rules": rules},
+                    entity={"collection": "settings", "filter": {"type": "velocity_rules"}})
+    return update
 
 @api_router.get("/admin/transfers")
 async def admin_get_transfers(
     skip: int = 0,
     limit: int = 50,
     status: Optional[str] = None,
+    review: bool = False,
+    fields: Optional[str] = None,
     admin: dict = Depends(get_admin_user)
 ):
+    selected = parse_fields(fields, AdminTransactionResponse)
     query = {}
     if status:
         query["status"] = status
+    if review:
+        query["risk_review"] = {"$exists": True}
     
     transfers = await db.transactions.find(
-        query, {"_id": 0}
+        query, fields_projection(selected)
     ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    if selected:
+        return sparse_response(transfers, AdminTransactionResponse, selected)
     return transfers
 
+@api_router.get("/admin/transactions/search", response_model=List[TransactionResponse])
+async def admin_search_transactions(
+    reference: Optional[str] = None,
+    counterparty: Optional[str] = None,
+    q: Optional[str] = None,
+    account_id: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 50,
+    admin: dict = Depends(get_admin_user)
+):
+    """Search transactions by reference, counterparty prefix or description text"""
+    limit = min(limit, 200)
+    query = {}
+    if reference:
+        query["reference"] = reference.strip().upper()
+    if counterparty:
+        # Anchored prefix regex so the counterparty index is used as a range scan
+        query["counterparty"] = {"$regex": f"^{re.escape(counterparty.strip())}"}
+    if q:
+        query["$text"] = {"$search": q}
+    if account_id:
+        query["account_id"] = account_id
+    # Amounts are signed (debits are negative)
+    if min_amount is not None:
+        query["amount"] = {"$gte": min_amount}
+    if max_amount is not None:
+        query["amount"] = {**query.get("amount", {}), "$lte": max_amount}
+    if from_date:
+        query["created_at"] = {"$gte": from_date}
+    if to_date:
+        query["created_at"] = {**query.get("created_at", {}), "$lte": to_date}
+    
+    transactions = await db.transactions.find(
+        query, {"_id": 0}
+    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    return [TransactionResponse(**tx) for tx in transactions]
+
+@api_router.get("/admin/analytics/volume", response_model=RollupChart)
+async def admin_get_volume_analytics(
+    period: str,
+    currency: Optional[str] = None,
+    account_id: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    """Bank-wide volume for one currency, or a single account's activity"""
+    if account_id:
+        return await get_rollup_chart("account", account_id, period)
+    if currency not in SUPPORTED_CURRENCIES:
+        raise HTTPException(status_code=400, detail="Unsupported currency")
+    return await get_rollup_chart("currency", currency, period)
+
+@api_router.post("/admin/analytics/rebuild")
+async def admin_rebuild_analytics(
+    background_tasks: BackgroundTasks,
+    from_date: Optional[str] = None,
+    admin: dict = Depends(get_admin_user)
+):
+    """Recompute rollups from the transaction history (from the start of from_date's month)"""
+    if admin["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Super admin access required")
+    background_tasks.add_task(traced_job(rebuild_rollups), from_date)
+    await log_audit(admin["id"], "rollups_rebuild_requested", {"from_date": from_date})
+    return {"message": "Rollup rebuild started"}
+
 @api_router.put("/admin/transfers/{transfer_id}")
 async def admin_update_transfer(
     transfer_id: str,
@@ -933,38 +3955,44 @@ async def admin_update_transfer(
     if not before:
         raise HTTPException(status_code=404, detail="Transfer not found")
     
-    # Handle status changes for wire transfers
-    if before["status"] == "pending" and update.status in ["completed", "approved"]:
-        # Move from transit to available (for completed incoming) or remove transit (for outgoing)
-        if before["transaction_type"] == "wire_out":
-            await db.accounts.update_one(
-                {"id": before["account_id"]},
-                {"$inc": {"transit_balance": abs(before["amount"])}}
-            )
-    elif before["status"] == "pending" and update.status in ["rejected", "cancelled"]:
-        # Return funds to available balance
-        if before["transaction_type"] == "wire_out":
-            await db.accounts.update_one(
-                {"id": before["account_id"]},
-                {
-                    "$inc": {
-                        "available_balance": abs(before["amount"]),
-                        "transit_balance": -abs(before["amount"])
-                    }
-                }
-            )
+    if before.get("settlement_batch_id"):
+        raise HTTPException(status_code=409, detail="Transfer is part of a settlement batch")
+    if update.status not in {"pending", "processing", "approved", "completed", "rejected", "cancelled"}:
+        raise HTTPException(status_code=400, detail="Invalid transfer status")
+    if update.status not in TRANSFER_TRANSITIONS.get(before["status"], set()):
+        raise HTTPException(status_code=409, detail=f"Cannot change a {before['status']} transfer to {update.status}")
     
-    await db.transactions.update_one(
-        {"id": transfer_id},
+    # Only the request that flips the status posts; a concurrent update or batch claim loses here
+    result = await db.transactions.update_one(
+        {"id": transfer_id, "status": before["status"], "settlement_batch_id": None},
         {"$set": {"status": update.status, "notes": update.notes}}
     )
+    if result.modified_count != 1:
+        raise HTTPException(status_code=409, detail="Transfer was changed by another request")
+    
+    # Approved wires keep their funds in transit until completed individually or
+    # through a settlement batch; posting ids are shared with the batch path.
+    amount = abs(before["amount"])
+    if update.status == "completed":
+        # Outgoing funds leave transit for the external clearing account
+        if before["transaction_type"] == "wire_out":
+            await post_ledger(wire_settlement_entries(before), before["reference"], "Wire settled", f"settlement:{transfer_id}")
+    elif update.status in ["rejected", "cancelled"]:
+        # Return funds to available balance
+        if before["transaction_type"] == "wire_out":
+            await post_ledger([
+                ledger_entry(before["account_id"], "transit_balance", -amount, before["currency"]),
+                ledger_entry(before["account_id"], "available_balance", amount, before["currency"])
+            ], before["reference"], "Wire returned", f"reject:{transfer_id}")
+        await forget_transfer_velocity(before)
     
     after = await db.transactions.find_one({"id": transfer_id}, {"_id": 0})
+    await adjust_rollups(before, after)
     await log_audit(admin["id"], "transfer_status_updated", {
         "transfer_id": transfer_id,
         "old_status": before["status"],
         "new_status": update.status
-    }, before, after)
+    }, before, after, entity={"collection": "transactions", "filter": {"id": transfer_id}})
     
     return {"message": "Transfer updated"}
 
@@ -975,8 +4003,10 @@ async def admin_create_instrument(instrument: InstrumentCreate, admin: dict = De
     inst_dict["status"] = "active"
     inst_dict["created_by"] = admin["id"]
     inst_dict["created_at"] = datetime.now(timezone.utc).isoformat()
+    inst_dict["version"] = 1
     
     await db.instruments.insert_one(inst_dict)
+    invalidate_instrument_content(inst_dict["id"])
     await log_audit(admin["id"], "instrument_created", {"instrument_id": inst_dict["id"]})
     
     return InstrumentResponse(**inst_dict)
@@ -989,6 +4019,7 @@ async def admin_get_instruments(admin: dict = Depends(get_admin_user)):
 @api_router.delete("/admin/instruments/{instrument_id}")
 async def admin_delete_instrument(instrument_id: str, admin: dict = Depends(get_admin_user)):
     result = await db.instruments.delete_one({"id": instrument_id})
+    invalidate_instrument_content(instrument_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Instrument not found")
     
@@ -1007,12 +4038,12 @@ async def admin_redact_transaction(
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Recalculate balance
-    if transaction["status"] == "completed":
-        await db.accounts.update_one(
-            {"id": transaction["account_id"]},
-            {"$inc": {"available_balance": -transaction["amount"]}}
-        )
+    # Reverse the balance effect with a compensating posting
+    if transaction["status"] == "completed" and not transaction.get("is_redacted"):
+        await post_ledger([
+            ledger_entry(transaction["account_id"], "available_balance", -transaction["amount"], transaction["currency"]),
+            ledger_entry(system_account("redaction_adjustments", transaction["currency"]), "available_balance", transaction["amount"], transaction["currency"])
+        ], transaction["reference"], "Transaction redacted")
     
     # Mark as redacted
     await db.transactions.update_one(
@@ -1020,13 +4051,77 @@ async def admin_redact_transaction(
         {"$set": {"is_redacted": True, "redacted_by": admin["id"], "redacted_at": datetime.now(timezone.utc).isoformat()}}
     )
     
+    after = await db.transactions.find_one({"id": transaction_id}, {"_id": 0})
+    await adjust_rollups(transaction, after)
     await log_audit(admin["id"], "transaction_redacted", {
         "transaction_id": transaction_id,
         "original_amount": transaction["amount"]
-    }, transaction, {"is_redacted": True})
+    }, transaction, after, entity={"collection": "transactions", "filter": {"id": transaction_id}})
     
     return {"message": "Transaction redacted"}
 
+@api_router.get("/admin/tickets", response_model=List[TicketResponse])
+async def admin_get_tickets(
+    response: Response,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    user_id: Optional[str] = None,
+    unread: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = TICKET_PAGE_SIZE,
+    admin: dict = Depends(get_admin_user)
+):
+    query = {}
+    if status:
+        query["status"] = status
+    if category:
+        query["category"] = category
+    if user_id:
+        query["user_id"] = user_id
+    if unread:
+        query["unread_for_admin"] = {"$gt": 0}
+    return await list_tickets(query, "admin", cursor, limit, response)
+
+async def get_admin_ticket(ticket_id: str) -> dict:
+    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0, "responses": 0})
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return ticket
+
+@api_router.get("/admin/tickets/{ticket_id}/messages", response_model=List[TicketMessageResponse])
+async def admin_get_ticket_messages(
+    ticket_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = TICKET_MESSAGE_PAGE_SIZE,
+    admin: dict = Depends(get_admin_user)
+):
+    ticket = await get_admin_ticket(ticket_id)
+    return await get_ticket_messages_page(ticket, "admin", cursor, limit, response)
+
+@api_router.post("/admin/tickets/{ticket_id}/messages", response_model=TicketMessageResponse)
+async def admin_reply_ticket(ticket_id: str, data: TicketMessageCreate, admin: dict = Depends(get_admin_user)):
+    ticket = await get_admin_ticket(ticket_id)
+    # The first support reply moves an open ticket into progress
+    status = "in_progress" if ticket["status"] == "open" else None
+    message = await add_ticket_message(ticket, "admin", admin["id"], data.message, status)
+    return TicketMessageResponse(**message)
+
+@api_router.put("/admin/tickets/{ticket_id}")
+async def admin_update_ticket(ticket_id: str, update: AdminTicketUpdate, admin: dict = Depends(get_admin_user)):
+    if update.status not in TICKET_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid ticket status")
+    before = await get_admin_ticket(ticket_id)
+    after = await db.tickets.find_one_and_update(
+        {"id": ticket_id},
+        {"$set": {"status": update.status}},
+        projection={"_id": 0, "responses": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    await log_audit(admin["id"], "ticket_updated", {"ticket_id": ticket_id, "status": update.status},
+                    before, after, entity={"collection": "tickets", "filter": {"id": ticket_id}})
+    return {"message": "Ticket updated"}
+
 @api_router.get("/admin/settings")
 async def admin_get_settings(admin: dict = Depends(get_admin_user)):
     settings = await db.settings.find({}, {"_id": 0}).to_list(100)
@@ -1084,18 +4179,779 @@ async def admin_update_funding_instructions(
         upsert=True
     )
     
+    invalidate_resource("funding_instructions")
     await log_audit(admin["id"], "funding_instructions_updated", {"version": version})
     return {"message": "Funding instructions updated", "version": version}
 
+# ==================== HOLDS ====================
+
+# A hold moves funds from available into held_balance (blocks use blocked_balance).
+# Placing one inserts it as "placing", posts the ledger entries and then flips it
+# to active. Closing one first flips its status with settled=False, then posts the
+# ledger entries and sets settled=True. The sweeper finishes either step when a
+# crash interrupts it. Posting ids are derived from the hold and the step, so a
+# repost after a crash that happened past the ledger insert is rejected by the
+# unique (posting_id, leg) index.
+
+def hold_posting_id(hold: dict) -> str:
+    return f"hold:{hold['id']}:{hold['status']}"
+
+def hold_place_entries(hold: dict) -> List[dict]:
+    return [
+        ledger_entry(hold["account_id"], "available_balance", -hold["amount"], hold["currency"]),
+        ledger_entry(hold["account_id"], HOLD_BALANCE_FIELDS[hold["kind"]], hold["amount"], hold["currency"])
+    ]
+
+async def finish_placing_hold(hold: dict):
+    await post_ledger(hold_place_entries(hold), hold["reference"], f"{hold['kind'].capitalize()} placed", f"hold:{hold['id']}:placed")
+    await db.holds.update_one({"id": hold["id"], "status": "placing"}, {"$set": {"status": "active"}})
+    hold["status"] = "active"
+
+def hold_close_entries(hold: dict, captured: float = 0.0) -> List[dict]:
+    field = HOLD_BALANCE_FIELDS[hold["kind"]]
+    entries = [
+        ledger_entry(hold["account_id"], field, -hold["amount"], hold["currency"]),
+        ledger_entry(hold["account_id"], "available_balance", hold["amount"] - captured, hold["currency"])
+    ]
+    if captured:
+        entries.append(ledger_entry(system_account("hold_captures", hold["currency"]), "available_balance", captured, hold["currency"]))
+    return entries
+
+async def close_hold(hold_id: str, new_status: str, captured: Optional[float] = None) -> dict:
+    """Atomically move an active hold to its final status, then post the balance change"""
+    update = {"status": new_status, "settled": False, "closed_at": datetime.now(timezone.utc).isoformat()}
+    if captured is not None:
+        update["captured_amount"] = captured
+    hold = await db.holds.find_one_and_update(
+        {"id": hold_id, "status": "active"},
+        {"$set": update},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not hold:
+        raise HTTPException(status_code=409, detail="Hold not found or no longer active")
+    await post_ledger(hold_close_entries(hold, captured or 0.0), hold["reference"], f"Hold {new_status}", hold_posting_id(hold))
+    await db.holds.update_one({"id": hold_id}, {"$set": {"settled": True}})
+    return hold
+
+async def sweep_expired_holds():
+    """Release expired holds in batches: one bulk status flip, one ledger insert, one settle"""
+    if not await acquire_job_lease("hold_sweeper", HOLD_SWEEP_INTERVAL_SECONDS * 5):
+        return
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        
+        # Finish holds whose close was interrupted between the status flip and the posting
+        repair_before = (datetime.now(timezone.utc) - timedelta(seconds=HOLD_REPAIR_AFTER_SECONDS)).isoformat()
+        # and those whose placement stopped between the insert and going active
+        async for hold in db.holds.find({"status": "placing", "created_at": {"$lt": repair_before}}, {"_id": 0}):
+            await finish_placing_hold(hold)
+        async for hold in db.holds.find({"settled": False, "closed_at": {"$lt": repair_before}}, {"_id": 0}):
+            await post_ledger(
+                hold_close_entries(hold, hold.get("captured_amount") or 0.0), hold["reference"],
+                f"Hold {hold['status']}", hold_posting_id(hold)
+            )
+            await db.holds.update_one({"id": hold["id"]}, {"$set": {"settled": True}})
+        
+        while True:
+            expired = await db.holds.find(
+                {"status": "active", "expires_at": {"$lte": now}}, {"_id": 0, "id": 1}
+            ).limit(HOLD_SWEEP_BATCH_SIZE).to_list(HOLD_SWEEP_BATCH_SIZE)
+            if not expired:
+                break
+            sweep_id = str(uuid.uuid4())
+            await db.holds.bulk_write([
+                UpdateOne({"id": h["id"], "status": "active"}, {"$set": {
+                    "status": "expired", "settled": False, "closed_at": now, "sweep_id": sweep_id
+                }})
+                for h in expired
+            ], ordered=False)
+            # Only the holds this sweep flipped; a concurrent release may have won some
+            swept = await db.holds.find({"sweep_id": sweep_id}, {"_id": 0}).to_list(None)
+            postings = []
+            for hold in swept:
+                postings.extend(build_ledger_posting(
+                    hold_close_entries(hold), hold["reference"], "Hold expired", hold_posting_id(hold)
+                ))
+            if postings:
+                await insert_ledger_documents(postings)
+            await db.holds.update_many({"sweep_id": sweep_id}, {"$set": {"settled": True}})
+            logger.info("Released %d expired holds", len(swept))
+    finally:
+        await release_job_lease("hold_sweeper")
+
+@api_router.post("/admin/accounts/{account_id}/holds", response_model=HoldResponse)
+async def admin_place_hold(account_id: str, hold_request: HoldCreate, admin: dict = Depends(get_admin_user)):
+    if hold_request.kind not in HOLD_BALANCE_FIELDS:
+        raise HTTPException(status_code=400, detail="Kind must be hold or block")
+    if hold_request.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    account = await db.accounts.find_one({"id": account_id}, {"_id": 0})
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    now = datetime.now(timezone.utc)
+    expires_at = hold_request.expires_at and parse_utc(hold_request.expires_at).isoformat()
+    if hold_request.kind == "hold" and not expires_at:
+        expires_at = (now + timedelta(hours=HOLD_DEFAULT_TTL_HOURS)).isoformat()
+    hold = {
+        "id": str(uuid.uuid4()),
+        "account_id": account_id,
+        "kind": hold_request.kind,
+        "amount": hold_request.amount,
+        "currency": account["currency"],
+        "reason": hold_request.reason,
+        "reference": generate_reference(),
+        "status": "placing",
+        "expires_at": expires_at,
+        "created_by": admin["id"],
+        "created_at": now.isoformat()
+    }
+    async with account_debit_lock(account_id):
+        balances = await get_account_balances(account_id)
+        if balances["available_balance"] < hold_request.amount:
+            raise HTTPException(status_code=400, detail="Insufficient balance")
+        # The hold exists before its funds move, so a crash never leaves held funds without one
+        await db.holds.insert_one(hold)
+        hold.pop("_id", None)
+        await finish_placing_hold(hold)
+    await log_audit(admin["id"], "hold_placed", {
+        "hold_id": hold["id"], "account_id": account_id, "kind": hold["kind"], "amount": hold["amount"]
+    })
+    return HoldResponse(**hold)
+
+@api_router.get("/admin/accounts/{account_id}/holds", response_model=List[HoldResponse])
+async def admin_get_holds(account_id: str, status: Optional[str] = None, admin: dict = Depends(get_admin_user)):
+    query = {"account_id": account_id}
+    if status:
+        query["status"] = status
+    holds = await db.holds.find(query, {"_id": 0}).sort("created_at", -1).to_list(200)
+    return [HoldResponse(**h) for h in holds]
+
+@api_router.post("/admin/holds/{hold_id}/release", response_model=HoldResponse)
+async def admin_release_hold(hold_id: str, admin: dict = Depends(get_admin_user)):
+    hold = await close_hold(hold_id, "released")
+    await log_audit(admin["id"], "hold_released", {"hold_id": hold_id, "account_id": hold["account_id"]})
+    return HoldResponse(**hold)
+
+@api_router.post("/admin/holds/{hold_id}/capture", response_model=HoldResponse)
+async def admin_capture_hold(hold_id: str, capture: HoldCapture, admin: dict = Depends(get_admin_user)):
+    hold = await db.holds.find_one({"id": hold_id}, {"_id": 0, "amount": 1, "kind": 1})
+    if not hold:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    if hold["kind"] != "hold":
+        raise HTTPException(status_code=400, detail="Blocks cannot be captured")
+    amount = hold["amount"] if capture.amount is None else capture.amount
+    if amount <= 0 or amount > hold["amount"]:
+        raise HTTPException(status_code=400, detail="Capture amount must be positive and at most the held amount")
+    hold = await close_hold(hold_id, "captured", amount)
+    await log_audit(admin["id"], "hold_captured", {"hold_id": hold_id, "account_id": hold["account_id"], "amount": amount})
+    return HoldResponse(**hold)
+
+@api_router.get("/accounts/{account_id}/holds", response_model=List[HoldResponse])
+async def get_account_holds(account_id: str, user: dict = Depends(get_current_user)):
+    account = await db.accounts.find_one({"id": account_id, "user_id": user["id"]})
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    holds = await db.holds.find({"account_id": account_id, "status": "active"}, {"_id": 0}).sort("created_at", -1).to_list(200)
+    return [HoldResponse(**h) for h in holds]
+
+# ==================== SETTLEMENT ENDPOINTS ====================
+
+def pain001_header(batch: dict, count: int, total: float) -> str:
+    created = xml_escape(batch["created_at"][:19])
+    summary = f"<NbOfTxs>{count}</NbOfTxs><CtrlSum>{total:.2f}</CtrlSum>"
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">\n'
+        '<CstmrCdtTrfInitn>\n'
+        f'<GrpHdr><MsgId>{batch["id"]}</MsgId><CreDtTm>{created}</CreDtTm>{summary}'
+        f'<InitgPty><Nm>{BANK_NAME}</Nm></InitgPty></GrpHdr>\n'
+        f'<PmtInf><PmtInfId>{batch["id"]}</PmtInfId><PmtMtd>TRF</PmtMtd>{summary}'
+        f'<ReqdExctnDt>{created[:10]}</ReqdExctnDt><Dbtr><Nm>{BANK_NAME}</Nm></Dbtr>'
+        f'<DbtrAcct><Id><Othr><Id>{system_account("external_clearing", batch["currency"])}</Id></Othr></Id></DbtrAcct>'
+        f'<DbtrAgt><FinInstnId><BIC>{BANK_BIC}</BIC></FinInstnId></DbtrAgt>\n'
+    )
+
+PAIN001_FOOTER = "</PmtInf>\n</CstmrCdtTrfInitn>\n</Document>\n"
+
+def pain001_transaction(tx: dict, account: dict, beneficiary: dict) -> str:
+    agent = f"<BIC>{xml_escape(beneficiary['swift_code'])}</BIC>" if beneficiary.get("swift_code") else \
+        f"<Othr><Id>{xml_escape(beneficiary.get('routing_number') or 'NOTPROVIDED')}</Id></Othr>"
+    return (
+        f'<CdtTrfTxInf><PmtId><EndToEndId>{xml_escape(tx["reference"])}</EndToEndId></PmtId>'
+        f'<Amt><InstdAmt Ccy="{xml_escape(tx["currency"])}">{abs(tx["amount"]):.2f}</InstdAmt></Amt>'
+        f'<UltmtDbtr><Id><OrgId><Othr><Id>{xml_escape(account.get("account_number", ""))}</Id></Othr></OrgId></Id></UltmtDbtr>'
+        f'<CdtrAgt><FinInstnId>{agent}</FinInstnId></CdtrAgt>'
+        f'<Cdtr><Nm>{xml_escape(beneficiary.get("name", tx.get("counterparty") or ""))}</Nm></Cdtr>'
+        f'<CdtrAcct><Id><Othr><Id>{xml_escape(beneficiary.get("account_number", ""))}</Id></Othr></Id></CdtrAcct>'
+        f'<RmtInf><Ustrd>{xml_escape(tx.get("description") or "")}</Ustrd></RmtInf></CdtTrfTxInf>\n'
+    )
+
+SETTLEMENT_CSV_FIELDS = [
+    "reference", "amount", "currency", "debtor_account", "beneficiary_name",
+    "beneficiary_account", "bank_name", "swift_code", "routing_number", "description"
+]
+
+def settlement_csv_row(tx: dict, account: dict, beneficiary: dict) -> list:
+    return [
+        tx["reference"], f"{abs(tx['amount']):.2f}", tx["currency"], account.get("account_number", ""),
+        beneficiary.get("name", tx.get("counterparty") or ""), beneficiary.get("account_number", ""),
+        beneficiary.get("bank_name") or "", beneficiary.get("swift_code") or "",
+        beneficiary.get("routing_number") or "", tx.get("description") or ""
+    ]
+
+async def iter_settlement_chunks(batch_id: str):
+    """Yield batch transactions with their accounts and beneficiaries, one chunk at a time"""
+    # Wires rejected since the claim stay out of the file
+    cursor = db.transactions.find(
+        {"settlement_batch_id": batch_id, "status": "approved"},
+        {"_id": 0, "id": 1, "account_id": 1, "beneficiary_id": 1, "amount": 1, "currency": 1,
+         "reference": 1, "counterparty": 1, "description": 1}
+    ).sort("created_at", 1).batch_size(SETTLEMENT_CHUNK_SIZE)
+    chunk = []
+    async for tx in cursor:
+        chunk.append(tx)
+        if len(chunk) >= SETTLEMENT_CHUNK_SIZE:
+            yield await attach_settlement_parties(chunk)
+            chunk = []
+    if chunk:
+        yield await attach_settlement_parties(chunk)
+
+async def attach_settlement_parties(chunk: List[dict]) -> List[tuple]:
+    account_ids = list({tx["account_id"] for tx in chunk})
+    beneficiary_ids = list({tx.get("beneficiary_id") for tx in chunk if tx.get("beneficiary_id")})
+    accounts = {a["id"]: a for a in await db.accounts.find(
+        {"id": {"$in": account_ids}}, {"_id": 0, "id": 1, "account_number": 1}
+    ).to_list(len(account_ids))}
+    beneficiaries = {b["id"]: b for b in await db.beneficiaries.find(
+        {"id": {"$in": beneficiary_ids}}, {"_id": 0}
+    ).to_list(len(beneficiary_ids))}
+    return [(tx, accounts.get(tx["account_id"], {}), beneficiaries.get(tx.get("beneficiary_id"), {})) for tx in chunk]
+
+def settlement_csv_text(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+async def claim_settlement_wires(batch: dict) -> int:
+    """Point unclaimed approved wires up to the cut-off at the batch; later wires wait for the next one"""
+    result = await db.transactions.update_many(
+        {
+            "transaction_type": "wire_out",
+            "status": "approved",
+            "currency": batch["currency"],
+            "created_at": {"$lte": batch["cutoff"]},
+            "settlement_batch_id": None
+        },
+        {"$set": {"settlement_batch_id": batch["id"]}}
+    )
+    return result.modified_count
+
+async def release_settlement_wires(batch_id: str):
+    """Hand a batch's unsettled wires back, so they can be rejected or go into another batch"""
+    await db.transactions.update_many(
+        {"settlement_batch_id": batch_id, "status": "approved"}, {"$set": {"settlement_batch_id": None}}
+    )
+
+async def generate_settlement_file(batch: dict):
+    """Stream the batch's wires into a settlement file without holding them in memory.
+
+    Runs under the settlement:<batch id> job lease taken by the endpoint; on failure
+    the wires are released and the batch can be regenerated.
+    """
+    lease = f"settlement:{batch['id']}"
+    try:
+        totals = await db.transactions.aggregate([
+            {"$match": {"settlement_batch_id": batch["id"], "status": "approved"}},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "total": {"$sum": {"$abs": "$amount"}}}}
+        ]).to_list(1)
+        count = totals[0]["count"] if totals else 0
+        total = round(totals[0]["total"], 2) if totals else 0.0
+        
+        await asyncio.to_thread(SETTLEMENT_DIR.mkdir, parents=True, exist_ok=True)
+        path = SETTLEMENT_DIR / f"{batch['currency']}-{batch['id']}.{batch['file_format']}"
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        # Chunks are rendered on the loop; every file operation runs in a thread
+        f = await asyncio.to_thread(open, tmp_path, "w", encoding="utf-8", newline="")
+        try:
+            if batch["file_format"] == "csv":
+                await asyncio.to_thread(f.write, settlement_csv_text([SETTLEMENT_CSV_FIELDS]))
+                async for chunk in iter_settlement_chunks(batch["id"]):
+                    if not await renew_job_lease(lease, SETTLEMENT_LEASE_SECONDS):
+                        raise JobLeaseLost(lease)
+                    await asyncio.to_thread(f.write, settlement_csv_text(settlement_csv_row(*item) for item in chunk))
+            else:
+                await asyncio.to_thread(f.write, pain001_header(batch, count, total))
+                async for chunk in iter_settlement_chunks(batch["id"]):
+                    if not await renew_job_lease(lease, SETTLEMENT_LEASE_SECONDS):
+                        raise JobLeaseLost(lease)
+                    await asyncio.to_thread(f.write, "".join(pain001_transaction(*item) for item in chunk))
+                await asyncio.to_thread(f.write, PAIN001_FOOTER)
+        finally:
+            await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, path)
+        
+        await db.settlement_batches.update_one({"id": batch["id"], "status": "generating"}, {"$set": {
+            "status": "generated",
+            "file_path": str(path),
+            "transaction_count": count,
+            "total_amount": total,
+            "generated_at": datetime.now(timezone.utc).isoformat()
+        }})
+    except JobLeaseLost:
+        # Another worker regenerated the batch and owns its wires now
+        logger.warning("Settlement batch %s lost its lease, stopping", batch["id"])
+    except Exception as e:
+        logger.error("Settlement batch %s failed: %s", batch["id"], e)
+        await db.settlement_batches.update_one({"id": batch["id"]}, {"$set": {"status": "failed", "error": str(e)}})
+        await release_settlement_wires(batch["id"])
+    finally:
+        await release_job_lease(lease)
+
+@api_router.post("/admin/settlements")
+async def admin_create_settlement_batch(
+    batch_request: SettlementBatchCreate,
+    background_tasks: BackgroundTasks,
+    admin: dict = Depends(get_admin_user)
+):
+    """Collect approved outbound wires up to the cut-off into a settlement file"""
+    if batch_request.currency not in SUPPORTED_CURRENCIES:
+        raise HTTPException(status_code=400, detail="Unsupported currency")
+    if batch_request.file_format not in ("xml", "csv"):
+        raise HTTPException(status_code=400, detail="File format must be xml or csv")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    batch = {
+        "id": str(uuid.uuid4()),
+        "currency": batch_request.currency,
+        "cutoff": parse_utc(batch_request.cutoff).isoformat() if batch_request.cutoff else now,
+        "file_format": batch_request.file_format,
+        "status": "generating",
+        "created_by": admin["id"],
+        "created_at": now
+    }
+    
+    # The batch exists before any wire points at it, so a failed claim orphans nothing
+    await db.settlement_batches.insert_one(batch)
+    await acquire_job_lease(f"settlement:{batch['id']}", SETTLEMENT_LEASE_SECONDS)
+    claimed = await claim_settlement_wires(batch)
+    if claimed == 0:
+        await release_job_lease(f"settlement:{batch['id']}")
+        await db.settlement_batches.delete_one({"id": batch["id"]})
+        raise HTTPException(status_code=404, detail="No approved wires to settle")
+    
+    await log_audit(admin["id"], "settlement_batch_created", {
+        "batch_id": batch["id"],
+        "currency": batch_request.currency,
+        "transactions": claimed
+    })
+    background_tasks.add_task(traced_job(generate_settlement_file), batch)
+    
+    batch.pop("_id", None)
+    return batch
+
+@api_router.post("/admin/settlements/{batch_id}/regenerate")
+async def admin_regenerate_settlement_batch(
+    batch_id: str,
+    background_tasks: BackgroundTasks,
+    admin: dict = Depends(get_admin_user)
+):
+    """Retry a failed batch, or one whose generating worker died, with the wires approved now"""
+    lease = f"settlement:{batch_id}"
+    if not await acquire_job_lease(lease, SETTLEMENT_LEASE_SECONDS):
+        raise HTTPException(status_code=409, detail="Settlement file is still being generated")
+    batch = await db.settlement_batches.find_one_and_update(
+        {"id": batch_id, "status": {"$in": ["generating", "failed"]}},
+        {"$set": {"status": "generating"}, "$unset": {"error": ""}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not batch:
+        await release_job_lease(lease)
+        raise HTTPException(status_code=409, detail="Batch not found or not failed")
+    
+    await claim_settlement_wires(batch)
+    claimed = await db.transactions.count_documents({"settlement_batch_id": batch_id, "status": "approved"})
+    if claimed == 0:
+        await db.settlement_batches.update_one({"id": batch_id}, {"$set": {"status": "failed", "error": "No approved wires to settle"}})
+        await release_job_lease(lease)
+        raise HTTPException(status_code=404, detail="No approved wires to settle")
+    
+    await log_audit(admin["id"], "settlement_batch_regenerated", {"batch_id": batch_id, "transactions": claimed})
+    background_tasks.add_task(traced_job(generate_settlement_file), batch)
+    return batch
+
+@api_router.get("/admin/settlements")
+async def admin_get_settlement_batches(
+    skip: int = 0,
+    limit: int = 50,
+    admin: dict = Depends(get_admin_user)
+):
+    batches = await db.settlement_batches.find(
+        {}, {"_id": 0}
+    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    return batches
+
+@api_router.get("/admin/settlements/{batch_id}/file")
+async def admin_download_settlement_file(batch_id: str, admin: dict = Depends(get_admin_user)):
+    batch = await db.settlement_batches.find_one({"id": batch_id}, {"_id": 0})
+    if not batch or not batch.get("file_path"):
+        raise HTTPException(status_code=404, detail="Settlement file not found")
+    media_type = "text/csv" if batch["file_format"] == "csv" else "application/xml"
+    return FileResponse(batch["file_path"], media_type=media_type, filename=Path(batch["file_path"]).name)
+
+@api_router.post("/admin/settlements/{batch_id}/confirm")
+async def admin_confirm_settlement_batch(batch_id: str, admin: dict = Depends(get_admin_user)):
+    """Release transit balances for every wire in a confirmed batch.
+
+    Wires are flipped to completed first, marked with settlement_claim, and
+    only flipped wires are posted, with a posting id derived from the wire, so a
+    confirm interrupted at any point can simply be repeated.
+    """
+    batch = await db.settlement_batches.find_one_and_update(
+        {"id": batch_id, "status": {"$in": ["generated", "confirming"]}},
+        {"$set": {"status": "confirming"}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not batch:
+        raise HTTPException(status_code=409, detail="Batch not found or not ready for confirmation")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    
+    async def claim_chunk(ids: List[str]):
+        # Wires rejected or completed since the batch was generated no longer match
+        await db.transactions.update_many(
+            {"id": {"$in": ids}, "settlement_batch_id": batch_id, "status": "approved"},
+            {"$set": {"status": "completed", "settled_at": now, "settlement_claim": batch_id}}
+        )
+        # settled_at == now singles out the wires this call flipped
+        flipped = await db.transactions.find(
+            {"id": {"$in": ids}, "settlement_claim": batch_id, "settled_at": now}, {"_id": 0, "id": 1}
+        ).to_list(None)
+        if flipped:
+            await write_audit_entries([
+                audit_entry(
+                    admin["id"], "settlement_wire_completed", {"batch_id": batch_id, "transaction_id": tx["id"]},
+                    {"status": "approved"}, {"status": "completed", "settled_at": now},
+                    entity={"collection": "transactions", "filter": {"id": tx["id"]}}
+                )
+                for tx in flipped
+            ])
+    
+    async def post_chunk(chunk: List[dict]) -> int:
+        postings = []
+        for tx in chunk:
+            postings.extend(build_ledger_posting(
+                wire_settlement_entries(tx), tx["reference"], "Wire settled", f"settlement:{tx['id']}"
+            ))
+        await insert_ledger_documents(postings)
+        await db.transactions.update_many(
+            {"id": {"$in": [tx["id"] for tx in chunk]}}, {"$set": {"settlement_posted": True}}
+        )
+        return len(chunk)
+    
+    ids = []
+    async for tx in db.transactions.find(
+        {"settlement_batch_id": batch_id, "status": "approved"}, {"_id": 0, "id": 1}
+    ).batch_size(SETTLEMENT_CHUNK_SIZE):
+        ids.append(tx["id"])
+        if len(ids) >= SETTLEMENT_CHUNK_SIZE:
+            await claim_chunk(ids)
+            ids = []
+    if ids:
+        await claim_chunk(ids)
+    
+    # Post every wire this or an earlier, interrupted confirm flipped
+    settled = 0
+    chunk = []
+    async for tx in db.transactions.find(
+        {"settlement_batch_id": batch_id, "settlement_claim": {"$exists": True}, "settlement_posted": {"$ne": True}},
+        {"_id": 0, "id": 1, "account_id": 1, "amount": 1, "currency": 1, "reference": 1}
+    ).batch_size(SETTLEMENT_CHUNK_SIZE):
+        chunk.append(tx)
+        if len(chunk) >= SETTLEMENT_CHUNK_SIZE:
+            settled += await post_chunk(chunk)
+            chunk = []
+    if chunk:
+        settled += await post_chunk(chunk)
+    
+    await db.settlement_batches.update_one(
+        {"id": batch_id},
+        {"$set": {"status": "confirmed", "confirmed_by": admin["id"], "confirmed_at": now}}
+    )
+    await log_audit(admin["id"], "settlement_batch_confirmed", {
+        "batch_id": batch_id,
+        "transactions": settled
+    })
+    return {"message": "Settlement batch confirmed", "transactions": settled}
+
+# ==================== STATEMENTS ====================
+
+def statement_bounds(period: str) -> tuple:
+    """Start and end of a YYYY-MM period. The bare timestamps sort before any stored
+    "+00:00" value at the same instant, so the end bound excludes the next month."""
+    year, month = int(period[:4]), int(period[5:])
+    return f"{period}-01T00:00:00", f"{year + month // 12:04d}-{month % 12 + 1:02d}-01T00:00:00"
+
+def render_statement(statement: dict) -> str:
+    account = statement["account"]
+    width = 100
+    lines = [
+        f"{BANK_NAME} - Account Statement".center(width),
+        "",
+        f"Account holder: {statement['holder']}",
+        f"Account number: {account['account_number']}    Type: {account['account_type']}    Currency: {account['currency']}",
+        f"Period: {statement['period_start'][:10]} to {statement['period_end_inclusive']}",
+        "",
+        f"{'Opening balance':<80}{statement['opening']:>20,.2f}",
+        "",
+        f"{'Date':<12}{'Reference':<20}{'Description':<38}{'Status':<12}{'Amount':>18}",
+        "-" * width
+    ]
+    credits = debits = 0.0
+    for tx in statement["transactions"]:
+        if tx["amount"] >= 0:
+            credits += tx["amount"]
+        else:
+            debits += tx["amount"]
+        lines.append(
+            f"{tx['created_at'][:10]:<12}{tx['reference'][:19]:<20}{(tx.get('description') or '')[:37]:<38}"
+            f"{tx['status'][:11]:<12}{tx['amount']:>18,.2f}"
+        )
+    if not statement["transactions"]:
+        lines.append("No transactions in this period")
+    lines += [
+        "-" * width,
+        f"{'Total credits':<80}{credits:>20,.2f}",
+        f"{'Total debits':<80}{debits:>20,.2f}",
+        f"{'Closing balance':<80}{statement['closing']:>20,.2f}",
+        ""
+    ]
+    return "\n".join(lines)
+
+def write_statement_files(directory: str, statements: List[dict]) -> List[dict]:
+    """Process pool entry point: render, compress and write one chunk of statements"""
+    entries = []
+    for statement in statements:
+        account = statement["account"]
+        data = gzip.compress(render_statement(statement).encode("utf-8"), mtime=0)
+        path = Path(directory) / f"{account['account_number']}.txt.gz"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        entries.append({
+            "account_id": account["id"],
+            "account_number": account["account_number"],
+            "currency": account["currency"],
+            "file": path.name,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "opening_balance": statement["opening"],
+            "closing_balance": statement["closing"],
+            "transaction_count": len(statement["transactions"])
+        })
+    return entries
+
+async def load_statement(account: dict, holders: Dict[str, str], start: str, end: str) -> dict:
+    opening, closing = await asyncio.gather(
+        get_account_balances(account["id"], start),
+        get_account_balances(account["id"], end)
+    )
+    transactions = []
+    async for tx in db.transactions.find(
+        {"account_id": account["id"], "created_at": {"$gte": start, "$lt": end}, "is_redacted": {"$ne": True}},
+        {"_id": 0, "created_at": 1, "reference": 1, "description": 1, "status": 1, "amount": 1}
+    ).sort("created_at", 1):
+        transactions.append(tx)
+    return {
+        "account": account,
+        "holder": holders.get(account["user_id"], ""),
+        "period_start": start,
+        "period_end_inclusive": (datetime.fromisoformat(end) - timedelta(days=1)).date().isoformat(),
+        "opening": opening["available_balance"],
+        "closing": closing["available_balance"],
+        "transactions": transactions
+    }
+
+async def load_statement_chunk(accounts: List[dict], start: str, end: str) -> List[dict]:
+    users = await db.users.find(
+        {"id": {"$in": list({a["user_id"] for a in accounts})}}, {"_id": 0, "id": 1, "first_name": 1, "last_name": 1}
+    ).to_list(None)
+    holders = {u["id"]: f"{u['first_name']} {u['last_name']}" for u in users}
+    return await asyncio.gather(*[load_statement(a, holders, start, end) for a in accounts])
+
+def read_statement_manifest(path: Path) -> set:
+    """Account ids already written by an earlier, interrupted attempt"""
+    done = set()
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["account_id"])
+                except (ValueError, KeyError):
+                    continue  # torn line from a crash; those accounts are redone
+    return done
+
+async def run_statement_batch(run_id: str):
+    """Generate statements for every account open during the period, resuming from the manifest.
+
+    Database reads stay on the event loop (Motor clients cannot cross process
+    boundaries); rendering, compression and file writes are spread over the
+    process pool, one chunk of accounts per task.
+    """
+    lease = f"statements:{run_id}"
+    if not await acquire_job_lease(lease, STATEMENT_LEASE_SECONDS):
+        return
+    run = await db.statement_runs.find_one({"id": run_id}, {"_id": 0})
+    try:
+        start, end = statement_bounds(run["period"])
+        directory = STATEMENT_DIR / run["period"]
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest_path = directory / "manifest.ndjson"
+        done = await asyncio.to_thread(read_statement_manifest, manifest_path)
+        
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        processed = 0
+        in_flight = set()
+        
+        with open(manifest_path, "a", encoding="utf-8") as manifest:
+            if manifest.tell() and not manifest_path.read_bytes().endswith(b"\n"):
+                manifest.write("\n")
+            async def record(finished):
+                nonlocal processed
+                entries = [e for task in finished for e in task.result()]
+                manifest.write("".join(json.dumps(e) + "\n" for e in entries))
+                manifest.flush()
+                os.fsync(manifest.fileno())
+                processed += len(entries)
+                await db.statement_runs.update_one({"id": run_id}, {"$set": {"accounts_done": len(done) + processed}})
+                if not await renew_job_lease(lease, STATEMENT_LEASE_SECONDS):
+                    raise JobLeaseLost(lease)
+            
+            chunk = []
+            async for account in db.accounts.find(
+                {"created_at": {"$lt": end}}, {"_id": 0, "id": 1, "user_id": 1, "account_number": 1, "account_type": 1, "currency": 1}
+            ).sort("id", 1):
+                if account["id"] in done:
+                    continue
+                chunk.append(account)
+                if len(chunk) < STATEMENT_CHUNK_SIZE:
+                    continue
+                statements = await load_statement_chunk(chunk, start, end)
+                in_flight.add(loop.run_in_executor(get_process_pool(), write_statement_files, str(directory), statements))
+                chunk = []
+                if len(in_flight) >= PROCESS_POOL_WORKERS:
+                    finished, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    await record(finished)
+            if chunk:
+                statements = await load_statement_chunk(chunk, start, end)
+                in_flight.add(loop.run_in_executor(get_process_pool(), write_statement_files, str(directory), statements))
+            if in_flight:
+                finished, _ = await asyncio.wait(in_flight)
+                await record(finished)
+        
+        elapsed = time.monotonic() - started
+        rate = round(processed / elapsed, 1) if elapsed > 0 else 0.0
+        await db.statement_runs.update_one({"id": run_id}, {"$set": {
+            "status": "completed",
+            "accounts_done": len(done) + processed,
+            "accounts_per_second": rate,
+            "manifest_path": str(manifest_path),
+            "completed_at": datetime.now(timezone.utc).isoformat()
+        }})
+        logger.info("Statements for %s: %d accounts in %.1fs (%s accounts/s)", run["period"], processed, elapsed, rate)
+    except JobLeaseLost:
+        # Another worker owns the run now; leave its status alone
+        logger.warning("Statement run %s lost its lease, stopping", run_id)
+    except Exception as e:
+        logger.error("Statement run %s failed: %s", run_id, e)
+        await db.statement_runs.update_one({"id": run_id}, {"$set": {"status": "failed", "error": str(e)}})
+    finally:
+        await release_job_lease(lease)
+
+async def resume_statement_runs():
+    """Pick up runs left unfinished by a worker that stopped"""
+    async for run in db.statement_runs.find({"status": "running"}, {"_id": 0, "id": 1}):
+        await run_statement_batch(run["id"])
+
+@api_router.post("/admin/statements")
+async def admin_create_statement_run(
+    run_request: StatementRunCreate,
+    background_tasks: BackgroundTasks,
+    admin: dict = Depends(get_admin_user)
+):
+    """Start month-end statements for a period, or resume an interrupted or failed run"""
+    if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", run_request.period):
+        raise HTTPException(status_code=400, detail="Period must be YYYY-MM")
+    _, end = statement_bounds(run_request.period)
+    if end > datetime.now(timezone.utc).isoformat():
+        raise HTTPException(status_code=400, detail="Statements can only be generated for a closed month")
+    
+    existing = await db.statement_runs.find_one({"period": run_request.period}, {"_id": 0})
+    if existing and existing["status"] == "completed":
+        raise HTTPException(status_code=409, detail="Statements for this period are already complete")
+    if existing and existing["status"] == "running" and await job_lease_active(f"statements:{existing['id']}"):
+        raise HTTPException(status_code=409, detail="Statements for this period are already running")
+    try:
+        run = await db.statement_runs.find_one_and_update(
+            {"period": run_request.period},
+            {
+                "$set": {"status": "running", "error": None},
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "accounts_done": 0,
+                    "created_by": admin["id"],
+                    "created_at": datetime.now(timezone.utc).isoformat()
+                }
+            },
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Two admins started the same period at once; the other request's run proceeds
+        run = await db.statement_runs.find_one({"period": run_request.period}, {"_id": 0})
+    
+    background_tasks.add_task(traced_job(run_statement_batch), run["id"])
+    await log_audit(admin["id"], "statement_run_started", {"run_id": run["id"], "period": run_request.period})
+    return run
+
+@api_router.get("/admin/statements")
+async def admin_get_statement_runs(admin: dict = Depends(get_admin_user)):
+    return await db.statement_runs.find({}, {"_id": 0}).sort("period", -1).to_list(100)
+
+@api_router.get("/accounts/{account_id}/statements/{period}")
+async def get_account_statement(account_id: str, period: str, user: dict = Depends(get_current_user)):
+    """The gzipped month-end statement; browsers decompress it transparently"""
+    account = await db.accounts.find_one({"id": account_id, "user_id": user["id"]}, {"_id": 0})
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    run = await db.statement_runs.find_one({"period": period, "status": "completed"})
+    path = STATEMENT_DIR / period / f"{account['account_number']}.txt.gz"
+    if not run or not path.exists():
+        raise HTTPException(status_code=404, detail="Statement not available")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", headers={
+        "Content-Encoding": "gzip",
+        "Content-Disposition": f'inline; filename="statement-{account["account_number"]}-{period}.txt"'
+    })
+
 # ==================== CRYPTO WALLET ENDPOINTS ====================
 
 @api_router.get("/crypto/wallets")
-async def get_crypto_wallets(user: dict = Depends(get_current_user)):
+async def get_crypto_wallets(request: Request, user: dict = Depends(get_current_user)):
     """Get crypto wallet addresses for deposit"""
+    return await serve_conditional(request, "crypto_wallets", "private, max-age=60, must-revalidate", load_crypto_wallets)
+
+async def load_crypto_wallets():
     wallets = await db.settings.find_one({"type": "crypto_wallets"}, {"_id": 0})
     if not wallets:
-        return {"wallets": [], "message": "Crypto wallets not configured"}
-    
+        return {"wallets": [], "message": "Crypto wallets not configured"}, 'W/"crypto-wallets-none"', None
+    etag = f'W/"crypto-wallets-{hashlib.sha256(str(wallets.get("updated_at")).encode()).hexdigest()[:16]}"'
+    return build_crypto_wallets(wallets), etag, wallets.get("updated_at")
+
+def build_crypto_wallets(wallets: dict) -> dict:
     # Return wallet addresses with network info
     wallet_list = []
     wallet_configs = [
@@ -1158,9 +5014,13 @@ async def admin_update_crypto_wallets(
         {"$set": settings_dict},
         upsert=True
     )
+    invalidate_resource("crypto_wallets")
     
     after = await db.settings.find_one({"type": "crypto_wallets"}, {"_id": 0})
-    await log_audit(admin["id"], "crypto_wallets_updated", {"changes": "wallet addresses updated"}, before, after)
+    await log_audit(
+        admin["id"], "crypto_wallets_updated", {"changes": "wallet addresses updated"}, before, after,
+        entity={"collection": "settings", "filter": {"type": "crypto_wallets"}}
+    )
     
     return {"message": "Crypto wallet settings updated"}
 
@@ -1170,19 +5030,259 @@ async def admin_get_audit_logs(
     limit: int = 100,
     action: Optional[str] = None,
     user_id: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    include_archive: bool = False,
+    fields: Optional[str] = None,
     admin: dict = Depends(get_admin_user)
 ):
+    selected = parse_fields(fields, AuditLogResponse)
     query = {}
     if action:
         query["action"] = action
     if user_id:
         query["user_id"] = user_id
     
-    logs = await db.audit_logs.find(
-        query, {"_id": 0}
-    ).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
+    logs = await query_audit_logs(query, from_date, to_date, skip, limit, include_archive, fields_projection(selected))
+    if selected:
+        return sparse_response(logs, AuditLogResponse, selected)
     return logs
 
+@api_router.get("/admin/audit-logs/{audit_id}/states")
+async def admin_get_audit_states(audit_id: str, admin: dict = Depends(get_admin_user)):
+    """Full before/after documents for an audit entry, rebuilt from its patch"""
+    for name in await list_audit_partitions():
+        audit = await db[name].find_one({"id": audit_id}, {"_id": 0})
+        if audit:
+            return await reconstruct_audit_states(audit)
+    # Archived entries are rebuilt through every later patch, archived ones included
+    archived = await asyncio.to_thread(read_audit_archive, {"id": audit_id}, None, None, 1)
+    if archived:
+        return await reconstruct_audit_states(archived[0], include_archive=True)
+    raise HTTPException(status_code=404, detail="Audit entry not found")
+
+# ==================== AUDIT PARTITIONS ====================
+
+# Never written to audit entries, so never restored either: secrets, plus derived
+# and bookkeeping fields that change without an audit entry (search keys, unread
+# counters, settlement claim markers)
+AUDIT_EXCLUDED_FIELDS = {
+    "_id": 0, "password_hash": 0,
+    "search_email": 0, "search_names": 0, "search_phone": 0,
+    "unread_for_user": 0, "unread_for_admin": 0,
+    "settlement_batch_id": 0, "settlement_claim": 0, "settlement_posted": 0
+}
+# Later entries walked back through when rebuilding an entry's states
+AUDIT_RECONSTRUCT_MAX_ENTRIES = 10000
+
+def strip_audit_excluded(document: Optional[dict]) -> dict:
+    return {k: v for k, v in (document or {}).items() if k not in AUDIT_EXCLUDED_FIELDS}
+
+async def reconstruct_audit_states(audit: dict, include_archive: bool = False) -> dict:
+    """Walk back from the live document through newer patches to this entry's states"""
+    if "before" in audit or "after" in audit:
+        # Entries written before patches were introduced store full documents
+        return {"before": audit.get("before"), "after": audit.get("after")}
+    if not audit.get("entity"):
+        raise HTTPException(status_code=400, detail="Audit entry has no reconstructable state")
+    
+    entity = audit["entity"]
+    current = await db[entity["collection"]].find_one(entity["filter"], AUDIT_EXCLUDED_FIELDS) or {}
+    newer = await query_audit_logs(
+        {"entity_key": audit["entity_key"]}, from_date=audit["timestamp"], limit=AUDIT_RECONSTRUCT_MAX_ENTRIES + 1,
+        include_archive=include_archive
+    )
+    if len(newer) > AUDIT_RECONSTRUCT_MAX_ENTRIES:
+        raise HTTPException(status_code=422, detail="Too many later changes to reconstruct this audit entry")
+    for later in newer:
+        if later["id"] != audit["id"] and later["timestamp"] >= audit["timestamp"]:
+            current = revert_patch(current, later.get("changes") or [])
+    # Entries written before a field was excluded may still carry it in their patch
+    current = strip_audit_excluded(current)
+    return {"before": strip_audit_excluded(revert_patch(current, audit.get("changes") or [])), "after": current}
+
+audit_partition_cache = {"names": set(), "legacy": False, "month": None, "loaded_at": 0.0}
+
+async def refresh_audit_partitions():
+    names = await db.list_collection_names(filter={"name": {"$regex": AUDIT_PARTITION_PATTERN}})
+    audit_partition_cache.update(
+        names=set(names),
+        legacy=await db[AUDIT_LEGACY_COLLECTION].estimated_document_count() > 0,
+        month=datetime.now(timezone.utc).strftime("%Y-%m"),
+        loaded_at=time.monotonic()
+    )
+
+async def list_audit_partitions(from_date: Optional[str] = None, to_date: Optional[str] = None) -> List[str]:
+    """Hot partitions overlapping the range, newest first; the legacy collection comes last"""
+    cache = audit_partition_cache
+    if (cache["month"] != datetime.now(timezone.utc).strftime("%Y-%m")
+            or time.monotonic() - cache["loaded_at"] > AUDIT_PARTITION_REFRESH_SECONDS):
+        await refresh_audit_partitions()
+    names = list(cache["names"])
+    if from_date:
+        names = [n for n in names if audit_partition_month(n) >= from_date[:7]]
+    if to_date:
+        names = [n for n in names if audit_partition_month(n) <= to_date[:7]]
+    names.sort(reverse=True)
+    if cache["legacy"]:
+        names.append(AUDIT_LEGACY_COLLECTION)
+    return names
+
+def audit_archive_files(from_date: Optional[str] = None, to_date: Optional[str] = None) -> List[Path]:
+    if not AUDIT_ARCHIVE_DIR.exists():
+        return []
+    files = []
+    for path in AUDIT_ARCHIVE_DIR.glob("audit_logs_*.ndjson.gz"):
+        month = audit_partition_month(path.name[:len("audit_logs_YYYY_MM")])
+        if (not from_date or month >= from_date[:7]) and (not to_date or month <= to_date[:7]):
+            files.append(path)
+    return sorted(files, reverse=True)
+
+def read_audit_archive(query: dict, from_date: Optional[str], to_date: Optional[str], needed: int) -> List[dict]:
+    results = []
+    for path in audit_archive_files(from_date, to_date):
+        matches = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                log = json.loads(line)
+                if any(log.get(k) != v for k, v in query.items()):
+                    continue
+                if (from_date and log["timestamp"] < from_date) or (to_date and log["timestamp"] > to_date):
+                    continue
+                matches.append(log)
+        matches.sort(key=lambda log: log["timestamp"], reverse=True)
+        results.extend(matches[:needed - len(results)])
+        if len(results) >= needed:
+            break
+    return results
+
+async def query_audit_logs(
+    query: dict,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    include_archive: bool = False,
+    projection: Optional[dict] = None
+) -> List[dict]:
+    """Fan a query out over the monthly partitions (and optionally the archive), newest first"""
+    wanted = skip + limit
+    partition_query = dict(query)
+    if from_date:
+        partition_query["timestamp"] = {"$gte": from_date}
+    if to_date:
+        partition_query["timestamp"] = {**partition_query.get("timestamp", {}), "$lte": to_date}
+    
+    results = []
+    for name in await list_audit_partitions(from_date, to_date):
+        remaining = wanted - len(results)
+        results.extend(await db[name].find(
+            partition_query, projection or {"_id": 0}
+        ).sort("timestamp", -1).limit(remaining).to_list(remaining))
+        if len(results) >= wanted:
+            break
+    
+    if include_archive and len(results) < wanted:
+        results.extend(await asyncio.to_thread(
+            read_audit_archive, query, from_date, to_date, wanted - len(results)
+        ))
+    return results[skip:wanted]
+
+async def migrate_legacy_audit_logs():
+    """Move documents from the unpartitioned collection into monthly partitions"""
+    legacy = db[AUDIT_LEGACY_COLLECTION]
+    while True:
+        batch = await legacy.find({}).sort("timestamp", 1).limit(AUDIT_BATCH_SIZE).to_list(AUDIT_BATCH_SIZE)
+        if not batch:
+            audit_partition_cache["legacy"] = False
+            return
+        by_partition: Dict[str, List[dict]] = {}
+        for log in batch:
+            by_partition.setdefault(audit_partition_name(log["timestamp"]), []).append(log)
+        for name, logs in by_partition.items():
+            partition = await get_audit_partition(name)
+            try:
+                await partition.insert_many(logs, ordered=False)
+            except BulkWriteError as e:
+                # Documents keep their _id, so a retried move only hits duplicates
+                if any(err["code"] != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+        await legacy.delete_many({"_id": {"$in": [log["_id"] for log in batch]}})
+
+def read_archived_lines(path: Path) -> set:
+    if not path.exists():
+        return set()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f}
+
+def start_audit_archive(path: Path, tmp_path: Path):
+    """Open the temp archive, seeded with the month's existing archive when there is one"""
+    raw = open(tmp_path, "wb")
+    if path.exists():
+        with open(path, "rb") as existing:
+            shutil.copyfileobj(existing, raw)
+    # Each export adds a new gzip member, which readers see as one stream
+    return raw, gzip.open(raw, "wt", encoding="utf-8")
+
+def finish_audit_archive(raw, f):
+    f.close()
+    raw.flush()
+    os.fsync(raw.fileno())
+    raw.close()
+
+async def export_audit_partition(name: str):
+    """Archive a partition to its month's gzip NDJSON file, record the export, then drop it.
+
+    The archive is rebuilt in a temp file and swapped in with os.replace, and lines
+    already archived are skipped, so an export interrupted at any point can rerun.
+    """
+    await asyncio.to_thread(AUDIT_ARCHIVE_DIR.mkdir, parents=True, exist_ok=True)
+    path = AUDIT_ARCHIVE_DIR / f"{name}.ndjson.gz"
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    archived = await asyncio.to_thread(read_archived_lines, path)
+    exported = 0
+    raw, f = await asyncio.to_thread(start_audit_archive, path, tmp_path)
+    try:
+        lines = []
+        async for log in db[name].find({}, {"_id": 0}).sort("timestamp", -1).batch_size(AUDIT_BATCH_SIZE):
+            line = json.dumps(log, default=str)
+            if line not in archived:
+                lines.append(line)
+            if len(lines) >= AUDIT_BATCH_SIZE:
+                await asyncio.to_thread(f.write, "\n".join(lines) + "\n")
+                exported += len(lines)
+                lines = []
+        if lines:
+            await asyncio.to_thread(f.write, "\n".join(lines) + "\n")
+            exported += len(lines)
+    finally:
+        await asyncio.to_thread(finish_audit_archive, raw, f)
+    await asyncio.to_thread(os.replace, tmp_path, path)
+    
+    await db.audit_archives.update_one({"_id": name}, {"$set": {
+        "path": path.name,
+        "month": audit_partition_month(name),
+        "exported_at": datetime.now(timezone.utc).isoformat()
+    }, "$inc": {"count": exported}}, upsert=True)
+    await db[name].drop()
+    indexed_audit_partitions.discard(name)
+    audit_partition_cache["names"].discard(name)
+    logger.info("Archived %d audit logs from %s to %s", exported, name, path)
+
+async def archive_audit_logs():
+    if not await acquire_job_lease("audit_archive", AUDIT_ARCHIVE_INTERVAL_SECONDS):
+        return
+    try:
+        await migrate_legacy_audit_logs()
+        now = datetime.now(timezone.utc)
+        month_index = now.year * 12 + now.month - 1 - AUDIT_HOT_MONTHS
+        oldest_hot = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+        for name in await list_audit_partitions():
+            if name != AUDIT_LEGACY_COLLECTION and audit_partition_month(name) < oldest_hot:
+                await export_audit_partition(name)
+    finally:
+        await release_job_lease("audit_archive")
+
 # ==================== SEED DATA ENDPOINT ====================
 
 @api_router.post("/seed")
@@ -1203,7 +5303,7 @@ async def seed_data():
         "first_name": "System",
         "last_name": "Administrator",
         "phone": "+1234567890",
-        "password_hash": pwd_context.hash("admin123"),
+        "password_hash": hash_password("admin123"),
         "role": "super_admin",
         "status": "active",
         "kyc_status": "verified",
@@ -1211,6 +5311,7 @@ async def seed_data():
         "created_at": now,
         "updated_at": now
     }
+    admin.update(customer_search_keys(admin))
     await db.users.insert_one(admin)
     
     # Create demo client
@@ -1222,7 +5323,7 @@ async def seed_data():
         "phone": "+1987654321",
         "address": "123 Main Street, New York, NY 10001",
         "country": "United States",
-        "password_hash": pwd_context.hash("client123"),
+        "password_hash": hash_password("client123"),
         "role": "client",
         "status": "active",
         "kyc_status": "verified",
@@ -1230,6 +5331,7 @@ async def seed_data():
         "created_at": now,
         "updated_at": now
     }
+    client.update(customer_search_keys(client))
     await db.users.insert_one(client)
     
     # Create accounts for client
@@ -1237,7 +5339,7 @@ async def seed_data():
         {
             "id": str(uuid.uuid4()),
             "user_id": client["id"],
-            "account_number": "100000000001",
+            "account_number": await generate_account_number(),
             "account_type": "checking",
             "currency": "USD",
             "available_balance": 125000.00,
@@ -1250,7 +5352,7 @@ async def seed_data():
         {
             "id": str(uuid.uuid4()),
             "user_id": client["id"],
-            "account_number": "100000000002",
+            "account_number": await generate_account_number(),
             "account_type": "savings",
             "currency": "EUR",
             "available_balance": 50000.00,
@@ -1263,7 +5365,7 @@ async def seed_data():
         {
             "id": str(uuid.uuid4()),
             "user_id": client["id"],
-            "account_number": "100000000003",
+            "account_number": await generate_account_number(),
             "account_type": "ktt",
             "currency": "GBP",
             "available_balance": 75000.00,
@@ -1274,7 +5376,15 @@ async def seed_data():
             "created_at": now
         }
     ]
+    for account in accounts:
+        account["ledger_bootstrapped"] = True
     await db.accounts.insert_many(accounts)
+    for account in accounts:
+        await post_ledger(
+            opening_balance_entries(account["id"], account["currency"], {f: account[f] for f in BALANCE_FIELDS}),
+            account["account_number"],
+            "Opening balance"
+        )
     
     # Create sample transactions
     transactions = [
@@ -1319,6 +5429,7 @@ async def seed_data():
         }
     ]
     await db.transactions.insert_many(transactions)
+    await update_rollups(transactions)
     
     # Create sample beneficiary
     beneficiary = {
@@ -1452,8 +5563,109 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor", "X-Total-Count", "X-Total-Count-Approximate", "Idempotent-Replayed", "X-Request-ID"],
 )
 
+# Added last so it wraps CORS too and every response carries X-Request-ID
+app.add_middleware(RequestTracingMiddleware)
+
+@app.on_event("startup")
+async def create_indexes():
+    # Internal transfers share one reference between the debit and credit legs,
+    # so uniqueness is enforced per (reference, account_id)
+    await db.transactions.create_index([("reference", 1), ("account_id", 1)], unique=True)
+    await db.transactions.create_index([("account_id", 1), ("created_at", -1)])
+    await db.transactions.create_index([("account_id", 1), ("transaction_type", 1), ("status", 1), ("created_at", -1)])
+    await db.transactions.create_index([("counterparty", 1), ("created_at", -1)])
+    await db.transactions.create_index([("status", 1), ("created_at", -1)])
+    await db.transactions.create_index([("created_at", -1)])
+    await db.transactions.create_index("risk_review", sparse=True)
+    await db.transaction_rollups.create_index([("period", 1)])
+    await db.transactions.create_index([("description", "text")])
+    await db.accounts.create_index("account_number", unique=True)
+    await db.accounts.create_index("user_id")
+    await db.beneficiaries.create_index([("user_id", 1), ("created_at", -1)])
+    await db.users.create_index("email", unique=True)
+    await db.users.create_index("id", unique=True)
+    # Equality filters first, then the prefix key, then the (created_at, id) page order
+    await db.users.create_index([("role", 1), ("search_email", 1), ("created_at", -1), ("id", -1)])
+    await db.users.create_index([("role", 1), ("search_names", 1), ("created_at", -1), ("id", -1)])
+    await db.users.create_index([("search_phone", 1), ("role", 1)])
+    await db.users.create_index([("role", 1), ("kyc_status", 1), ("country", 1), ("user_type", 1), ("created_at", -1), ("id", -1)])
+    await db.users.create_index([("role", 1), ("created_at", -1), ("id", -1)])
+    await db.ledger.create_index([("account_id", 1), ("created_at", 1)])
+    await db.ledger.create_index("created_at")
+    # Legacy postings have no leg number and are left out of the uniqueness check
+    await db.ledger.create_index(
+        [("posting_id", 1), ("leg", 1)], unique=True, partialFilterExpression={"leg": {"$exists": True}}
+    )
+    await db.balance_snapshots.create_index([("account_id", 1), ("as_of", -1)], unique=True)
+    await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+    await db.scheduled_transfers.create_index([("status", 1), ("next_run_at", 1)])
+    await db.scheduled_transfers.create_index([("user_id", 1), ("created_at", -1)])
+    await db.scheduled_transfer_runs.create_index([("scheduled_transfer_id", 1), ("executed_at", -1)])
+    await db.scheduled_transfer_runs.create_index([("scheduled_transfer_id", 1), ("scheduled_for", 1)], unique=True)
+    await db.transactions.create_index([("settlement_batch_id", 1), ("created_at", 1)])
+    await db.transactions.create_index([("transaction_type", 1), ("status", 1), ("currency", 1), ("created_at", 1)])
+    await db.settlement_batches.create_index([("created_at", -1)])
+    await db.statement_runs.create_index("period", unique=True)
+    await db.holds.create_index("id", unique=True)
+    await db.holds.create_index([("status", 1), ("expires_at", 1)])
+    await db.holds.create_index([("account_id", 1), ("status", 1), ("created_at", -1)])
+    await db.holds.create_index("sweep_id", sparse=True)
+    await db.holds.create_index([("settled", 1), ("closed_at", 1)], partialFilterExpression={"settled": False})
+    await db.instruments.create_index("id", unique=True)
+    await db.instruments.create_index([("status", 1), ("visibility", 1), ("created_at", -1), ("id", -1)])
+    await db.instruments.create_index([("status", 1), ("recipient_id", 1), ("created_at", -1), ("id", -1)])
+    await db.tickets.create_index("id", unique=True)
+    await db.tickets.create_index([("user_id", 1), ("last_message_at", -1), ("id", -1)])
+    await db.tickets.create_index([("status", 1), ("last_message_at", -1), ("id", -1)])
+    await db.tickets.create_index([("last_message_at", -1), ("id", -1)])
+    await db.ticket_messages.create_index("id", unique=True)
+    await db.ticket_messages.create_index([("ticket_id", 1), ("created_at", 1), ("id", 1)])
+    await db.token_revocations.create_index("revoked_at")
+    await db.token_revocations.create_index("expires_at", expireAfterSeconds=0)
+
+background_jobs: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_background_jobs():
+    await bootstrap_ledger_snapshots()
+    await migrate_ticket_responses()
+    await backfill_customer_search_keys()
+    await sync_token_revocations()
+    background_jobs.append(asyncio.create_task(
+        run_periodically(sync_token_revocations, TOKEN_REVOCATION_SYNC_SECONDS)
+    ))
+    background_jobs.append(asyncio.create_task(
+        run_periodically(write_balance_snapshots, LEDGER_SNAPSHOT_INTERVAL_SECONDS)
+    ))
+    background_jobs.append(asyncio.create_task(watch_account_changes()))
+    background_jobs.append(asyncio.create_task(publish_balance_updates()))
+    background_jobs.append(asyncio.create_task(bootstrap_rollups()))
+    background_jobs.append(asyncio.create_task(resume_statement_runs()))
+    await rebuild_velocity_windows()
+    background_jobs.append(asyncio.create_task(
+        run_periodically(persist_velocity_windows, VELOCITY_PERSIST_SECONDS)
+    ))
+    background_jobs.append(asyncio.create_task(
+        run_periodically(sweep_expired_holds, HOLD_SWEEP_INTERVAL_SECONDS)
+    ))
+    background_jobs.append(asyncio.create_task(
+        run_periodically(run_scheduled_transfers, SCHEDULER_INTERVAL_SECONDS)
+    ))
+    background_jobs.append(asyncio.create_task(
+        run_periodically(archive_audit_logs, AUDIT_ARCHIVE_INTERVAL_SECONDS)
+    ))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_jobs:
+        task.cancel()
+    try:
+        await persist_velocity_windows()
+    except Exception as e:
+        logger.error("Failed to persist velocity windows on shutdown: %s", e)
     client.close()
+    if _process_pool is not None:
+        _process_pool.shutdown()
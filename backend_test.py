@@ -36,13 +36,15 @@ class ProminenceBankAPITester:
             self.tests_passed += 1
         print()
 
-    def make_request(self, method, endpoint, data=None, token=None, expected_status=200):
+    def make_request(self, method, endpoint, data=None, token=None, expected_status=200, extra_headers=None):
         """Make HTTP request with proper headers"""
         url = f"{self.base_url}/api/{endpoint.lstrip('/')}"
         headers = {'Content-Type': 'application/json'}
         
         if token:
             headers['Authorization'] = f'Bearer {token}'
+        if extra_headers:
+            headers.update(extra_headers)
         
         try:
             if method.upper() == 'GET':
@@ -247,6 +249,20 @@ class ProminenceBankAPITester:
         else:
             error_msg = response.text if hasattr(response, 'text') else str(response)
             self.log_test("Tickets Endpoint", False, error=error_msg)
+        
+        # Test monthly analytics chart from the rollups
+        success, response = self.make_request('GET', '/accounts', token=self.client_token)
+        accounts = response.json() if success else []
+        if accounts:
+            month = datetime.now().strftime('%Y-%m')
+            success, response = self.make_request('GET', f'/accounts/{accounts[0]["id"]}/analytics?period={month}', token=self.client_token)
+            if success:
+                points = response.json()["points"]
+                self.log_test("Account Analytics", len(points) >= 28,
+                              f"{len(points)} daily points, {sum(p['count'] for p in points)} transactions")
+            else:
+                error_msg = response.text if hasattr(response, 'text') else str(response)
+                self.log_test("Account Analytics", False, error=error_msg)
 
     def test_admin_endpoints(self):
         """Test admin-specific endpoints"""
@@ -303,6 +319,147 @@ class ProminenceBankAPITester:
         else:
             error_msg = response.text if hasattr(response, 'text') else str(response)
             self.log_test("Admin Instruments", False, error=error_msg)
+        
+        # Test admin transaction search
+        success, response = self.make_request('GET', '/admin/transactions/search?counterparty=ABC', token=self.admin_token)
+        if success:
+            try:
+                data = response.json()
+                self.log_test("Admin Transaction Search", True, f"Found {len(data)} transactions")
+            except:
+                self.log_test("Admin Transaction Search", True, "Endpoint accessible")
+        else:
+            error_msg = response.text if hasattr(response, 'text') else str(response)
+            self.log_test("Admin Transaction Search", False, error=error_msg)
+        
+        # Test admin customer search (prefix match on a mixed-case email)
+        success, response = self.make_request('GET', '/admin/customers/search?email=CLIENT@ex', token=self.admin_token)
+        if success:
+            data = response.json()
+            found = any(c["email"] == "client@example.com" for c in data)
+            self.log_test("Admin Customer Search", found,
+                          f"Found {len(data)} customers, total {response.headers.get('X-Total-Count')}",
+                          "" if found else "Demo client not matched by email prefix")
+        else:
+            error_msg = response.text if hasattr(response, 'text') else str(response)
+            self.log_test("Admin Customer Search", False, error=error_msg)
+        
+        # Test customer overview for the demo client
+        success, response = self.make_request('GET', '/admin/customers/search?email=client@example.com', token=self.admin_token)
+        customers = response.json() if success else []
+        if customers:
+            start = time.time()
+            success, response = self.make_request('GET', f'/admin/customers/{customers[0]["id"]}/overview', token=self.admin_token)
+            elapsed_ms = (time.time() - start) * 1000
+            if success:
+                data = response.json()
+                self.log_test("Admin Customer Overview", True,
+                              f"{len(data['accounts'])} accounts, {len(data['recent_transactions'])} transactions in {elapsed_ms:.0f} ms")
+            else:
+                error_msg = response.text if hasattr(response, 'text') else str(response)
+                self.log_test("Admin Customer Overview", False, error=error_msg)
+        
+        # Test sparse fieldsets: compare payload size and latency with the full list
+        sizes = {}
+        for label, query in (("full", "limit=200"), ("sparse", "limit=200&fields=action,user_id,timestamp")):
+            start = time.time()
+            success, response = self.make_request('GET', f'/admin/audit-logs?{query}', token=self.admin_token)
+            if not success:
+                break
+            sizes[label] = (len(response.content), (time.time() - start) * 1000, response.json())
+        if len(sizes) == 2:
+            unexpected = [k for row in sizes["sparse"][2] for k in row if k not in ("id", "action", "user_id", "timestamp")]
+            self.log_test("Sparse Fieldsets", not unexpected,
+                          f"audit logs {sizes['full'][0]}B/{sizes['full'][1]:.0f} ms -> {sizes['sparse'][0]}B/{sizes['sparse'][1]:.0f} ms",
+                          f"Unexpected fields: {unexpected}" if unexpected else "")
+        else:
+            error_msg = response.text if hasattr(response, 'text') else str(response)
+            self.log_test("Sparse Fieldsets", False, error=error_msg)
+
+    def test_idempotent_transfers(self):
+        """Test Idempotency-Key replay and measure its overhead on first requests"""
+        print("🔁 Testing Idempotent Transfers...")
+        
+        if not self.client_token:
+            print("   Skipping idempotency tests - no valid token")
+            return
+        
+        success, response = self.make_request('GET', '/accounts', token=self.client_token)
+        accounts = response.json() if success else []
+        if len(accounts) < 2:
+            self.log_test("Idempotent Transfer Replay", False, error="Need two client accounts")
+            return
+        
+        transfer = {
+            "from_account_id": accounts[0]["id"],
+            "to_account_id": accounts[1]["id"],
+            "amount": 1.00,
+            "currency": accounts[0]["currency"],
+            "description": "Idempotency test"
+        }
+        key = {"Idempotency-Key": f"test-{time.time()}"}
+        ok1, first = self.make_request('POST', '/transfers/internal', transfer, token=self.client_token, extra_headers=key)
+        ok2, second = self.make_request('POST', '/transfers/internal', transfer, token=self.client_token, extra_headers=key)
+        if ok1 and ok2 and first.json()["id"] == second.json()["id"] and second.headers.get("Idempotent-Replayed") == "true":
+            self.log_test("Idempotent Transfer Replay", True, f"Replayed transaction {first.json()['reference']}")
+        else:
+            error_msg = second.text if hasattr(second, 'text') else str(second)
+            self.log_test("Idempotent Transfer Replay", False, error=error_msg)
+        
+        def average_ms(with_key, runs=5):
+            start = time.perf_counter()
+            for i in range(runs):
+                headers = {"Idempotency-Key": f"bench-{time.time()}-{i}"} if with_key else None
+                self.make_request('POST', '/transfers/internal', transfer, token=self.client_token, extra_headers=headers)
+            return (time.perf_counter() - start) / runs * 1000
+        
+        plain = average_ms(False)
+        keyed = average_ms(True)
+        self.log_test("Idempotency Overhead", True, f"without key {plain:.1f} ms, with key {keyed:.1f} ms ({keyed - plain:+.1f} ms)")
+
+    def test_account_number_allocation(self):
+        """Test concurrent account creation yields unique, check-digit valid numbers"""
+        print("🔢 Testing Account Number Allocation...")
+        
+        if not self.admin_token:
+            print("   Skipping allocation tests - no valid token")
+            return
+        
+        success, response = self.make_request('GET', '/admin/customers', token=self.admin_token)
+        if not success or not response.json():
+            self.log_test("Account Number Allocation", False, error="No customer available")
+            return
+        user_id = response.json()[0]["id"]
+        
+        def create_account(_):
+            return self.make_request('POST', '/admin/accounts', {"user_id": user_id, "currency": "USD"}, token=self.admin_token)
+        
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(create_account, range(16)))
+        
+        numbers = [r.json()["account_number"] for ok, r in results if ok]
+        if len(numbers) != len(results):
+            self.log_test("Account Number Allocation", False, error=f"{len(results) - len(numbers)} requests failed")
+            return
+        
+        def luhn_valid(number):
+            total = 0
+            for i, d in enumerate(reversed(number)):
+                n = int(d)
+                if i % 2 == 1:
+                    n *= 2
+                    if n > 9:
+                        n -= 9
+                total += n
+            return total % 10 == 0
+        
+        if len(set(numbers)) != len(numbers):
+            self.log_test("Account Number Allocation", False, error="Duplicate account numbers allocated")
+        elif not all(luhn_valid(n) for n in numbers):
+            self.log_test("Account Number Allocation", False, error="Invalid check digit")
+        else:
+            self.log_test("Account Number Allocation", True, f"{len(numbers)} unique numbers allocated concurrently")
 
     def test_public_endpoints(self):
         """Test publicly accessible endpoints"""
@@ -319,6 +476,30 @@ class ProminenceBankAPITester:
         else:
             error_msg = response.text if hasattr(response, 'text') else str(response)
             self.log_test("Funding Instructions", False, error=error_msg)
+        
+        # Test request id propagation
+        success, response = self.make_request('GET', '/content/funding-instructions', extra_headers={"X-Request-ID": "backend-test-trace"})
+        if success and response.headers.get("X-Request-ID") == "backend-test-trace":
+            self.log_test("Request ID Echo", True, "X-Request-ID returned on the response")
+        else:
+            self.log_test("Request ID Echo", False, error=f"X-Request-ID: {response.headers.get('X-Request-ID') if hasattr(response, 'headers') else response}")
+
+    def test_logout(self):
+        """Logout revokes the token; runs last because it ends the client session"""
+        print("🚪 Testing Logout...")
+        if not self.client_token:
+            self.log_test("Logout Revokes Token", False, error="No client token available")
+            return
+        
+        success, response = self.make_request('POST', '/auth/logout', token=self.client_token)
+        if not success:
+            self.log_test("Logout Revokes Token", False, error=response.text if hasattr(response, 'text') else str(response))
+            return
+        success, response = self.make_request('GET', '/auth/me', token=self.client_token, expected_status=401)
+        if success:
+            self.log_test("Logout Revokes Token", True, "Token rejected after logout")
+        else:
+            self.log_test("Logout Revokes Token", False, error=f"Expected 401, got {getattr(response, 'status_code', response)}")
 
     def run_all_tests(self):
         """Run all test suites"""
@@ -331,7 +512,10 @@ class ProminenceBankAPITester:
         self.test_admin_login()
         self.test_client_login()
         self.test_client_endpoints()
+        self.test_idempotent_transfers()
         self.test_admin_endpoints()
+        self.test_account_number_allocation()
+        self.test_logout()
         
         # Print summary
         print("=" * 50)
@@ -37,7 +37,7 @@ export const AuthProvider = ({ children }) => {
     (response) => response,
     (error) => {
       if (error.response?.status === 401) {
-        logout();
+        clearSession();
       }
       return Promise.reject(error);
     }
@@ -53,7 +53,7 @@ export const AuthProvider = ({ children }) => {
       setUser(response.data);
     } catch (error) {
       console.error('Failed to fetch user:', error);
-      logout();
+      clearSession();
     } finally {
       setLoading(false);
     }
@@ -82,12 +82,23 @@ export const AuthProvider = ({ children }) => {
     return response.data;
   };
 
-  const logout = () => {
+  const clearSession = () => {
     localStorage.removeItem('pb_token');
     setToken(null);
     setUser(null);
   };
 
+  const logout = () => {
+    // Revoke the token server-side; plain axios so a 401 here cannot re-trigger logout
+    const currentToken = localStorage.getItem('pb_token');
+    if (currentToken) {
+      axios.post(`${API_URL}/api/auth/logout`, null, {
+        headers: { Authorization: `Bearer ${currentToken}` },
+      }).catch(() => {});
+    }
+    clearSession();
+  };
+
   const register = async (userData) => {
     const response = await api.post('/auth/register', userData);
     return response.data;
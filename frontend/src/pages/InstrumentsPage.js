@@ -28,6 +28,15 @@ export default function InstrumentsPage() {
     }
   };
 
+  const openInstrument = async (inst) => {
+    try {
+      const response = await api.get(`/instruments/${inst.id}`);
+      setSelectedInstrument(response.data);
+    } catch (error) {
+      toast.error('Failed to load instrument');
+    }
+  };
+
   const formatCurrency = (amount, currency = 'USD') => {
     if (!amount) return null;
     return new Intl.NumberFormat('en-US', {
@@ -69,7 +78,7 @@ export default function InstrumentsPage() {
           <Card 
             key={inst.id} 
             className="glass-card card-hover cursor-pointer"
-            onClick={() => setSelectedInstrument(inst)}
+            onClick={() => openInstrument(inst)}
             style={{ animationDelay: `${index * 100}ms` }}
             data-testid={`instrument-card-${inst.id}`}
           >
@@ -93,7 +102,7 @@ export default function InstrumentsPage() {
               )}
               
               <p className="text-slate-400 text-sm line-clamp-2 mb-4">
-                {inst.content.substring(0, 100)}...
+                {inst.preview.substring(0, 100)}...
               </p>
               
               <div className="flex items-center justify-between text-sm">
@@ -17,6 +17,9 @@ export default function TicketsPage() {
   const [loading, setLoading] = useState(true);
   const [showAddModal, setShowAddModal] = useState(false);
   const [selectedTicket, setSelectedTicket] = useState(null);
+  const [messages, setMessages] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [reply, setReply] = useState('');
   const [submitting, setSubmitting] = useState(false);
 
   const [form, setForm] = useState({
@@ -40,6 +43,42 @@ export default function TicketsPage() {
     }
   };
 
+  const fetchMessages = async (ticketId, cursor = null) => {
+    try {
+      const response = await api.get(`/tickets/${ticketId}/messages`, { params: cursor ? { cursor } : {} });
+      setMessages(prev => cursor ? [...prev, ...response.data] : response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Failed to load messages');
+    }
+  };
+
+  const openTicket = (ticket) => {
+    setSelectedTicket(ticket);
+    setMessages([]);
+    setNextCursor(null);
+    setReply('');
+    fetchMessages(ticket.id);
+    if (ticket.unread_count) {
+      setTickets(prev => prev.map(t => t.id === ticket.id ? { ...t, unread_count: 0 } : t));
+    }
+  };
+
+  const handleReply = async () => {
+    if (!reply.trim()) return;
+    setSubmitting(true);
+    try {
+      const response = await api.post(`/tickets/${selectedTicket.id}/messages`, { message: reply });
+      setMessages(prev => [...prev, response.data]);
+      setReply('');
+      fetchTickets();
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to send reply');
+    } finally {
+      setSubmitting(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setSubmitting(true);
@@ -109,7 +148,7 @@ export default function TicketsPage() {
           <Card 
             key={ticket.id} 
             className="glass-card card-hover cursor-pointer"
-            onClick={() => setSelectedTicket(ticket)}
+            onClick={() => openTicket(ticket)}
             style={{ animationDelay: `${index * 100}ms` }}
           >
             <CardContent className="pt-6">
@@ -119,11 +158,18 @@ export default function TicketsPage() {
                     <MessageSquare className="h-5 w-5 text-cyan-400" />
                   </div>
                   <div>
-                    <h3 className="text-lg font-semibold text-white">{ticket.subject}</h3>
+                    <h3 className="text-lg font-semibold text-white">
+                      {ticket.subject}
+                      {ticket.unread_count > 0 && (
+                        <span className="ml-2 text-xs bg-cyan-500 text-white rounded-full px-2 py-0.5">
+                          {ticket.unread_count}
+                        </span>
+                      )}
+                    </h3>
                     <p className="text-slate-400 text-sm mt-1 line-clamp-2">{ticket.message}</p>
                     <div className="flex items-center gap-4 mt-3">
                       <span className="text-slate-500 text-sm">
-                        {new Date(ticket.created_at).toLocaleDateString()}
+                        {new Date(ticket.last_message_at || ticket.created_at).toLocaleDateString()}
                       </span>
                       <span className="text-slate-500 text-sm capitalize">
                         {ticket.category}
@@ -267,29 +313,59 @@ export default function TicketsPage() {
                     <p className="text-slate-300 whitespace-pre-wrap">{selectedTicket.message}</p>
                   </div>
 
-                  {selectedTicket.responses && selectedTicket.responses.map((response, i) => (
+                  {messages.map((response) => (
                     <div 
-                      key={i} 
+                      key={response.id} 
                       className={`rounded-lg p-4 border ${
-                        response.from === 'admin' 
+                        response.sender === 'admin' 
                           ? 'bg-cyan-500/10 border-cyan-500/20' 
                           : 'bg-navy-950/50 border-white/5'
                       }`}
                     >
                       <div className="flex items-center justify-between mb-2">
                         <span className="text-sm font-medium text-white">
-                          {response.from === 'admin' ? 'Support Team' : 'You'}
+                          {response.sender === 'admin' ? 'Support Team' : 'You'}
                         </span>
                         <span className="text-xs text-slate-500">
                           {new Date(response.created_at).toLocaleString()}
                         </span>
                       </div>
-                      <p className="text-slate-300">{response.message}</p>
+                      <p className="text-slate-300 whitespace-pre-wrap">{response.message}</p>
                     </div>
                   ))}
+
+                  {nextCursor && (
+                    <Button
+                      variant="ghost"
+                      className="w-full text-slate-400 hover:text-white"
+                      onClick={() => fetchMessages(selectedTicket.id, nextCursor)}
+                    >
+                      Load more
+                    </Button>
+                  )}
                 </div>
               </ScrollArea>
 
+              {selectedTicket.status !== 'closed' && (
+                <div className="mt-4 space-y-2">
+                  <Textarea
+                    placeholder="Write a reply..."
+                    value={reply}
+                    onChange={(e) => setReply(e.target.value)}
+                    className="bg-navy-950/50 border-white/10 text-white min-h-[80px]"
+                    data-testid="ticket-reply-input"
+                  />
+                  <Button
+                    onClick={handleReply}
+                    disabled={submitting || !reply.trim()}
+                    className="w-full bg-cyan-500 hover:bg-cyan-600"
+                    data-testid="ticket-reply-btn"
+                  >
+                    {submitting ? <Loader2 className="h-4 w-4 animate-spin" /> : 'Send Reply'}
+                  </Button>
+                </div>
+              )}
+
               <div className="mt-6">
                 <Button
                   variant="outline"
@@ -171,6 +171,9 @@ export default function AdminDashboard() {
                     </p>
                   ))}
                 </div>
+                {stats?.balances_as_of && (
+                  <p className="text-purple-300/60 text-xs mt-1">As of {formatDate(stats.balances_as_of)}</p>
+                )}
               </div>
               <div className="w-11 h-11 bg-purple-500/20 rounded-xl flex items-center justify-center">
                 <DollarSign className="h-5 w-5 text-purple-400" />
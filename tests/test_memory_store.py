@@ -0,0 +1,266 @@
+"""Memory engine semantics for the query, update and aggregation operators server.py uses"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from memory_store import MemoryClient, apply_update, matches, project  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def collection(name="items"):
+    return MemoryClient()["test"][name]
+
+
+# ==================== MATCH ====================
+
+def test_match_comparison_operators():
+    doc = {"amount": 50, "status": "completed", "created_at": "2026-03-04T10:00:00"}
+    assert matches(doc, {"amount": {"$gte": 50, "$lt": 100}})
+    assert not matches(doc, {"amount": {"$gt": 50}})
+    assert matches(doc, {"amount": {"$lte": 50}})
+    assert matches(doc, {"created_at": {"$gte": "2026-03", "$lt": "2026-04"}})
+    assert matches(doc, {"status": {"$in": ["pending", "completed"]}})
+    assert not matches(doc, {"status": {"$nin": ["rejected", "completed"]}})
+    assert matches(doc, {"status": {"$ne": "rejected"}})
+
+
+def test_match_missing_fields():
+    doc = {"status": "active"}
+    assert matches(doc, {"is_redacted": {"$ne": True}})
+    assert matches(doc, {"lease_until": None})
+    assert matches(doc, {"lease_until": {"$exists": False}})
+    assert not matches(doc, {"status": {"$exists": False}})
+
+
+def test_match_logical_and_regex():
+    doc = {"email": "Client@Example.com", "role": "client", "tags": ["vip", "eu"]}
+    assert matches(doc, {"$or": [{"role": "admin"}, {"email": {"$regex": "example", "$options": "i"}}]})
+    assert not matches(doc, {"$and": [{"role": "client"}, {"email": {"$regex": "^client"}}]})
+    assert matches(doc, {"tags": "vip"})
+    assert matches(doc, {"tags": {"$in": ["eu"]}})
+
+
+def test_match_dotted_paths():
+    doc = {"by_type": {"transfer": {"count": 2}}, "legs": [{"account": "a"}, {"account": "b"}]}
+    assert matches(doc, {"by_type.transfer.count": 2})
+    assert matches(doc, {"legs.account": "b"})
+
+
+# ==================== UPDATE ====================
+
+def test_update_operators():
+    doc = {"_id": 1, "balance": 10, "history": [1, 2], "temp": True}
+    apply_update(doc, {
+        "$set": {"status": "frozen", "meta.reason": "kyc"},
+        "$inc": {"balance": -3, "count": 1},
+        "$unset": {"temp": ""},
+        "$push": {"history": 3}
+    })
+    assert doc == {"_id": 1, "balance": 7, "count": 1, "history": [1, 2, 3], "status": "frozen", "meta": {"reason": "kyc"}}
+
+
+def test_push_slice_and_pull_in():
+    doc = {"events": [[1.0, 10, False], [2.0, 20, True]]}
+    apply_update(doc, {"$push": {"events": {"$each": [[3.0, 5, False], [4.0, 7, False]], "$slice": -3}}})
+    assert doc["events"] == [[2.0, 20, True], [3.0, 5, False], [4.0, 7, False]]
+    apply_update(doc, {"$pull": {"events": {"$in": [[3.0, 5, False]]}}})
+    assert doc["events"] == [[2.0, 20, True], [4.0, 7, False]]
+
+
+def test_set_on_insert_only_applies_on_upsert():
+    items = collection()
+
+    async def scenario():
+        update = {"$inc": {"count": 1}, "$setOnInsert": {"scope": "account"}}
+        await items.update_one({"_id": "a"}, update, upsert=True)
+        await items.update_one({"_id": "a"}, {"$inc": {"count": 1}, "$setOnInsert": {"scope": "changed"}}, upsert=True)
+        return await items.find_one({"_id": "a"})
+
+    assert run(scenario()) == {"_id": "a", "count": 2, "scope": "account"}
+
+
+def test_upsert_seeds_equality_fields():
+    items = collection()
+
+    async def scenario():
+        result = await items.update_one({"name": "lease", "lease_until": None}, {"$set": {"owner": "w1"}}, upsert=True)
+        return result, await items.find_one({"name": "lease"})
+
+    result, doc = run(scenario())
+    assert result.upserted_id == doc["_id"]
+    assert doc["owner"] == "w1" and doc["lease_until"] is None
+
+
+# ==================== PROJECTION ====================
+
+def test_projection_inclusion_and_exclusion():
+    doc = {"_id": 1, "name": "x", "secret": "s", "nested": {"a": 1, "b": 2}}
+    assert project(doc, {"name": 1, "nested.a": 1}) == {"_id": 1, "name": "x", "nested": {"a": 1}}
+    assert project(doc, {"_id": 0, "name": 1}) == {"name": "x"}
+    assert project(doc, {"secret": 0, "nested": 0}) == {"_id": 1, "name": "x"}
+    assert project(doc, ["name"]) == {"_id": 1, "name": "x"}
+
+
+def test_projection_computes_id():
+    doc = {"_id": {"key": "acc1", "period": "2026-03"}, "count": 4}
+    projected = project(doc, {"_id": {"$concat": ["account", ":", "$_id.key", ":", "$_id.period"]}, "count": 1})
+    assert projected == {"_id": "account:acc1:2026-03", "count": 4}
+    assert project(doc, {"_id": "$_id.period"}) == {"_id": "2026-03"}
+
+
+# ==================== INDEXES ====================
+
+def test_unique_index_rejects_duplicates():
+    items = collection()
+
+    async def scenario():
+        await items.create_index([("scheduled_transfer_id", 1), ("scheduled_for", 1)], unique=True)
+        await items.insert_one({"scheduled_transfer_id": "s1", "scheduled_for": "2026-03-01"})
+        await items.insert_one({"scheduled_transfer_id": "s1", "scheduled_for": "2026-04-01"})
+        with pytest.raises(DuplicateKeyError):
+            await items.insert_one({"scheduled_transfer_id": "s1", "scheduled_for": "2026-03-01"})
+        return await items.count_documents({})
+
+    assert run(scenario()) == 2
+
+
+def test_partial_unique_index_and_unordered_insert_many():
+    items = collection("ledger")
+
+    async def scenario():
+        await items.create_index(
+            [("posting_id", 1), ("leg", 1)], unique=True, partialFilterExpression={"leg": {"$exists": True}}
+        )
+        await items.insert_many([{"posting_id": "p"}, {"posting_id": "p"}])
+        with pytest.raises(BulkWriteError) as raised:
+            await items.insert_many([
+                {"posting_id": "h", "leg": 0}, {"posting_id": "h", "leg": 0}, {"posting_id": "h", "leg": 1}
+            ], ordered=False)
+        return raised.value.details, await items.count_documents({"posting_id": "h"})
+
+    details, count = run(scenario())
+    assert [e["code"] for e in details["writeErrors"]] == [11000]
+    assert count == 2
+
+
+def test_ttl_index_follows_updated_values():
+    items = collection("idempotency_keys")
+    now = datetime.now(timezone.utc)
+
+    async def scenario():
+        await items.create_index("created_at", expireAfterSeconds=60)
+        await items.insert_many([
+            {"_id": "old", "created_at": now - timedelta(seconds=120)},
+            {"_id": "renewed", "created_at": now - timedelta(seconds=30)},
+            {"_id": "fresh", "created_at": now},
+            {"_id": "untimed", "created_at": "2020-01-01"}
+        ])
+        await items.update_one({"_id": "renewed"}, {"$set": {"created_at": now}})
+        await items.update_one({"_id": "fresh"}, {"$set": {"created_at": now - timedelta(seconds=120)}})
+        return sorted(doc["_id"] for doc in await items.find({}).to_list(None))
+
+    assert run(scenario()) == ["renewed", "untimed"]
+
+
+def test_index_lookup_matches_scan():
+    items = collection()
+
+    async def scenario():
+        await items.insert_many([{"account_id": f"a{i % 3}", "n": i} for i in range(9)])
+        before = await items.find({"account_id": {"$in": ["a1", "a2"]}, "n": {"$gte": 4}}).to_list(None)
+        await items.create_index("account_id")
+        after = await items.find({"account_id": {"$in": ["a1", "a2"]}, "n": {"$gte": 4}}).to_list(None)
+        return before, after
+
+    before, after = run(scenario())
+    assert before == after
+    assert [d["n"] for d in after] == [4, 5, 7, 8]
+
+
+# ==================== AGGREGATION ====================
+
+def rollup_pipeline(match):
+    """Same stages as server.rollup_pipeline for the account/month rollup"""
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"key": "$account_id", "period": {"$substrCP": ["$created_at", 0, 7]}, "type": "$transaction_type"},
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"},
+            "inflow": {"$sum": {"$max": ["$amount", 0]}},
+            "outflow": {"$sum": {"$max": [{"$multiply": ["$amount", -1]}, 0]}}
+        }},
+        {"$group": {
+            "_id": {"key": "$_id.key", "period": "$_id.period"},
+            "count": {"$sum": "$count"},
+            "inflow": {"$sum": "$inflow"},
+            "outflow": {"$sum": "$outflow"},
+            "by_type": {"$push": {"k": "$_id.type", "v": {"count": "$count", "amount": "$amount"}}}
+        }},
+        {"$project": {
+            "_id": {"$concat": ["account", ":", "$_id.key", ":", "$_id.period"]},
+            "period": "$_id.period",
+            "count": 1,
+            "inflow": 1,
+            "outflow": 1,
+            "by_type": {"$arrayToObject": "$by_type"}
+        }},
+        {"$merge": {"into": "rollups", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+
+def test_rollup_pipeline_merges_on_computed_id():
+    database = MemoryClient()["test"]
+    transactions = [
+        {"account_id": "a1", "created_at": "2026-03-01T09:00:00", "transaction_type": "deposit", "amount": 100, "status": "completed"},
+        {"account_id": "a1", "created_at": "2026-03-02T09:00:00", "transaction_type": "transfer", "amount": -40, "status": "completed"},
+        {"account_id": "a1", "created_at": "2026-03-03T09:00:00", "transaction_type": "transfer", "amount": -5, "status": "rejected"},
+    ]
+
+    async def scenario():
+        await database.transactions.insert_many(transactions)
+        match = {"status": {"$nin": ["rejected"]}}
+        await database.transactions.aggregate(rollup_pipeline(match)).to_list(None)
+        # An incremental upsert keyed like update_rollups must land on the same document
+        await database.rollups.bulk_write([
+            UpdateOne({"_id": "account:a1:2026-03"}, {"$inc": {"count": 1, "inflow": 10}}, upsert=True)
+        ])
+        # Rebuilding replaces it rather than adding a second month document
+        await database.transactions.aggregate(rollup_pipeline(match)).to_list(None)
+        return await database.rollups.find({}).to_list(None)
+
+    rollups = run(scenario())
+    assert rollups == [{
+        "_id": "account:a1:2026-03",
+        "period": "2026-03",
+        "count": 2,
+        "inflow": 100,
+        "outflow": 40,
+        "by_type": {"deposit": {"count": 1, "amount": 100}, "transfer": {"count": 1, "amount": -40}}
+    }]
+
+
+def test_group_count_and_sort():
+    items = collection()
+
+    async def scenario():
+        await items.insert_many([{"currency": c, "balance": b} for c, b in (("USD", 5), ("EUR", 2), ("USD", 7))])
+        return await items.aggregate([
+            {"$match": {"balance": {"$gt": 1}}},
+            {"$group": {"_id": "$currency", "total": {"$sum": "$balance"}, "accounts": {"$sum": 1}}},
+            {"$sort": {"total": -1}}
+        ]).to_list(None), await items.aggregate([{"$match": {"currency": "USD"}}, {"$count": "n"}]).to_list(None)
+
+    grouped, counted = run(scenario())
+    assert grouped == [{"_id": "USD", "total": 12, "accounts": 2}, {"_id": "EUR", "total": 2, "accounts": 1}]
+    assert counted == [{"n": 2}]
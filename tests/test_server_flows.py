@@ -0,0 +1,244 @@
+"""Money-movement flows in server.py, run against the in-memory storage engine"""
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ["STORAGE_ENGINE"] = "memory"
+os.environ["TRACING_ENABLED"] = "false"
+os.environ.setdefault("DB_NAME", "test")
+
+import server  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def fresh_bank(tmp_path, monkeypatch):
+    """Every test gets its own database and empty per-worker caches"""
+    monkeypatch.setattr(server, "db", server.client[f"test_{uuid.uuid4().hex}"])
+    monkeypatch.setattr(server, "velocity_engine", server.VelocityEngine(server.DEFAULT_VELOCITY_RULES))
+    monkeypatch.setattr(server, "SETTLEMENT_DIR", tmp_path / "settlements")
+    monkeypatch.setattr(server, "AUDIT_ARCHIVE_DIR", tmp_path / "audit_archive")
+    server.indexed_audit_partitions.clear()
+    server.audit_partition_cache.update(names=set(), legacy=False, month=None)
+    server.account_owners.clear()
+    server.idempotency_cache.clear()
+
+
+async def seeded():
+    """Seed the demo data; returns (admin, client, client accounts)"""
+    await server.create_indexes()
+    await server.seed_data()
+    admin = await server.db.users.find_one({"email": "admin@prominencebank.com"}, {"_id": 0})
+    client = await server.db.users.find_one({"email": "client@example.com"}, {"_id": 0})
+    accounts = await server.db.accounts.find({"user_id": client["id"]}, {"_id": 0}).to_list(None)
+    return admin, client, accounts
+
+
+# ==================== TRANSFER STATUS ====================
+
+def test_failed_settlement_releases_wires_for_regeneration(monkeypatch):
+    async def scenario():
+        admin, _, _ = await seeded()
+        wire = await server.db.transactions.find_one({"transaction_type": "wire_out", "status": "pending"}, {"_id": 0})
+        await server.admin_update_transfer(wire["id"], server.AdminTransferUpdate(status="approved"), admin=admin)
+
+        def disk_full(rows):
+            raise OSError("disk full")
+
+        with monkeypatch.context() as patched:
+            patched.setattr(server, "settlement_csv_text", disk_full)
+            tasks = BackgroundTasks()
+            batch = await server.admin_create_settlement_batch(
+                server.SettlementBatchCreate(currency=wire["currency"], file_format="csv"), tasks, admin=admin
+            )
+            await tasks()
+        failed = await server.db.settlement_batches.find_one({"id": batch["id"]}, {"_id": 0})
+        released = await server.db.transactions.find_one({"id": wire["id"]}, {"_id": 0})
+
+        tasks = BackgroundTasks()
+        await server.admin_regenerate_settlement_batch(batch["id"], tasks, admin=admin)
+        await tasks()
+        regenerated = await server.db.settlement_batches.find_one({"id": batch["id"]}, {"_id": 0})
+        claimed = await server.db.transactions.count_documents({"settlement_batch_id": batch["id"]})
+        return failed, released, regenerated, claimed
+
+    failed, released, regenerated, claimed = run(scenario())
+    assert failed["status"] == "failed"
+    assert released.get("settlement_batch_id") is None
+    assert regenerated["status"] == "generated"
+    assert claimed == 1
+
+
+def test_illegal_transfer_transitions_are_rejected():
+    async def scenario():
+        admin, _, _ = await seeded()
+        wire = await server.db.transactions.find_one({"transaction_type": "wire_out", "status": "pending"}, {"_id": 0})
+        await server.admin_update_transfer(wire["id"], server.AdminTransferUpdate(status="completed"), admin=admin)
+        settled = await server.get_account_balances(wire["account_id"])
+        codes = {}
+        for status in ("approved", "pending", "rejected", "bogus"):
+            with pytest.raises(HTTPException) as raised:
+                await server.admin_update_transfer(wire["id"], server.AdminTransferUpdate(status=status), admin=admin)
+            codes[status] = raised.value.status_code
+        return codes, settled, await server.get_account_balances(wire["account_id"])
+
+    codes, settled, after = run(scenario())
+    assert codes == {"approved": 409, "pending": 409, "rejected": 409, "bogus": 400}
+    assert after == settled
+
+
+# ==================== SCHEDULED TRANSFERS ====================
+
+def test_cancel_during_leased_run_neither_pays_nor_is_undone():
+    async def scenario():
+        _, client, accounts = await seeded()
+        past = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat()
+        order = await server.create_scheduled_transfer(server.ScheduledTransferCreate(
+            from_account_id=accounts[0]["id"], to_account_id=accounts[1]["id"], amount=7,
+            currency=accounts[0]["currency"], frequency="daily", start_at=past
+        ), user=client)
+        claimed = await server.claim_due_transfers(datetime.now(timezone.utc))
+        with pytest.raises(HTTPException) as raised:
+            await server.cancel_scheduled_transfer(order.id, user=client)
+
+        # Once the lease lapses the cancel wins, and the stalled run must not pay afterwards
+        await server.db.scheduled_transfers.update_one({"id": order.id}, {"$set": {"lease_until": past}})
+        await server.cancel_scheduled_transfer(order.id, user=client)
+        run_record = await server.execute_scheduled_transfer(claimed[0], {client["id"]: client})
+        paid = await server.db.transactions.count_documents({"description": "Scheduled transfer"})
+        return raised.value.status_code, run_record, paid, await server.db.scheduled_transfers.find_one({"id": order.id})
+
+    status_code, run_record, paid, order = run(scenario())
+    assert status_code == 409
+    assert run_record["status"] == "failed"
+    assert paid == 0
+    assert order["status"] == "cancelled"
+
+
+# ==================== HOLDS ====================
+
+def test_hold_is_inserted_before_its_ledger_posting(monkeypatch):
+    seen = []
+    post_ledger = server.post_ledger
+
+    async def recording_post_ledger(entries, reference, description, posting_id=None):
+        seen.append(await server.db.holds.find_one({"reference": reference}, {"_id": 0}))
+        return await post_ledger(entries, reference, description, posting_id)
+
+    async def scenario():
+        admin, _, accounts = await seeded()
+        monkeypatch.setattr(server, "post_ledger", recording_post_ledger)
+        hold = await server.admin_place_hold(
+            accounts[0]["id"], server.HoldCreate(kind="hold", amount=100, reason="review"), admin=admin
+        )
+        return hold, await server.get_account_balances(accounts[0]["id"])
+
+    hold, balances = run(scenario())
+    assert [h and h["status"] for h in seen] == ["placing"]
+    assert hold.status == "active"
+    assert balances["held_balance"] == 100
+
+
+# ==================== AUDIT PATCHES ====================
+
+def test_diff_and_revert_round_trip():
+    before = {"status": "active", "limits": {"daily": 100, "a/b": 1}, "tags": ["x"], "note~": "old"}
+    after = {"status": "frozen", "limits": {"daily": 50, "monthly": 900}, "tags": ["x", "y"], "reason": "kyc"}
+    patch = server.diff_documents(before, after)
+    assert server.revert_patch(after, patch) == before
+    assert server.revert_patch(before, server.diff_documents(before, before)) == before
+    assert {op["path"] for op in patch} >= {"/limits/a~1b", "/note~0"}
+
+
+# ==================== VELOCITY ====================
+
+def test_velocity_windows_count_and_forget_events():
+    rules = [{
+        "name": "account_count", "scope": "account", "metric": "count", "window_seconds": 60,
+        "transfer_types": ["internal"], "review_at": 1, "deny_at": 2
+    }]
+    engine = server.VelocityEngine(rules)
+    now = server.time.time()
+    engine.record("a1", "u1", 10, False, ts=now - 120)
+    assert engine.check("a1", "u1", 10, False, "internal") == ("allow", [])
+    first = engine.record("a1", "u1", 10, False)
+    engine.record("a1", "u1", 10, False)
+    assert engine.check("a1", "u1", 10, False, "internal") == ("deny", ["account_count"])
+    assert engine.check("a1", "u1", 10, False, "external") == ("allow", [])
+
+    engine.forget("a1", "u1", first)
+    assert engine.check("a1", "u1", 10, False, "internal") == ("review", ["account_count"])
+    assert first not in engine.pending["account:a1"]
+    # Only the event that fell out of the retention period is dropped
+    engine.expire(now - 120 + engine.retention + 1)
+    assert len(engine.windows["account:a1"]) == 1
+
+
+def test_failed_transfer_is_uncounted(monkeypatch):
+    async def broken_insert(*args, **kwargs):
+        raise RuntimeError("db down")
+
+    async def scenario():
+        _, client, accounts = await seeded()
+        transfer = server.InternalTransfer(
+            from_account_id=accounts[0]["id"], to_account_id=accounts[1]["id"], amount=1, currency=accounts[0]["currency"]
+        )
+        with monkeypatch.context() as patched:
+            patched.setattr(server.db.transactions, "insert_many", broken_insert)
+            with pytest.raises(RuntimeError):
+                await server.execute_internal_transfer(transfer, client)
+        return server.velocity_engine.windows.get(f"account:{accounts[0]['id']}", ())
+
+    assert len(run(scenario())) == 0
+
+
+# ==================== IDEMPOTENCY ====================
+
+def test_idempotency_lease_is_renewed_so_a_slow_request_runs_once(monkeypatch):
+    monkeypatch.setattr(server, "IDEMPOTENCY_LEASE_SECONDS", 0.3)
+    calls = []
+
+    async def slow_handler(posting_id):
+        calls.append(posting_id)
+        await asyncio.sleep(1)
+        return {"calls": len(calls)}
+
+    async def scenario():
+        async def retry():
+            # Arrives after the initial lease would have lapsed without the heartbeat
+            await asyncio.sleep(0.6)
+            return await server.execute_idempotent("key", "hash", slow_handler, Response())
+        return await asyncio.gather(server.execute_idempotent("key", "hash", slow_handler, Response()), retry())
+
+    assert run(scenario()) == [{"calls": 1}, {"calls": 1}]
+    assert len(calls) == 1
+
+
+def test_transfer_rerun_under_the_same_key_does_not_post_twice():
+    async def scenario():
+        _, client, accounts = await seeded()
+        transfer = server.InternalTransfer(
+            from_account_id=accounts[0]["id"], to_account_id=accounts[1]["id"], amount=5, currency=accounts[0]["currency"]
+        )
+        posting_id = server.idempotency_posting_id(f"{client['id']}:transfers/internal:abc")
+        before = await server.get_account_balances(accounts[0]["id"])
+        await server.execute_internal_transfer(transfer, client, posting_id)
+        # A second worker that took the key over re-runs the handler
+        with pytest.raises(HTTPException) as raised:
+            await server.execute_internal_transfer(transfer, client, posting_id)
+        after = await server.get_account_balances(accounts[0]["id"])
+        return raised.value.status_code, before["available_balance"] - after["available_balance"]
+
+    status_code, debited = run(scenario())
+    assert status_code == 409
+    assert debited == 5